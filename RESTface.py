@@ -1,45 +1,198 @@
+import asyncio
+import codecs
 import re
+import shutil
+import tempfile
+from collections.abc import AsyncIterator, Iterable, Iterator
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+from functools import lru_cache
+from itertools import islice
 from urllib import parse
 
 from fastapi import UploadFile, HTTPException
-from inflect import engine as get_engine
 
+from jobs import Job, JobRunner
 from openapi import get_schema
 from storage.DbStorage import DbStorage
-from utils import get_storage, parse_param, parse_id
+from storage.query import freeze, get_projector, project, sort_groups
+from utils import (
+    decode_cursor,
+    encode_cursor,
+    get_async_storage,
+    get_storage,
+    normalize_query,
+    parse_id,
+    parse_ids,
+    parse_param,
+    read_csv_batches,
+    singular,
+)
+
+
+def split_fields(value) -> list[str]:
+    fields = re.split(", ?", str(value).strip("({[]})"))
+    return [field for field in fields if field]
+
+
+async def iterate(items: Iterable[dict]) -> AsyncIterator[dict]:
+    for item in items:
+        yield item
+
+
+async def prepend(first: dict | None, items: AsyncIterator[dict]):
+    if first is not None:
+        yield first
+    async for item in items:
+        yield item
+
+
+async def project_stream(
+    items: AsyncIterator[dict], fields: list[str]
+) -> AsyncIterator[dict]:
+    projector = get_projector(fields)
+    async for item in items:
+        yield projector(item)
+
+
+def cursor_mismatch() -> HTTPException:
+    # Storages compare the cursor with the stored values, a crafted cursor may
+    # hold values of another type than the order_by fields
+    return HTTPException(400, "Cursor does not match order_by")
+
+
+class KnownParents:
+    # Parent items known to exist with their links to their own parents, so
+    # nested writes don't rewrite them. Only writes made through the same
+    # RESTface are seen, others have to be forgotten explicitly
+    def __init__(self, max_size: int = 100_000):
+        self.max_size = max_size
+        self.size = 0
+        self.collections: dict[str, dict] = {}
+
+    def get_new(self, parents: list[tuple[str, dict]]) -> list[tuple[str, dict]]:
+        return [
+            (collection_name, data)
+            for collection_name, data in parents
+            if self.collections.get(collection_name, {}).get(data["id"]) != freeze(data)
+        ]
+
+    def add(self, collection_name: str, data: dict) -> None:
+        if self.size >= self.max_size:
+            self.clear()
+        known = self.collections.setdefault(collection_name, {})
+        if data["id"] not in known:
+            self.size += 1
+        known[data["id"]] = freeze(data)
+
+    def forget(self, collection_name: str, item_ids: Iterable | None = None) -> None:
+        # Without ids the whole collection is forgotten
+        if item_ids is None:
+            self.size -= len(self.collections.pop(collection_name, {}))
+            return
+        known = self.collections.get(collection_name, {})
+        for item_id in item_ids:
+            if known.pop(item_id, None) is not None:
+                self.size -= 1
+
+    def clear(self) -> None:
+        self.collections.clear()
+        self.size = 0
 
 
 class RESTface:
+    get_storage = staticmethod(get_storage)
+    upload_batch_size = 1000
+    # Parents whose children are read with one query per embedded collection
+    embed_batch_size = 1000
+    aggregate_functions = ("sum", "avg", "min", "max")
+
     def __init__(
         self,
         storage_type: str = "memory",
         storage_path: str | None = None,
         uuid_id: bool = False,
+        storage_options: dict | None = None,
     ):
-        self.storage = get_storage(storage_type, storage_path, uuid_id)
-        self.engine = get_engine()
+        self.storage = self.get_storage(
+            storage_type, storage_path, uuid_id, **(storage_options or {})
+        )
+        self.parse_query = lru_cache(maxsize=1024)(self._parse_query)
+        self.resolve_path = lru_cache(maxsize=4096)(self._resolve_path)
+        self.known_parents = KnownParents()
 
     def reset(self):
+        self.known_parents.clear()
         self.storage.reset()
 
+    def close(self):
+        if hasattr(self.storage, "close"):
+            self.storage.close()
+
     def all(self):
         return self.storage.all()
 
+    def stream_all(self) -> Iterator[tuple[str, Iterable[dict]]]:
+        return self.storage.iter_all()
+
     def openapi(self):
         if not isinstance(self.storage, DbStorage):
             raise NotImplementedError
-        return get_schema(self.storage.db, self.engine)
+        return get_schema(self.storage.db)
 
-    def upload(self, file: UploadFile):
+    def get_upload_batches(
+        self, file: UploadFile, infer_types: bool = False
+    ) -> tuple[str, Iterator[list[dict]]]:
         if not file.filename:
-            raise
+            raise ValueError("File has to have a name")
         table_name = file.filename.split(".")[0]
-        keys = file.file.readline().decode("utf-8").strip().split(",")
-        for item in file.file:
-            values = item.decode("utf-8").strip().split(",")
-            self.post(table_name, dict(zip(keys, values)))
+        lines = codecs.iterdecode(file.file, "utf-8-sig")
+        return table_name, read_csv_batches(lines, self.upload_batch_size, infer_types)
+
+    def upload(
+        self, file: UploadFile, infer_types: bool = False, job: Job | None = None
+    ) -> int:
+        table_name, batches = self.get_upload_batches(file, infer_types)
+        self.known_parents.forget(table_name)
+        count = 0
+        with ThreadPoolExecutor(1) as reader:
+            # The next batch is parsed while the current one is being written
+            next_batch = reader.submit(next, batches, None)
+            while batch := next_batch.result():
+                next_batch = reader.submit(next, batches, None)
+                try:
+                    self.storage.bulk_upsert(table_name, batch, "POST")
+                except Exception as e:
+                    # Within a job failed batches are reported and skipped
+                    if job is None:
+                        raise
+                    job.record_error(count, e)
+                else:
+                    if job is not None:
+                        job.advance(len(batch))
+                count += len(batch)
+        return count
 
     def create_subhierarchy(self, parts) -> dict:
+        parents, parent_info = self.get_subhierarchy(parts)
+        self.create_parents(parents)
+        return parent_info
+
+    def create_parents(self, parents: list[tuple[str, dict]]) -> None:
+        # Parents are only written when they are new or their links changed
+        for collection_name, data in self.known_parents.get_new(parents):
+            self.storage.upsert(collection_name, data, "POST")
+            self.known_parents.add(collection_name, data)
+
+    def forget_written(self, collection_name: str, body: dict | list) -> None:
+        # Written items may have lost their parent links
+        items = body if isinstance(body, list) else [body]
+        item_ids = [item["id"] for item in items if "id" in item]
+        self.known_parents.forget(collection_name, item_ids)
+
+    def get_subhierarchy(self, parts) -> tuple[list[tuple[str, dict]], dict]:
+        # Parent items implied by the path, outermost first
+        parents: list[tuple[str, dict]] = []
         parent_info: dict[str, int | str] = {}
         for i, part in enumerate(parts):
             item_id = parse_id(part)
@@ -49,12 +202,36 @@ class RESTface:
                     raise Exception("Invalid path")
                 data = {"id": item_id, **parent_info}
                 if i != len(parts) - 1:
-                    self.storage.upsert(collection_name, data, "POST")
-                    parent_name = (
-                        self.engine.singular_noun(parts[i - 1]) or parts[i - 1]
-                    )
-                    parent_info = {parent_name + "_id": item_id}
-        return parent_info
+                    parents.append((collection_name, data))
+                    parent_info = {singular(parts[i - 1]) + "_id": item_id}
+        return parents, parent_info
+
+    def parse_url(self, url) -> tuple[list[str], int | str | None]:
+        url_parts, item_id, _, _ = self.resolve_path(parse.urlsplit(url).path)
+        return list(url_parts), item_id
+
+    def _resolve_path(self, path: str) -> tuple:
+        # Keyed by the whole path, the ids are part of what gets resolved
+        url_parts = re.sub(r"^\d+", "", path).strip("/").split("/")
+        item_ids = [parse_id(part) for part in url_parts]
+        # Only writes need the parents, reads of paths with two ids in a row
+        # just find nothing
+        if any(item_id and item_ids[i - 1] for i, item_id in enumerate(item_ids)):
+            parents, parent_info = None, {}
+        else:
+            parents, parent_info = self.get_subhierarchy(url_parts)
+        return tuple(url_parts), item_ids[-1], parents, parent_info
+
+    def get_route(self, url) -> tuple:
+        # Copies of the cached route, the parents end up in the storages
+        url_parts, item_id, parents, parent_info = self.resolve_path(
+            parse.urlsplit(url).path
+        )
+        if parents is None:
+            # Raises the invalid path error
+            self.get_subhierarchy(url_parts)
+        parents = [(collection_name, dict(data)) for collection_name, data in parents]
+        return list(url_parts), item_id, parents, dict(parent_info)
 
     def get_params(self, url) -> dict:
         query = parse.urlsplit(url).query
@@ -68,7 +245,7 @@ class RESTface:
     def get_where_params(self, url_parts, params):
         # Filter by parent_id
         if len(url_parts) > 2:
-            parent_id_name = self.engine.singular_noun(url_parts[-3]) + "_id"
+            parent_id_name = singular(url_parts[-3]) + "_id"
             parent_id = url_parts[-2]
             parent_id = parse_id(parent_id)
             params[parent_id_name] = parent_id
@@ -86,51 +263,278 @@ class RESTface:
             where_params += [[op_name, param_name, param_value]]
         return where_params
 
-    def upsert(self, url, body, method):
-        path = parse.urlsplit(url).path
-        url_parts = re.sub(r"^\d+", "", path).strip("/").split("/")
-        item_id = parse_id(url_parts[-1])
-        collection_name = str(url_parts[-2 if item_id else -1])
+    def get_query(self, url_parts: list[str], query: str) -> tuple[list, dict]:
+        # Only the last three parts matter for the parent filter
+        where_params, meta_params = self.parse_query(
+            tuple(url_parts[-3:]), normalize_query(query)
+        )
+        # Storages may modify these, so hand out copies of the cached plan
+        return [list(param) for param in where_params], dict(meta_params)
+
+    def _parse_query(self, url_parts: tuple[str, ...], query: str):
+        params = parse.parse_qs(query, keep_blank_values=True)
+        params = {
+            param_name: parse_param(param_value[0])
+            for param_name, param_value in params.items()
+        }
+        # Blank order_by (?order_by=) skips sorting and streams storage order
+        order_by = split_fields(params.pop("order_by", "id"))
+        meta_params = {
+            "order_by": order_by,
+            "desc": ("desc" in params),
+            "_limit": params.pop("limit", 0),
+            "_offset": params.pop("offset", 0),
+            "_after": None,
+        }
+        if "after" in params:
+            try:
+                after = decode_cursor(str(params.pop("after")))
+            except ValueError:
+                raise HTTPException(400, "Invalid cursor")
+            if not isinstance(after, list) or len(after) != len(order_by) + 1:
+                raise HTTPException(400, "Cursor does not match order_by")
+            if any(isinstance(value, (list, dict)) for value in after):
+                raise HTTPException(400, "Invalid cursor")
+            meta_params["_after"] = after
+        params.pop("desc", None)
+        if "fields" in params:
+            meta_params["_fields"] = self.get_fields(params.pop("fields"), order_by)
+        if "embed" in params:
+            meta_params["_embed"] = split_fields(params.pop("embed"))
+        # ?count, ?sum=price,... and ?group_by=... aggregate the matching items
+        aggregates = [("count", None)] if "count" in params else []
+        params.pop("count", None)
+        for function in self.aggregate_functions:
+            if function in params:
+                fields = split_fields(params.pop(function))
+                aggregates += [(function, field) for field in fields]
+        group_by = split_fields(params.pop("group_by", ""))
+        if aggregates or group_by:
+            meta_params["_aggregates"] = aggregates or [("count", None)]
+            meta_params["_group_by"] = group_by
+        where_params = self.get_where_params(list(url_parts), params)
+        return where_params, meta_params
+
+    def get_fields(self, fields, order_by: list[str] | None = None) -> list[str]:
+        # Nested fields (?fields=address.city) select their top-level field. The
+        # id and the order_by fields are always read, the cursor is built from them
+        fields = [field.split(".")[0] for field in split_fields(fields)]
+        order_by = [order_by_arg.lstrip("-") for order_by_arg in order_by or []]
+        return list(dict.fromkeys(["id", *order_by, *fields]))
+
+    def get_groups(self, rows: list[dict], meta_params: dict) -> list[dict]:
+        # Groups come back in any order, pages are taken from the sorted groups
+        rows = sort_groups(rows, meta_params["_group_by"])
+        if meta_params["desc"]:
+            rows.reverse()
+        offset, limit = meta_params["_offset"], meta_params["_limit"]
+        return rows[offset : offset + limit if limit else None]
 
-        parent_info = self.create_subhierarchy(url_parts)
+    def get_next_cursor(self, url, items) -> str | None:
+        url_parts, _ = self.parse_url(url)
+        _, meta_params = self.get_query(url_parts, parse.urlsplit(url).query)
+        limit = meta_params["_limit"]
+        if "_aggregates" in meta_params:
+            return None
+        if not isinstance(items, list) or not limit or len(items) < limit:
+            return None
+        last_item = items[-1]
+        order_by = [
+            order_by_arg.lstrip("-") for order_by_arg in meta_params["order_by"]
+        ]
+        return encode_cursor(
+            [last_item.get(field) for field in order_by] + [last_item["id"]]
+        )
+
+    def get_upsert(self, url, body) -> tuple[list[tuple[str, dict]], str, dict | list]:
+        url_parts, item_id, parents, parent_info = self.get_route(url)
+        collection_name = str(url_parts[-2 if item_id else -1])
         params = self.get_params(url)
         body = body or {}
         if isinstance(body, list):
             if parent_info or params:
                 body = [{**parent_info, **params, **item} for item in body]
-            return self.storage.bulk_upsert(collection_name, body, method)
+            # CSV uploads hand over ids as strings
+            for item in body:
+                if isinstance(item.get("id"), str):
+                    item["id"] = parse_id(item["id"])
+            return parents, collection_name, body
         elif isinstance(body, dict):
             if "id" in body:
                 body["id"] = parse_id(body["id"])
             item_id = {"id": item_id} if item_id else {}
             data = {**parent_info, **item_id, **params, **body}
-            return self.storage.upsert(collection_name, data, method)
+            return parents, collection_name, data
         else:
             raise Exception("Body has to be valid JSON")
 
+    def upsert(self, url, body, method):
+        parents, collection_name, body = self.get_upsert(url, body)
+        self.create_parents(parents)
+        self.forget_written(collection_name, body)
+        if isinstance(body, list):
+            return self.storage.bulk_upsert(collection_name, body, method)
+        return self.storage.upsert(collection_name, body, method)
+
+    def get_url_param(self, url, name: str) -> str | None:
+        params = parse.parse_qs(parse.urlsplit(url).query, keep_blank_values=True)
+        return params[name][0] if name in params else None
+
+    def get_url_fields(self, url) -> list[str] | None:
+        fields = self.get_url_param(url, "fields")
+        return None if fields is None else self.get_fields(fields)
+
+    def get_url_embeds(self, url) -> list[str]:
+        return split_fields(self.get_url_param(url, "embed") or "")
+
+    def get_embed_query(self, parent_field: str, items: list[dict]) -> tuple:
+        parent_ids = list(dict.fromkeys(item["id"] for item in items))
+        meta_params = {
+            "order_by": ["id"],
+            "desc": False,
+            "_limit": 0,
+            "_offset": 0,
+            "_after": None,
+        }
+        return [["in", parent_field, parent_ids]], meta_params
+
+    def stitch(
+        self, items: list[dict], embed: str, parent_field: str, children: list[dict]
+    ) -> list[dict]:
+        # Stored items aren't modified, children are added to copies
+        children_by_parent: dict = {}
+        for child in children:
+            children_by_parent.setdefault(child.get(parent_field), []).append(child)
+        return [
+            {**item, embed: children_by_parent.get(item["id"], [])} for item in items
+        ]
+
+    def get_parent_field(self, collection_name: str) -> str:
+        # Children point to their parent the way create_subhierarchy links them
+        return singular(collection_name) + "_id"
+
+    def embed(
+        self, collection_name: str, items: list[dict], embeds: list[str]
+    ) -> list[dict]:
+        # One <parent>_id__in query per embedded collection, instead of one per item
+        if not items:
+            return items
+        parent_field = self.get_parent_field(collection_name)
+        for embed in embeds:
+            where_params, meta_params = self.get_embed_query(parent_field, items)
+            children = self.storage.get_without_id(embed, where_params, meta_params)
+            items = self.stitch(items, embed, parent_field, children)
+        return items
+
+    def embed_stream(
+        self, collection_name: str, items: Iterable[dict], embeds: list[str]
+    ) -> Iterator[dict]:
+        iterator = iter(items)
+        while batch := list(islice(iterator, self.embed_batch_size)):
+            yield from self.embed(collection_name, batch, embeds)
+
+    def get_shown_fields(self, url) -> list[str] | None:
+        # The order_by fields are read along with ?fields= for the cursor, but
+        # only returned when they were asked for
+        fields = self.get_url_fields(url)
+        if fields is None:
+            return None
+        url_parts, _ = self.parse_url(url)
+        _, meta_params = self.get_query(url_parts, parse.urlsplit(url).query)
+        if "_aggregates" in meta_params or set(meta_params["_fields"]) <= set(fields):
+            return None
+        return fields + meta_params.get("_embed", [])
+
+    def project_item(self, url, item: dict) -> dict:
+        fields = self.get_url_fields(url)
+        return get_projector(fields)(item) if fields else item
+
+    def get_many_ids(self, url, body=None) -> tuple[str, list]:
+        # Ids of a batch read, from the path (/users/1,5,9) or the body of a
+        # POST /users/_mget, either a list or {"ids": [...]}
+        url_parts, _ = self.parse_url(url)
+        if body is None:
+            return str(url_parts[-2]), parse_ids(url_parts[-1]) or []
+        item_ids = body.get("ids") if isinstance(body, dict) else body
+        if not isinstance(item_ids, list):
+            raise HTTPException(400, "Body has to be a list of ids")
+        item_ids = [
+            parse_id(item_id) if isinstance(item_id, str) else item_id
+            for item_id in item_ids
+        ]
+        if not all(isinstance(item_id, (int, str)) for item_id in item_ids):
+            raise HTTPException(400, "Invalid id")
+        return str(url_parts[-2]), list(dict.fromkeys(item_ids))
+
+    def get_many_result(self, url, item_ids: list, items: list[dict]) -> dict:
+        # Missing ids are reported next to the items found, instead of a 404
+        found = {item["id"] for item in items}
+        return {
+            "items": list(project(items, self.get_url_fields(url))),
+            "missing": [item_id for item_id in item_ids if item_id not in found],
+        }
+
+    def get_many(self, url, body=None) -> dict:
+        collection_name, item_ids = self.get_many_ids(url, body)
+        items = self.storage.get_many(collection_name, item_ids)
+        result = self.get_many_result(url, item_ids, items)
+        embeds = self.get_url_embeds(url)
+        result["items"] = self.embed(collection_name, result["items"], embeds)
+        return result
+
     def get(self, url):
-        path = parse.urlsplit(url).path
-        url_parts = re.sub(r"^\d+", "", path).strip("/").split("/")
-        item_id = parse_id(url_parts[-1])
+        result = self.stream(url)
+        return result if isinstance(result, dict) else list(result)
+
+    def get_page(self, url) -> tuple[dict | list[dict], str | None]:
+        # The cursor is built before the order_by fields are hidden
+        result = self.read(url)
+        if isinstance(result, dict):
+            return result, None
+        items = list(result)
+        fields = self.get_shown_fields(url)
+        return list(project(items, fields)), self.get_next_cursor(url, items)
+
+    def stream(self, url) -> dict | Iterator[dict]:
+        result = self.read(url)
+        if isinstance(result, dict):
+            return result
+        return iter(project(result, self.get_shown_fields(url)))
+
+    def read(self, url) -> dict | Iterator[dict]:
+        url_parts, item_id = self.parse_url(url)
         if item_id:
-            item = self.storage.get_with_id(str(url_parts[-2]), item_id)
+            collection_name = str(url_parts[-2])
+            item = self.storage.get_with_id(collection_name, item_id)
             if not item:
                 raise HTTPException(404)
-            return item
+            item = self.project_item(url, item)
+            return self.embed(collection_name, [item], self.get_url_embeds(url))[0]
+        if len(url_parts) > 1 and parse_ids(url_parts[-1]):
+            return self.get_many(url)
 
-        params = self.get_params(url)
-        order_by = re.split(", ?", params.pop("order_by", "id").strip("({[]})"))
-        meta_params = {
-            "order_by": order_by,
-            "desc": ("desc" in params),
-            "_limit": params.pop("limit", 0),
-            "_offset": params.pop("offset", 0),
-        }
-        params.pop("desc", None)
-        where_params = self.get_where_params(url_parts, params)
-        return self.storage.get_without_id(
-            str(url_parts[-1]), where_params, meta_params
-        )
+        where_params, meta_params = self.get_query(url_parts, parse.urlsplit(url).query)
+        if "_aggregates" in meta_params:
+            rows = self.storage.aggregate(
+                str(url_parts[-1]),
+                where_params,
+                meta_params["_aggregates"],
+                meta_params["_group_by"],
+            )
+            if not meta_params["_group_by"]:
+                return rows[0]
+            return iter(self.get_groups(rows, meta_params))
+        embeds = meta_params.pop("_embed", [])
+        after = meta_params["_after"]
+        try:
+            items = self.storage.iter_without_id(
+                str(url_parts[-1]), where_params, meta_params
+            )
+        except TypeError:
+            if after is None:
+                raise
+            raise cursor_mismatch() from None
+        return self.embed_stream(str(url_parts[-1]), items, embeds) if embeds else items
 
     def post(self, url, body=None):
         return self.upsert(url, body, "POST")
@@ -139,12 +543,215 @@ class RESTface:
         return self.upsert(url, body, "PUT")
 
     def delete(self, url):
-        path = parse.urlsplit(url).path
-        url_parts = re.sub(r"^\d+", "", path).strip("/").split("/")
-        item_id = parse_id(url_parts[-1])
+        url_parts, item_id = self.parse_url(url)
         if item_id:
+            self.known_parents.forget(str(url_parts[-2]), [item_id])
             if not self.storage.delete_with_id(str(url_parts[-2]), item_id):
                 raise HTTPException(404)
         else:
+            self.known_parents.forget(str(url_parts[-1]))
             where_params = self.get_where_params(url_parts, self.get_params(url))
             self.storage.delete_without_id(str(url_parts[-1]), where_params)
+
+
+class AsyncRESTface(RESTface):
+    # Same API as RESTface, but every storage call is awaited
+    get_storage = staticmethod(get_async_storage)
+
+    def __init__(
+        self,
+        storage_type: str = "memory",
+        storage_path: str | None = None,
+        uuid_id: bool = False,
+        storage_options: dict | None = None,
+        max_imports: int = 2,
+    ):
+        super().__init__(storage_type, storage_path, uuid_id, storage_options)
+        self.jobs = JobRunner(max_imports)
+
+    async def reset(self):
+        self.known_parents.clear()
+        await self.storage.reset()
+
+    async def close(self):
+        await self.storage.close()
+
+    async def all(self):
+        return await self.storage.all()
+
+    def stream_all(self) -> AsyncIterator[tuple[str, AsyncIterator[dict]]]:
+        return self.storage.iter_all()
+
+    async def openapi(self):
+        storage = getattr(self.storage, "storage", None)
+        if not isinstance(storage, DbStorage):
+            raise NotImplementedError
+        return await self.storage.run(get_schema, storage.db)
+
+    async def upload(
+        self, file: UploadFile, infer_types: bool = False, job: Job | None = None
+    ) -> int:
+        table_name, batches = self.get_upload_batches(file, infer_types)
+        self.known_parents.forget(table_name)
+        count = 0
+        # The next batch is parsed in a thread while the current one is written
+        next_batch = asyncio.create_task(asyncio.to_thread(next, batches, None))
+        while batch := await next_batch:
+            next_batch = asyncio.create_task(asyncio.to_thread(next, batches, None))
+            try:
+                await self.storage.bulk_upsert(table_name, batch, "POST")
+            except Exception as e:
+                if job is None:
+                    raise
+                job.record_error(count, e)
+            else:
+                if job is not None:
+                    job.advance(len(batch))
+            count += len(batch)
+        return count
+
+    async def upload_in_background(
+        self, file: UploadFile, infer_types: bool = False
+    ) -> Job:
+        if not file.filename:
+            raise ValueError("File has to have a name")
+        # The upload is closed together with the request, so the job gets a copy
+        with ExitStack() as stack:
+            copy = stack.enter_context(tempfile.TemporaryFile())
+            await asyncio.to_thread(shutil.copyfileobj, file.file, copy)
+            copy.seek(0)
+            # From here on the job closes the copy
+            close_copy = stack.pop_all()
+        upload = UploadFile(copy, filename=file.filename)
+
+        async def run(job: Job):
+            with close_copy:
+                await self.upload(upload, infer_types, job)
+
+        return self.jobs.submit(file.filename, run)
+
+    async def create_subhierarchy(self, parts) -> dict:
+        parents, parent_info = self.get_subhierarchy(parts)
+        await self.create_parents(parents)
+        return parent_info
+
+    async def create_parents(self, parents: list[tuple[str, dict]]) -> None:
+        for collection_name, data in self.known_parents.get_new(parents):
+            await self.storage.upsert(collection_name, data, "POST")
+            self.known_parents.add(collection_name, data)
+
+    async def upsert(self, url, body, method):
+        parents, collection_name, body = self.get_upsert(url, body)
+        await self.create_parents(parents)
+        self.forget_written(collection_name, body)
+        if isinstance(body, list):
+            return await self.storage.bulk_upsert(collection_name, body, method)
+        return await self.storage.upsert(collection_name, body, method)
+
+    async def get_many(self, url, body=None) -> dict:
+        collection_name, item_ids = self.get_many_ids(url, body)
+        items = await self.storage.get_many(collection_name, item_ids)
+        result = self.get_many_result(url, item_ids, items)
+        embeds = self.get_url_embeds(url)
+        result["items"] = await self.embed(collection_name, result["items"], embeds)
+        return result
+
+    async def embed(
+        self, collection_name: str, items: list[dict], embeds: list[str]
+    ) -> list[dict]:
+        if not items:
+            return items
+        parent_field = self.get_parent_field(collection_name)
+        for embed in embeds:
+            where_params, meta_params = self.get_embed_query(parent_field, items)
+            children = await self.storage.get_without_id(
+                embed, where_params, meta_params
+            )
+            items = self.stitch(items, embed, parent_field, children)
+        return items
+
+    async def embed_stream(
+        self, collection_name: str, items: AsyncIterator[dict], embeds: list[str]
+    ) -> AsyncIterator[dict]:
+        batch = []
+        async for item in items:
+            batch.append(item)
+            if len(batch) == self.embed_batch_size:
+                for embedded in await self.embed(collection_name, batch, embeds):
+                    yield embedded
+                batch = []
+        for embedded in await self.embed(collection_name, batch, embeds):
+            yield embedded
+
+    async def get(self, url):
+        result = await self.stream(url)
+        return result if isinstance(result, dict) else [item async for item in result]
+
+    async def get_page(self, url) -> tuple[dict | list[dict], str | None]:
+        result = await self.read(url)
+        if isinstance(result, dict):
+            return result, None
+        items = [item async for item in result]
+        fields = self.get_shown_fields(url)
+        return list(project(items, fields)), self.get_next_cursor(url, items)
+
+    async def stream(self, url) -> dict | AsyncIterator[dict]:
+        result = await self.read(url)
+        fields = self.get_shown_fields(url)
+        if isinstance(result, dict) or not fields:
+            return result
+        return project_stream(result, fields)
+
+    async def read(self, url) -> dict | AsyncIterator[dict]:
+        url_parts, item_id = self.parse_url(url)
+        if item_id:
+            collection_name = str(url_parts[-2])
+            item = await self.storage.get_with_id(collection_name, item_id)
+            if not item:
+                raise HTTPException(404)
+            item = self.project_item(url, item)
+            embeds = self.get_url_embeds(url)
+            return (await self.embed(collection_name, [item], embeds))[0]
+        if len(url_parts) > 1 and parse_ids(url_parts[-1]):
+            return await self.get_many(url)
+
+        where_params, meta_params = self.get_query(url_parts, parse.urlsplit(url).query)
+        if "_aggregates" in meta_params:
+            rows = await self.storage.aggregate(
+                str(url_parts[-1]),
+                where_params,
+                meta_params["_aggregates"],
+                meta_params["_group_by"],
+            )
+            if not meta_params["_group_by"]:
+                return rows[0]
+            return iterate(self.get_groups(rows, meta_params))
+        embeds = meta_params.pop("_embed", [])
+        after = meta_params["_after"]
+        items = self.storage.iter_without_id(
+            str(url_parts[-1]), where_params, meta_params
+        )
+        if after is not None:
+            # The cursor is compared while seeking to the first item
+            try:
+                items = prepend(await anext(items, None), items)
+            except TypeError:
+                raise cursor_mismatch() from None
+        return self.embed_stream(str(url_parts[-1]), items, embeds) if embeds else items
+
+    async def post(self, url, body=None):
+        return await self.upsert(url, body, "POST")
+
+    async def put(self, url, body=None):
+        return await self.upsert(url, body, "PUT")
+
+    async def delete(self, url):
+        url_parts, item_id = self.parse_url(url)
+        if item_id:
+            self.known_parents.forget(str(url_parts[-2]), [item_id])
+            if not await self.storage.delete_with_id(str(url_parts[-2]), item_id):
+                raise HTTPException(404)
+        else:
+            self.known_parents.forget(str(url_parts[-1]))
+            where_params = self.get_where_params(url_parts, self.get_params(url))
+            await self.storage.delete_without_id(str(url_parts[-1]), where_params)
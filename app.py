@@ -1,12 +1,59 @@
-from RESTface import RESTface
-from utils import reformat
+from contextlib import asynccontextmanager
+from urllib.parse import urlencode
 
-from fastapi import FastAPI, Request, UploadFile
-from fastapi.responses import RedirectResponse, FileResponse
+from RESTface import AsyncRESTface
+from utils import (
+    all_from_async,
+    all_to_json_stream,
+    all_to_ndjson_stream,
+    chunked,
+    from_async,
+    reformat,
+    to_json_stream,
+    to_ndjson_stream,
+)
 
-app = FastAPI()
+from fastapi import FastAPI, Request, Response, UploadFile
+from fastapi.responses import (
+    FileResponse,
+    JSONResponse,
+    RedirectResponse,
+    StreamingResponse,
+)
 
-face = RESTface()
+face = AsyncRESTface()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    yield
+    # Flushes journals and closes connections
+    await face.close()
+
+
+app = FastAPI(lifespan=lifespan)
+
+
+def get_url(path: str, request: Request) -> str:
+    # Params controlling the response format aren't filters
+    query = [
+        (name, value)
+        for name, value in request.query_params.multi_items()
+        if name not in {"format", "stream"}
+    ]
+    return f"{path}?{urlencode(query)}"
+
+
+def get_stream_format(request: Request) -> str | None:
+    if "application/x-ndjson" in request.headers.get("accept", ""):
+        return "ndjson"
+    if "stream" in request.query_params:
+        return request.query_params["stream"] or "json"
+    return None
+
+
+stream_media_types = {"json": "application/json", "ndjson": "application/x-ndjson"}
+export_formats = {"csv", "xml", "yaml"}
 
 
 @app.get("/favicon.ico")
@@ -18,7 +65,7 @@ async def favicon():
 
 @app.get("/openapi.json")
 async def openapi():
-    return face.openapi()
+    return await face.openapi()
 
 
 @app.get("/docs")
@@ -27,43 +74,93 @@ async def docs():
 
 
 @app.post("/upload")
-async def upload(file: UploadFile):
-    face.upload(file)
+async def upload(file: UploadFile, infer_types: bool = False, background: bool = False):
+    if background:
+        job = await face.upload_in_background(file, infer_types)
+        return JSONResponse(job.to_dict(), 202, {"Location": f"/jobs/{job.id}"})
+    await face.upload(file, infer_types)
     return "", 204
 
 
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str, request: Request, response: Response):
+    job = face.jobs.get(job_id)
+    if job is None:
+        # Not an import job, could still be an item of a "jobs" collection
+        return await get(f"jobs/{job_id}", request, response)
+    return job.to_dict()
+
+
 @app.get("/")
-async def get_all():
-    return face.all()
+async def get_all(request: Request):
+    stream_format = get_stream_format(request)
+    if stream_format == "json":
+        parts = all_to_json_stream(all_from_async(face.stream_all()))
+    elif stream_format == "ndjson":
+        parts = all_to_ndjson_stream(all_from_async(face.stream_all()))
+    else:
+        return await face.all()
+    return StreamingResponse(
+        chunked(parts), media_type=stream_media_types[stream_format]
+    )
 
 
 @app.delete("/")
 async def reset():
-    face.reset()
+    await face.reset()
     return "", 204
 
 
 @app.get("/{path:path}")
-async def get(path: str, request: Request):
-    result = face.get(path)
-    if "format" in request.query_params:
-        return reformat(request, result)
-    return result
+async def get(path: str, request: Request, response: Response):
+    url = get_url(path, request)
+    export_format = request.query_params.get("format")
+    stream_format = get_stream_format(request)
+    if export_format not in export_formats and stream_format not in stream_media_types:
+        result, next_cursor = await face.get_page(url)
+        if next_cursor:
+            response.headers["X-Next-Cursor"] = next_cursor
+        return result
+    if export_format in export_formats and "limit" in request.query_params:
+        # A page is read whole, its cursor is built from the last item
+        result, next_cursor = await face.get_page(url)
+        response = reformat(request, result)
+        if next_cursor:
+            response.headers["X-Next-Cursor"] = next_cursor
+        return response
+
+    result = await face.stream(url)
+    if isinstance(result, dict):
+        return reformat(request, result) if export_format else result
+    if export_format in export_formats:
+        return reformat(request, from_async(result))
+    if stream_format == "json":
+        parts = to_json_stream(from_async(result))
+    else:
+        parts = to_ndjson_stream(from_async(result))
+    return StreamingResponse(
+        chunked(parts), media_type=stream_media_types[stream_format]
+    )
+
+
+@app.post("/{path:path}/_mget")
+async def get_many(path: str, request: Request):
+    return await face.get_many(get_url(f"{path}/_mget", request), await request.json())
 
 
 @app.post("/{path:path}")
 async def post(path: str, request: Request):
-    face.post(path, await request.json())
+    await face.post(path, await request.json())
     return "", 204
 
 
 @app.put("/{path:path}")
 async def put(path: str, request: Request):
-    face.put(path, await request.json())
+    await face.put(path, await request.json())
     return "", 204
 
 
 @app.delete("/{path:path}")
 async def delete(path: str):
-    face.delete(path)
+    await face.delete(path)
     return "", 204
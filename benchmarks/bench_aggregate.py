@@ -0,0 +1,44 @@
+import sys
+from time import perf_counter
+
+from RESTface import RESTface
+
+# Usage: python -m benchmarks.bench_aggregate [n_items]
+
+queries = {
+    "count": "count",
+    "filtered count": "count&status=paid",
+    "sum + avg": "sum=price&avg=price",
+    "group_by": "group_by=user_id&sum=price",
+}
+
+
+def main(n_items: int = 200_000):
+    items = [
+        {
+            "user_id": i % 100,
+            "price": (i * 7919) % 1000 / 4,
+            "status": "paid" if i % 3 else "new",
+        }
+        for i in range(n_items)
+    ]
+    print(f"{n_items} items")
+    for storage_type in ["memory", "columnar", "file", "db"]:
+        face = RESTface(storage_type)
+        face.post("https://example.com/orders", [dict(item) for item in items])
+        print(storage_type)
+        # What clients had to do before, download everything and count locally
+        start = perf_counter()
+        downloaded = face.get("https://example.com/orders?order_by=")
+        total = sum(item["price"] for item in downloaded)
+        print(f"  {'download':16} {perf_counter() - start:8.3f}s  sum {total:.0f}")
+        for name, query in queries.items():
+            start = perf_counter()
+            result = face.get(f"https://example.com/orders?{query}")
+            size = len(result) if isinstance(result, list) else 1
+            print(f"  {name:16} {perf_counter() - start:8.3f}s  {size} rows")
+        face.close()
+
+
+if __name__ == "__main__":
+    main(*map(int, sys.argv[1:]))
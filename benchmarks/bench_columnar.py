@@ -0,0 +1,53 @@
+import sys
+import tracemalloc
+from time import perf_counter
+
+from storage.ColumnarStorage import ColumnarStorage
+from storage.MemoryStorage import MemoryStorage
+
+# Usage: python -m benchmarks.bench_columnar [n_items]
+
+queries = {
+    "=": [["=", "age", 42]],
+    "range": [["between", "age", [20, 30]], ["gt", "score", 100.5]],
+    "in": [["in", "city", ["city 1", "city 7", "city 42"]]],
+    "notin + ne": [["notin", "age", [1, 2, 3]], ["ne", "city", "city 3"]],
+}
+meta_params = {"order_by": [], "desc": False, "_limit": 0, "_offset": 0}
+ordered = {"order_by": ["score"], "desc": True, "_limit": 100, "_offset": 0}
+
+
+def get_items(n_items: int) -> list[dict]:
+    return [
+        {"age": i % 90, "score": (i * 7919) % 1000 / 3, "city": f"city {i % 50}"}
+        for i in range(n_items)
+    ]
+
+
+def main(n_items: int = 1_000_000):
+    print(f"{n_items} items")
+    for storage_class in [MemoryStorage, ColumnarStorage]:
+        # Items are built while tracing, as MemoryStorage keeps them
+        tracemalloc.start()
+        storage = storage_class()
+        storage.bulk_upsert("items", get_items(n_items))
+        memory = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+
+        storage = storage_class()
+        items = get_items(n_items)
+        start = perf_counter()
+        storage.bulk_upsert("items", items)
+        loaded = perf_counter() - start
+        print(f"{storage_class.__name__}: {memory / 2**20:.0f} MiB, load {loaded:.2f}s")
+        for name, where_params in queries.items():
+            start = perf_counter()
+            count = len(storage.get_without_id("items", where_params, meta_params))
+            print(f"  {name:16} {perf_counter() - start:8.3f}s  {count} items")
+        start = perf_counter()
+        storage.get_without_id("items", queries["range"], ordered)
+        print(f"  {'range, top 100':16} {perf_counter() - start:8.3f}s")
+
+
+if __name__ == "__main__":
+    main(*map(int, sys.argv[1:]))
@@ -0,0 +1,91 @@
+import asyncio
+import statistics
+import sys
+from time import perf_counter
+
+from RESTface import AsyncRESTface, RESTface
+
+# Usage: python -m benchmarks.bench_concurrency [storage_type] [n_items] [clients]
+#
+# Every client alternates a full scan (slow) with lookups by id (fast) while a
+# heartbeat measures how late the event loop wakes up. With the blocking face
+# storage calls run on the event loop itself, like the routes used to do.
+
+
+def percentile(values: list[float], q: float) -> float:
+    return sorted(values)[min(len(values) - 1, int(len(values) * q))]
+
+
+async def heartbeat(lags: list[float], stop: asyncio.Event, interval: float = 0.001):
+    while not stop.is_set():
+        start = perf_counter()
+        await asyncio.sleep(interval)
+        lags.append(perf_counter() - start - interval)
+
+
+async def client(call, n_items: int, latencies: list[float], n_requests: int):
+    for i in range(n_requests):
+        scan = i % 10 == 0
+        url = (
+            "http://localhost/items?name__like=9$&order_by="
+            if scan
+            else f"http://localhost/items/{i * 7919 % n_items + 1}"
+        )
+        start = perf_counter()
+        # Waiting for the event loop counts towards the latency too
+        await asyncio.sleep(0)
+        await call(url)
+        if not scan:
+            latencies.append(perf_counter() - start)
+
+
+async def measure(call, n_items: int, n_clients: int, n_requests: int) -> dict:
+    latencies: list[float] = []
+    lags: list[float] = []
+    stop = asyncio.Event()
+    beat = asyncio.create_task(heartbeat(lags, stop))
+    start = perf_counter()
+    await asyncio.gather(
+        *(client(call, n_items, latencies, n_requests) for _ in range(n_clients))
+    )
+    elapsed = perf_counter() - start
+    stop.set()
+    await beat
+    return {
+        "req/s": n_clients * n_requests / elapsed,
+        "lookup p50 ms": statistics.median(latencies) * 1000,
+        "lookup p99 ms": percentile(latencies, 0.99) * 1000,
+        "loop lag p99 ms": percentile(lags or [0.0], 0.99) * 1000,
+        "loop lag max ms": max(lags or [0.0]) * 1000,
+    }
+
+
+async def main(storage_type: str = "file", n_items: int = 20_000, n_clients: int = 32):
+    n_requests = 50
+    items = [{"name": f"item {i}"} for i in range(n_items)]
+
+    face = RESTface(storage_type)
+    face.post("http://localhost/items", items)
+
+    async def blocking_get(url):
+        return face.get(url)
+
+    async_face = AsyncRESTface(storage_type)
+    await async_face.post("http://localhost/items", [dict(item) for item in items])
+
+    print(f"{storage_type}: {n_items} items, {n_clients} clients")
+    for name, call in {"blocking": blocking_get, "async": async_face.get}.items():
+        results = await measure(call, n_items, n_clients, n_requests)
+        print(
+            f"{name:10}"
+            + "".join(f"  {key}: {value:7.1f}" for key, value in results.items())
+        )
+
+    face.reset()
+    await async_face.reset()
+    await async_face.close()
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    asyncio.run(main(*args[:1], *map(int, args[1:])))
@@ -0,0 +1,39 @@
+import os
+import sys
+import tempfile
+from time import perf_counter
+
+from storage.DbStorage import DbStorage
+
+# Usage: python -m benchmarks.bench_db_bulk [n_items]
+
+
+def legacy_bulk_upsert(storage: DbStorage, table_name: str, items: list[dict]):
+    # Previous DbStorage.bulk_upsert: one upsert (and transaction) per row
+    table = storage.db.get_table(table_name, primary_type=storage.primary_type)
+    return [table.upsert(item, ["id"], ensure=True) for item in items]
+
+
+def main(n_items: int = 100_000):
+    with tempfile.TemporaryDirectory() as directory:
+        storage = DbStorage(f"sqlite:///{os.path.join(directory, 'bench.db')}")
+        print(f"{n_items} items, SQLite file")
+        for name, bulk_upsert in {
+            "per row": lambda *args: legacy_bulk_upsert(storage, *args),
+            "bulk": storage.bulk_upsert,
+        }.items():
+            items = [{"name": f"item {i}", "value": i} for i in range(n_items)]
+            start = perf_counter()
+            bulk_upsert(name.replace(" ", "_"), items)
+            inserted = perf_counter() - start
+
+            items = [{"id": i + 1, "value": -i} for i in range(n_items)]
+            start = perf_counter()
+            bulk_upsert(name.replace(" ", "_"), items)
+            updated = perf_counter() - start
+            print(f"{name:10} insert: {inserted:8.3f}s  update: {updated:8.3f}s")
+        storage.close()
+
+
+if __name__ == "__main__":
+    main(*map(int, sys.argv[1:]))
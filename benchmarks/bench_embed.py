@@ -0,0 +1,38 @@
+import sys
+from time import perf_counter
+
+from RESTface import RESTface
+
+# Usage: python -m benchmarks.bench_embed [n_posts] [n_comments]
+
+
+def main(n_posts: int = 1000, n_comments: int = 10):
+    print(f"{n_posts} posts, {n_comments} comments each")
+    for storage_type in ["memory", "columnar", "file", "db"]:
+        face = RESTface(storage_type)
+        face.post("https://example.com/posts", [{} for _ in range(n_posts)])
+        face.post(
+            "https://example.com/comments",
+            [
+                {"post_id": post_id, "text": "comment"}
+                for post_id in range(1, n_posts + 1)
+                for _ in range(n_comments)
+            ],
+        )
+        # A request per post for its comments
+        start = perf_counter()
+        posts = face.get("https://example.com/posts")
+        for post in posts:
+            post["comments"] = face.get(
+                f"https://example.com/posts/{post['id']}/comments"
+            )
+        n_plus_one = perf_counter() - start
+        start = perf_counter()
+        face.get("https://example.com/posts?embed=comments")
+        embedded = perf_counter() - start
+        print(f"{storage_type:9} N+1 {n_plus_one:.3f}s  embed {embedded:.3f}s")
+        face.close()
+
+
+if __name__ == "__main__":
+    main(*map(int, sys.argv[1:]))
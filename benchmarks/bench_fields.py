@@ -0,0 +1,39 @@
+import json
+import sys
+from time import perf_counter
+
+from RESTface import RESTface
+
+# Usage: python -m benchmarks.bench_fields [n_items] [n_fields]
+
+
+def main(n_items: int = 20_000, n_fields: int = 50):
+    items = [
+        {f"field_{j}": f"value {i * j}" if j % 2 else i * j for j in range(n_fields)}
+        for i in range(n_items)
+    ]
+    print(f"{n_items} items, {n_fields} fields")
+    for storage_type in ["memory", "columnar", "file", "db"]:
+        face = RESTface(storage_type)
+        face.post("https://example.com/items", [dict(item) for item in items])
+        print(storage_type)
+        for name, query in {"all": "", "fields": "fields=field_1,field_2"}.items():
+            # Best of a few runs, freeing the previous result isn't timed
+            read, serialized = float("inf"), float("inf")
+            for _ in range(3):
+                start = perf_counter()
+                result = face.get(f"https://example.com/items?order_by=&{query}")
+                read = min(read, perf_counter() - start)
+                start = perf_counter()
+                payload = json.dumps(result)
+                serialized = min(serialized, perf_counter() - start)
+                del result
+            print(
+                f"  {name:8} read {read:.3f}s  serialize {serialized:.3f}s"
+                f"  {len(payload) / 2**20:.1f} MiB"
+            )
+        face.close()
+
+
+if __name__ == "__main__":
+    main(*map(int, sys.argv[1:]))
@@ -0,0 +1,58 @@
+import sys
+from time import perf_counter
+
+import tinydb
+
+from storage.FileStorage import FileStorage
+
+# Usage: python -m benchmarks.bench_file_bulk [max_batch_size]
+
+
+def legacy_bulk_upsert(storage: FileStorage, table_name: str, items: list[dict]):
+    # Previous FileStorage.bulk_upsert: one query per item, each evaluated
+    # against every document
+    table = storage.get_table(table_name)
+    storage.bulk_get_ids(table_name, items)
+    item_ids = {item["id"] for item in table.all()}
+    table.update_multiple(
+        [
+            (item, tinydb.where("id") == item["id"])
+            for item in items
+            if item["id"] in item_ids
+        ]
+    )
+    table.insert_multiple(
+        [
+            tinydb.table.Document(item, doc_id=item["id"])
+            for item in items
+            if item["id"] not in item_ids
+        ]
+    )
+
+
+def main(max_batch_size: int = 4000):
+    batch_sizes = []
+    batch_size = 500
+    while batch_size <= max_batch_size:
+        batch_sizes.append(batch_size)
+        batch_size *= 2
+    print("batch size: updating every item of a table of the same size")
+    for name, bulk_upsert in {
+        "per query": legacy_bulk_upsert,
+        "doc_id": FileStorage.bulk_upsert,
+    }.items():
+        for batch_size in batch_sizes:
+            storage = FileStorage()
+            storage.bulk_upsert("items", [{"value": i} for i in range(batch_size)])
+            items = [{"id": i + 1, "value": -i} for i in range(batch_size)]
+            start = perf_counter()
+            bulk_upsert(storage, "items", items)
+            elapsed = perf_counter() - start
+            print(
+                f"{name:10} {batch_size:8} {elapsed:8.3f}s"
+                f" {elapsed / batch_size * 1e6:8.1f}us per item"
+            )
+
+
+if __name__ == "__main__":
+    main(*map(int, sys.argv[1:]))
@@ -0,0 +1,32 @@
+import os
+import sys
+import tempfile
+from time import perf_counter
+
+from storage.FileStorage import FileStorage
+
+# Usage: python -m benchmarks.bench_file_journal [n_items] [n_writes]
+
+
+def main(n_items: int = 10_000, n_writes: int = 1_000):
+    items = [{"name": f"item {i}", "value": i} for i in range(n_items)]
+    print(f"{n_writes} writes into a file holding {n_items} items")
+    for name, options in {
+        "rewrite": {},
+        "journal, flush per write": {"journal": True, "flush": "write"},
+        "journal, flush every 100ms": {"journal": True, "flush": "interval"},
+        "journal, flush on shutdown": {"journal": True, "flush": "shutdown"},
+    }.items():
+        with tempfile.TemporaryDirectory() as directory:
+            storage = FileStorage(os.path.join(directory, "db.json"), **options)
+            storage.bulk_upsert("items", [dict(item) for item in items])
+            start = perf_counter()
+            for i in range(n_writes):
+                storage.upsert("items", {"id": i + 1, "value": -i})
+            elapsed = perf_counter() - start
+            storage.close()
+            print(f"{name:28} {elapsed / n_writes * 1000:8.3f}ms per write")
+
+
+if __name__ == "__main__":
+    main(*map(int, sys.argv[1:]))
@@ -0,0 +1,31 @@
+import random
+import sys
+from time import perf_counter
+
+from RESTface import RESTface
+
+# Usage: python -m benchmarks.bench_get_many [n_items] [n_ids]
+
+
+def main(n_items: int = 100_000, n_ids: int = 1000):
+    random.seed(0)
+    item_ids = random.sample(range(1, n_items + 1), n_ids)
+    print(f"{n_ids} of {n_items} items")
+    for storage_type in ["memory", "columnar", "file", "db"]:
+        face = RESTface(storage_type)
+        face.post(
+            "https://example.com/users", [{"name": f"user {i}"} for i in range(n_items)]
+        )
+        start = perf_counter()
+        for item_id in item_ids:
+            face.get(f"https://example.com/users/{item_id}")
+        one_by_one = perf_counter() - start
+        start = perf_counter()
+        face.get(f"https://example.com/users/{','.join(map(str, item_ids))}")
+        batched = perf_counter() - start
+        print(f"{storage_type:9} one by one {one_by_one:.3f}s  get_many {batched:.3f}s")
+        face.close()
+
+
+if __name__ == "__main__":
+    main(*map(int, sys.argv[1:]))
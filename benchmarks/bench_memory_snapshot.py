@@ -0,0 +1,46 @@
+import os
+import sys
+import tempfile
+from time import perf_counter
+
+from storage.MemoryStorage import MemoryStorage
+
+# Usage: python -m benchmarks.bench_memory_snapshot [n_items]
+
+
+def measure(name: str, func, *args):
+    start = perf_counter()
+    result = func(*args)
+    print(f"{name:36} {perf_counter() - start:8.3f}s")
+    return result
+
+
+def main(n_items: int = 1_000_000):
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "db.pickle")
+        storage = MemoryStorage(storage_path=path, oplog=True)
+        storage.bulk_upsert(
+            "items", [{"name": f"item {i}", "value": i} for i in range(n_items)]
+        )
+        print(f"{n_items} items")
+        measure("restart, replaying the log", MemoryStorage, False, path, True)
+
+        journal = storage.journal
+        assert journal is not None
+        # Time the request handling thread is paused for
+        measure(
+            "pause, copying the data",
+            lambda: {
+                name: {item_id: dict(item) for item_id, item in table.items()}
+                for name, table in storage.db.items()
+            },
+        )
+        measure("pause, forking", journal.compact, storage.db)
+        measure("snapshot written", journal.wait)
+        print(f"snapshot size {os.path.getsize(path) / 2**20:.1f} MiB")
+        measure("restart, mapped snapshot", MemoryStorage, False, path, True)
+        storage.close()
+
+
+if __name__ == "__main__":
+    main(*map(int, sys.argv[1:]))
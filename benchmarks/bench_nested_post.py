@@ -0,0 +1,27 @@
+import sys
+from time import perf_counter
+
+from RESTface import RESTface
+
+# Usage: python -m benchmarks.bench_nested_post [n_posts] [n_users]
+
+
+def main(n_posts: int = 5000, n_users: int = 10):
+    print(f"{n_posts} posts under {n_users} users")
+    for storage_type in ["memory", "columnar", "file", "db"]:
+        face = RESTface(storage_type)
+        start = perf_counter()
+        for i in range(n_posts):
+            face.post(f"https://example.com/posts?name=post{i}")
+        flat = perf_counter() - start
+        face.reset()
+        start = perf_counter()
+        for i in range(n_posts):
+            face.post(f"https://example.com/users/{i % n_users + 1}/posts?name=post{i}")
+        nested = perf_counter() - start
+        print(f"{storage_type:9} flat {flat:.3f}s  nested {nested:.3f}s")
+        face.close()
+
+
+if __name__ == "__main__":
+    main(*map(int, sys.argv[1:]))
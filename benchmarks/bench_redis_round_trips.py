@@ -0,0 +1,75 @@
+import sys
+from time import perf_counter
+
+from storage.RedisStorage import RedisStorage
+
+# Usage: python -m benchmarks.bench_redis_round_trips [n_items]
+# Needs a Redis server on localhost:6379, the selected database is flushed
+
+
+def legacy_bulk_upsert(storage: RedisStorage, collection_name: str, items: list):
+    # Previous RedisStorage.bulk_upsert: HSET + SADD per item
+    storage.bulk_get_ids(collection_name, items)
+    for item in items:
+        mapping = {k: storage.encode(v) for k, v in item.items()}
+        storage.db.hset(f"{collection_name}:{item['id']}", mapping=mapping)
+        storage.db.sadd(collection_name, item["id"])
+    storage.db.sadd("collections", collection_name)
+
+
+def legacy_get_items(storage: RedisStorage, collection_name: str) -> list:
+    # Previous RedisStorage.get_items: HGETALL per member
+    return [
+        {k: storage.decode(v) for k, v in storage.db.hgetall(key).items()}
+        for key in (
+            f"{collection_name}:{item_id}"
+            for item_id in storage.db.smembers(collection_name)
+        )
+    ]
+
+
+def measure(storage: RedisStorage, name: str, func, *args):
+    storage.db.round_trips = 0
+    start = perf_counter()
+    func(*args)
+    elapsed = perf_counter() - start
+    print(f"{name:30} round trips: {storage.db.round_trips:8}  {elapsed:8.3f}s")
+
+
+def main(n_items: int = 100_000):
+    storage = RedisStorage()
+    storage.reset()
+    where_params = [["=", "name", "item 1"]]
+    meta_params = {"order_by": [], "desc": False, "_limit": 0, "_offset": 0}
+    print(f"{n_items} items")
+    measure(
+        storage,
+        "bulk_upsert (per item)",
+        legacy_bulk_upsert,
+        storage,
+        "legacy",
+        [{"name": f"item {i}"} for i in range(n_items)],
+    )
+    measure(
+        storage,
+        "bulk_upsert (pipelined)",
+        storage.bulk_upsert,
+        "items",
+        [{"name": f"item {i}"} for i in range(n_items)],
+    )
+    measure(storage, "upsert", storage.upsert, "items", {"name": "item"})
+    measure(storage, "filtered get (per item)", legacy_get_items, storage, "items")
+    measure(
+        storage,
+        "filtered get (batched)",
+        storage.get_without_id,
+        "items",
+        where_params,
+        meta_params,
+    )
+    measure(storage, "all", storage.all)
+    storage.reset()
+
+
+if __name__ == "__main__":
+    main(*map(int, sys.argv[1:]))
@@ -0,0 +1,28 @@
+import sys
+from time import perf_counter
+
+from RESTface import RESTface
+
+# Usage: python -m benchmarks.bench_routes [n_requests] [n_users]
+
+
+def main(n_requests: int = 100_000, n_users: int = 100):
+    face = RESTface()
+    urls = [
+        f"https://example.com/users/{i % n_users + 1}/posts" for i in range(n_requests)
+    ]
+    start = perf_counter()
+    for url in urls:
+        face._resolve_path(url.removeprefix("https://example.com"))
+    uncached = perf_counter() - start
+    start = perf_counter()
+    for url in urls:
+        face.parse_url(url)
+    cached = perf_counter() - start
+    print(f"{n_requests} requests over {n_users} paths")
+    print(f"resolved every time {uncached:.3f}s  cached {cached:.3f}s")
+    face.close()
+
+
+if __name__ == "__main__":
+    main(*map(int, sys.argv[1:]))
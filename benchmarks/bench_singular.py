@@ -0,0 +1,31 @@
+import sys
+from time import perf_counter
+
+from inflect import engine as get_engine
+
+from RESTface import RESTface
+
+# Usage: python -m benchmarks.bench_singular [n_requests]
+
+
+def main(n_requests: int = 10_000):
+    engine = get_engine()
+    names = ["users", "posts", "comments", "people", "categories"]
+    start = perf_counter()
+    for i in range(n_requests):
+        engine.singular_noun(names[i % len(names)])
+    uncached = perf_counter() - start
+    face = RESTface()
+    url_parts = ["users", "1", "posts", "2", "comments"]
+    start = perf_counter()
+    for _ in range(n_requests):
+        face.get_subhierarchy(url_parts)
+        face.get_where_params(url_parts, {})
+    request_path = perf_counter() - start
+    print(f"{n_requests} inflect calls {uncached:.3f}s")
+    print(f"{n_requests} nested request paths {request_path:.3f}s")
+    face.close()
+
+
+if __name__ == "__main__":
+    main(*map(int, sys.argv[1:]))
@@ -0,0 +1,51 @@
+import random
+import sys
+from time import perf_counter
+
+from storage.MemoryStorage import MemoryStorage
+
+# Usage: python -m benchmarks.bench_text_index [n_items]
+
+queries = [
+    ("like", "ander"),
+    ("ilike", "SMITH 12"),
+    ("startswith", "Ma"),
+    ("endswith", "son 42"),
+]
+meta_params = {"order_by": [], "desc": False, "_limit": 0, "_offset": 0}
+
+
+def main(n_items: int = 200_000):
+    random.seed(0)
+    first_names = ["Maria", "John", "Alexander", "Anna", "Jon", "Mark", "Sandra"]
+    last_names = ["Smith", "Johnson", "Anderson", "Jackson", "Madison", "Mason"]
+    items = [
+        {
+            "name": f"{random.choice(first_names)} {random.choice(last_names)}"
+            f" {random.randrange(1000)}"
+        }
+        for _ in range(n_items)
+    ]
+    print(f"{n_items} items")
+    for name, indexed in {"scan": False, "text index": True}.items():
+        storage = MemoryStorage()
+        if indexed:
+            storage.create_index("users", "name", "text")
+        start = perf_counter()
+        storage.bulk_upsert("users", [dict(item) for item in items])
+        print(f"{name}: load {perf_counter() - start:.2f}s")
+        if indexed:
+            # The first read sorts in the loaded values
+            start = perf_counter()
+            storage.get_without_id("users", [["startswith", "name", "-"]], meta_params)
+            print(f"  first read {perf_counter() - start:.2f}s")
+        for op_name, value in queries:
+            where_params = [[op_name, "name", value]]
+            start = perf_counter()
+            count = len(storage.get_without_id("users", where_params, meta_params))
+            elapsed = perf_counter() - start
+            print(f"  {op_name:10} {value:10} {elapsed * 1000:8.2f}ms  {count} items")
+
+
+if __name__ == "__main__":
+    main(*map(int, sys.argv[1:]))
@@ -0,0 +1,70 @@
+import random
+import sys
+from functools import partial
+from timeit import timeit
+
+from storage.query import paginate
+
+# Usage: python -m benchmarks.bench_topk [n_items]
+
+
+def full_sort(items, meta_params):
+    # Previous BaseStorage.get_without_id behaviour: sort everything, then slice
+    order_by = meta_params["order_by"]
+
+    def order_key(item):
+        return tuple(
+            [
+                ((value := item.get(order_by_arg)) is not None, value)
+                for order_by_arg in order_by
+            ]
+            + [item["id"]]
+        )
+
+    items = sorted(items, key=order_key, reverse=meta_params["desc"])
+    offset = meta_params["_offset"]
+    limit = meta_params["_limit"] or len(items) - offset
+    return items[offset : offset + limit]
+
+
+def top_k(items, meta_params):
+    return paginate(iter(items), meta_params)
+
+
+def main(n_items: int = 1_000_000):
+    random.seed(0)
+    items = [
+        {"id": i, "created": random.random() if i % 10 else None}
+        for i in range(1, n_items + 1)
+    ]
+    cases = {
+        "order_by=created&limit=20": {
+            "order_by": ["created"],
+            "desc": False,
+            "_limit": 20,
+            "_offset": 0,
+        },
+        "order_by=created&desc&offset=100&limit=20": {
+            "order_by": ["created"],
+            "desc": True,
+            "_limit": 20,
+            "_offset": 100,
+        },
+        "order_by=&limit=20": {
+            "order_by": [],
+            "desc": False,
+            "_limit": 20,
+            "_offset": 0,
+        },
+    }
+    print(f"{n_items} items")
+    for name, meta_params in cases.items():
+        if meta_params["order_by"]:
+            assert full_sort(items, meta_params) == top_k(items, meta_params)
+        before = timeit(partial(full_sort, items, meta_params), number=3) / 3
+        after = timeit(partial(top_k, items, meta_params), number=3) / 3
+        print(f"{name:45} sort: {before:8.3f}s  top-k: {after:8.3f}s")
+
+
+if __name__ == "__main__":
+    main(*map(int, sys.argv[1:]))
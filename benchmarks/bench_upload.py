@@ -0,0 +1,39 @@
+import sys
+from io import BytesIO
+from time import perf_counter
+
+from fastapi import UploadFile
+
+from RESTface import RESTface
+
+# Usage: python -m benchmarks.bench_upload [storage_type] [n_rows]
+
+
+def legacy_upload(face: RESTface, file: UploadFile):
+    # Previous RESTface.upload: naive split and one POST per row
+    table_name = str(file.filename).split(".")[0]
+    keys = file.file.readline().decode("utf-8").strip().split(",")
+    for item in file.file:
+        values = item.decode("utf-8").strip().split(",")
+        face.post(table_name, dict(zip(keys, values)))
+
+
+def main(storage_type: str = "db", n_rows: int = 100_000):
+    rows = b"".join(b"item %d,%d,%f\n" % (i, i, i / 3) for i in range(n_rows))
+    content = b"name,count,ratio\n" + rows
+    print(f"{storage_type}: {n_rows} rows, {len(content) / 2**20:.1f} MiB")
+    for name, upload in {
+        "per row": legacy_upload,
+        "batched": RESTface.upload,
+    }.items():
+        face = RESTface(storage_type)
+        file = UploadFile(filename="items.csv", file=BytesIO(content))
+        start = perf_counter()
+        upload(face, file)
+        print(f"{name:10} {perf_counter() - start:8.3f}s")
+        face.reset()
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    main(*args[:1], *map(int, args[1:]))
@@ -0,0 +1,91 @@
+import asyncio
+import logging
+import uuid
+from collections import OrderedDict
+from collections.abc import Awaitable, Callable
+from time import time
+
+logger = logging.getLogger(__name__)
+
+
+class Job:
+    max_errors = 100
+
+    def __init__(self, name: str):
+        self.id = uuid.uuid4().hex
+        self.name = name
+        self.status = "queued"
+        self.rows = 0
+        self.errors: list[dict] = []
+        self.created = time()
+        self.started: float | None = None
+        self.finished: float | None = None
+
+    def advance(self, rows: int) -> None:
+        self.rows += rows
+
+    def record_error(self, row: int, error: Exception) -> None:
+        if len(self.errors) < self.max_errors:
+            self.errors.append({"row": row, "error": str(error)})
+
+    def to_dict(self) -> dict:
+        elapsed = (self.finished or time()) - self.started if self.started else 0
+        return {
+            "id": self.id,
+            "name": self.name,
+            "status": self.status,
+            "rows": self.rows,
+            "rows_per_second": round(self.rows / elapsed, 1) if elapsed else 0,
+            "errors": self.errors,
+            "created": self.created,
+            "started": self.started,
+            "finished": self.finished,
+        }
+
+
+class JobRunner:
+    # At most `max_running` jobs run at once, the rest wait in line, so bulk
+    # imports can't take over the storage workers used by regular requests
+    def __init__(self, max_running: int = 2, max_finished: int = 100):
+        self.max_running = max_running
+        self.max_finished = max_finished
+        self.jobs: OrderedDict[str, Job] = OrderedDict()
+        self.tasks: set[asyncio.Task] = set()
+        self.semaphore: asyncio.Semaphore | None = None
+
+    def get(self, job_id: str) -> Job | None:
+        return self.jobs.get(job_id)
+
+    def submit(self, name: str, run: Callable[[Job], Awaitable]) -> Job:
+        if self.semaphore is None:
+            self.semaphore = asyncio.Semaphore(self.max_running)
+        job = Job(name)
+        self.jobs[job.id] = job
+        task = asyncio.create_task(self.run(job, run))
+        # The loop only keeps weak references to tasks
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+        return job
+
+    async def run(self, job: Job, run: Callable[[Job], Awaitable]) -> None:
+        assert self.semaphore is not None
+        async with self.semaphore:
+            job.status, job.started = "running", time()
+            try:
+                await run(job)
+                job.status = "done"
+            except Exception as e:
+                logger.exception("Job %s failed", job.name)
+                job.status = "failed"
+                job.record_error(job.rows, e)
+            finally:
+                job.finished = time()
+        self.prune()
+
+    def prune(self) -> None:
+        finished = [job_id for job_id, job in self.jobs.items() if job.finished]
+        for job_id in finished[: max(0, len(finished) - self.max_finished)]:
+            del self.jobs[job_id]
+
+    async def join(self) -> None:
+        await asyncio.gather(*self.tasks)
@@ -1,6 +1,8 @@
 from copy import deepcopy
 from sqlalchemy import Integer, UnicodeText, BigInteger, Float, Boolean  # type: ignore[import-untyped]
 
+from utils import singular
+
 type_map = {
     Integer: "integer",
     UnicodeText: "string",
@@ -22,7 +24,7 @@ id_parameter = {
 }
 
 
-def get_schema(db, engine):
+def get_schema(db):
     schema = {
         "openapi": "3.0.0",
         "info": {
@@ -36,7 +38,7 @@ def get_schema(db, engine):
     for table_name in db.tables:
         properties = {}
         obj_parameters = []
-        item_name = engine.singular_noun(table_name)
+        item_name = singular(table_name)
         schema["tags"] += [{"name": table_name.capitalize()}]
         for column in db.get_table(table_name)._table.columns:
             column_name = str(column.name)
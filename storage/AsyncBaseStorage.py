@@ -0,0 +1,122 @@
+import uuid
+from abc import ABC, abstractmethod
+from collections.abc import AsyncIterator
+
+from .IdAllocator import AsyncBaseIdAllocator
+from .query import Aggregation, empty_aggregates, only_counts
+
+
+class AsyncBaseStorage(ABC):
+    # Awaitable counterpart of BaseStorage, nothing here blocks the event loop
+    primary_type: type = int
+    id_allocator: AsyncBaseIdAllocator
+
+    @abstractmethod
+    async def get_with_id(self, table_name: str, item_id: int | str) -> dict: ...
+
+    async def get_many(self, table_name: str, item_ids: list) -> list[dict]:
+        items = [await self.get_with_id(table_name, item_id) for item_id in item_ids]
+        return [item for item in items if item]
+
+    async def get_without_id(
+        self, table_name: str, where_params: list, meta_params: dict
+    ) -> list:
+        return [
+            item
+            async for item in self.iter_without_id(
+                table_name, where_params, meta_params
+            )
+        ]
+
+    @abstractmethod
+    def iter_without_id(
+        self, table_name: str, where_params: list, meta_params: dict
+    ) -> AsyncIterator[dict]: ...
+
+    async def count(self, table_name: str) -> int:
+        meta_params = {"order_by": [], "desc": False, "_limit": 0, "_offset": 0}
+        return len([_ async for _ in self.iter_without_id(table_name, [], meta_params)])
+
+    async def aggregate(
+        self, table_name: str, where_params: list, aggregates: list, group_by: list
+    ) -> list[dict]:
+        if only_counts(where_params, aggregates, group_by):
+            count = await self.count(table_name)
+            return [{**empty_aggregates(aggregates), "count": count}]
+        aggregation = Aggregation(aggregates, group_by)
+        meta_params = {"order_by": [], "desc": False, "_limit": 0, "_offset": 0}
+        batch: list[dict] = []
+        async for item in self.iter_without_id(table_name, where_params, meta_params):
+            batch.append(item)
+            if len(batch) == aggregation.batch_size:
+                aggregation.add_batch(batch)
+                batch = []
+        aggregation.add_batch(batch)
+        return aggregation.rows()
+
+    @abstractmethod
+    async def upsert(
+        self, table_name: str, data: dict, method: str = "POST"
+    ) -> int | str: ...
+
+    @abstractmethod
+    async def bulk_upsert(
+        self, table_name: str, items: list[dict], method: str = "POST"
+    ) -> list[int | str]: ...
+
+    @abstractmethod
+    async def delete_with_id(self, table_name: str, item_id: int | str) -> bool: ...
+
+    @abstractmethod
+    async def delete_without_id(self, table_name: str, where_params: list) -> None: ...
+
+    async def all(self) -> dict:
+        return {
+            table_name: [item async for item in items]
+            async for table_name, items in self.iter_all()
+        }
+
+    # Yields (table name, items) pairs, one table at a time
+    @abstractmethod
+    def iter_all(self) -> AsyncIterator[tuple[str, AsyncIterator[dict]]]: ...
+
+    @abstractmethod
+    async def reset(self) -> None: ...
+
+    @abstractmethod
+    async def close(self) -> None: ...
+
+    async def get_id(self, collection_name: str, data: dict) -> int | str:
+        item_id: int | str = data.get("id", "")
+        if "id" not in data:
+            if self.primary_type is int:
+                item_id = await self.id_allocator.allocate(collection_name)
+            elif self.primary_type is str:
+                item_id = str(uuid.uuid4())
+            data["id"] = item_id
+        elif self.primary_type is int and isinstance(item_id, int):
+            await self.id_allocator.observe(collection_name, item_id)
+        return item_id
+
+    async def bulk_get_ids(
+        self, collection_name: str, items: list[dict]
+    ) -> list[int | str]:
+        missing = [item for item in items if not item.get("id", "")]
+        if self.primary_type is int:
+            # Explicit IDs first, so the reserved range never overlaps them
+            explicit_ids = [
+                item["id"] for item in items if isinstance(item.get("id"), int)
+            ]
+            if explicit_ids:
+                await self.id_allocator.observe(collection_name, max(explicit_ids))
+            if missing:
+                first_id = await self.id_allocator.allocate(
+                    collection_name, len(missing)
+                )
+                for item_id, item in enumerate(missing, first_id):
+                    item["id"] = item_id
+        elif self.primary_type is str:
+            for item in missing:
+                item["id"] = str(uuid.uuid4())
+        item_ids = [item["id"] for item in items]
+        return item_ids
@@ -0,0 +1,135 @@
+from collections.abc import AsyncIterator
+
+import pymongo
+
+from .AsyncBaseStorage import AsyncBaseStorage
+from .IdAllocator import AsyncMongoIdAllocator
+from .MongoStorage import MongoStorage
+from .query import empty_aggregates, only_counts, order_by_ids
+
+
+class AsyncMongoStorage(AsyncBaseStorage):
+    batch_size = MongoStorage.batch_size
+    get_where_params = MongoStorage.get_where_params
+    get_after_filter = MongoStorage.get_after_filter
+    get_find_params = MongoStorage.get_find_params
+    to_item = MongoStorage.to_item
+    get_aggregate_pipeline = MongoStorage.get_aggregate_pipeline
+    to_aggregate_rows = MongoStorage.to_aggregate_rows
+
+    def __init__(
+        self,
+        storage_path: str | None = "mongodb://localhost:27017",
+        uuid_id: bool = False,
+    ):
+        self.client: pymongo.AsyncMongoClient = pymongo.AsyncMongoClient(storage_path)
+        self.db = self.client.db
+        self.primary_type = str if uuid_id else int
+        self.id_allocator = AsyncMongoIdAllocator(self.db, self.get_ids)
+
+    async def get_with_id(self, collection_name: str, item_id: int | str) -> dict:
+        collection = self.db[collection_name]
+        return self.to_item(await collection.find_one({"_id": item_id}) or {})
+
+    async def get_many(self, collection_name: str, item_ids: list) -> list[dict]:
+        cursor = self.db[collection_name].find({"_id": {"$in": item_ids}})
+        items = [self.to_item(document) async for document in cursor]
+        return order_by_ids(items, item_ids)
+
+    async def iter_without_id(
+        self, collection_name: str, where_params_list: list, meta_params: dict
+    ) -> AsyncIterator[dict]:
+        collection = self.db[collection_name]
+        find_params = self.get_find_params(where_params_list, meta_params)
+        async for document in collection.find(**find_params):
+            yield self.to_item(document)
+
+    async def count(self, collection_name: str) -> int:
+        return await self.db[collection_name].estimated_document_count()
+
+    async def aggregate(
+        self,
+        collection_name: str,
+        where_params_list: list,
+        aggregates: list,
+        group_by: list,
+    ) -> list[dict]:
+        if only_counts(where_params_list, aggregates, group_by):
+            return [
+                {
+                    **empty_aggregates(aggregates),
+                    "count": await self.count(collection_name),
+                }
+            ]
+        pipeline = self.get_aggregate_pipeline(where_params_list, aggregates, group_by)
+        cursor = await self.db[collection_name].aggregate(pipeline)
+        documents = [document async for document in cursor]
+        return self.to_aggregate_rows(documents, aggregates, group_by)
+
+    async def upsert(
+        self, collection_name: str, data: dict, method: str = "POST"
+    ) -> int | str:
+        item_id = await self.get_id(collection_name, data)
+        collection = self.db[collection_name]
+        if method == "POST":
+            upserted_item = await collection.update_one(
+                {"_id": item_id}, {"$set": data}, upsert=True
+            )
+        else:
+            upserted_item = await collection.replace_one(
+                {"_id": item_id}, data, upsert=True
+            )
+        return upserted_item.upserted_id or item_id
+
+    async def bulk_upsert(
+        self, collection_name: str, items: list[dict], method: str = "POST"
+    ) -> list[int | str]:
+        await self.bulk_get_ids(collection_name, items)
+        collection = self.db[collection_name]
+        if method == "POST":
+            requests = [
+                pymongo.UpdateOne({"_id": item["id"]}, {"$set": item}, upsert=True)
+                for item in items
+            ]
+        else:
+            requests = [
+                pymongo.ReplaceOne({"_id": item["id"]}, item, upsert=True)
+                for item in items
+            ]
+        await collection.bulk_write(requests)
+        return [item["id"] for item in items]
+
+    async def delete_with_id(self, collection_name: str, item_id: int | str) -> bool:
+        collection = self.db[collection_name]
+        return bool((await collection.delete_one({"_id": item_id})).deleted_count)
+
+    async def delete_without_id(
+        self, collection_name: str, where_params_list: list
+    ) -> None:
+        collection = self.db[collection_name]
+        if where_params_list:
+            await collection.delete_many(self.get_where_params(where_params_list))
+        else:
+            await collection.drop()
+            await self.id_allocator.reset(collection_name)
+
+    async def iter_all(self) -> AsyncIterator[tuple[str, AsyncIterator[dict]]]:
+        for collection_name in await self.db.list_collection_names():
+            if collection_name != self.id_allocator.collection_name:
+                yield collection_name, self.iter_items(collection_name)
+
+    async def reset(self) -> None:
+        await self.client.drop_database(self.db)
+        await self.id_allocator.reset()
+
+    async def close(self) -> None:
+        await self.client.close()
+
+    async def get_ids(self, collection_name: str) -> list[int | str]:
+        cursor = self.db[collection_name].find(projection=["_id"])
+        return [document["_id"] async for document in cursor]
+
+    async def iter_items(self, collection_name: str) -> AsyncIterator[dict]:
+        cursor = self.db[collection_name].find(batch_size=self.batch_size)
+        async for document in cursor:
+            yield self.to_item(document)
@@ -0,0 +1,186 @@
+from collections.abc import AsyncIterator
+
+import redis.asyncio
+
+from .AsyncBaseStorage import AsyncBaseStorage
+from .IdAllocator import AsyncRedisIdAllocator
+from .query import compile_where, get_projector, get_read_fields, paginate, project
+from .RedisStorage import RedisStorage
+
+
+class AsyncRedisStorage(AsyncBaseStorage):
+    encode = RedisStorage.encode
+    decode = RedisStorage.decode
+
+    def __init__(
+        self, _: str | None = None, uuid_id: bool = False, batch_size: int = 1000
+    ):
+        self.batch_size = batch_size
+        self.db = redis.asyncio.Redis(decode_responses=True)
+        self.primary_type = str if uuid_id else int
+        self.id_allocator = AsyncRedisIdAllocator(self.db, self.get_ids)
+
+    async def get_with_id(self, collection_name: str, item_id: int | str) -> dict:
+        item = await self.db.hgetall(f"{collection_name}:{item_id}")  # type: ignore[misc]
+        return {k: self.decode(v) for k, v in (item or {}).items()}
+
+    async def get_many(self, collection_name: str, item_ids: list) -> list[dict]:
+        return await self.get_batch(collection_name, item_ids)
+
+    async def iter_without_id(
+        self, collection_name: str, where_params: list, meta_params: dict
+    ) -> AsyncIterator[dict]:
+        predicate = compile_where(where_params)
+        # Projected queries only read the fields needed, with HMGET
+        fields = meta_params.get("_fields")
+        read_fields = get_read_fields(where_params, meta_params)
+        items = (
+            item
+            async for item in self.iter_items(collection_name, read_fields)
+            if predicate(item)
+        )
+        if meta_params["order_by"] or meta_params.get("_after") is not None:
+            # Ordering needs every match, only the page is kept in memory
+            page = paginate([item async for item in items], meta_params)
+            for item in project(page, fields):
+                yield item
+            return
+        select = get_projector(fields) if fields else None
+        offset, limit = meta_params["_offset"], meta_params["_limit"]
+        async for item in items:
+            if offset:
+                offset -= 1
+                continue
+            yield select(item) if select else item
+            if limit:
+                limit -= 1
+                if not limit:
+                    return
+
+    async def upsert(
+        self, collection_name: str, data: dict, method: str = "POST"
+    ) -> int | str:
+        item_id = await self.get_id(collection_name, data)
+        data = {k: self.encode(v) for k, v in data.items()}
+        async with self.db.pipeline(transaction=True) as pipeline:
+            if method == "PUT":
+                pipeline.delete(f"{collection_name}:{item_id}")
+            pipeline.hset(f"{collection_name}:{item_id}", mapping=data)
+            pipeline.sadd("collections", collection_name)
+            pipeline.sadd(collection_name, item_id)
+            await pipeline.execute()
+        return item_id
+
+    async def bulk_upsert(
+        self, collection_name: str, items: list[dict], method: str = "POST"
+    ) -> list[int | str]:
+        item_ids = await self.bulk_get_ids(collection_name, items)
+        async with self.db.pipeline(transaction=True) as pipeline:
+            if method == "PUT" and items:
+                pipeline.delete(
+                    *(f"{collection_name}:{item_id}" for item_id in item_ids)
+                )
+            for item in items:
+                mapping = {k: self.encode(v) for k, v in item.items()}
+                pipeline.hset(f"{collection_name}:{item['id']}", mapping=mapping)
+            if items:
+                pipeline.sadd(collection_name, *item_ids)
+            pipeline.sadd("collections", collection_name)
+            await pipeline.execute()
+        return item_ids
+
+    async def delete_with_id(self, collection_name: str, doc_id: int | str) -> bool:
+        async with self.db.pipeline(transaction=True) as pipeline:
+            pipeline.delete(f"{collection_name}:{doc_id}")
+            pipeline.srem(collection_name, doc_id)
+            deleted, removed = await pipeline.execute()
+        return bool(deleted and removed)
+
+    async def delete_without_id(self, collection_name: str, where_params: list) -> None:
+        if where_params:
+            predicate = compile_where(where_params)
+            item_ids = [
+                item["id"]
+                async for item in self.iter_items(collection_name)
+                if predicate(item)
+            ]
+            if item_ids:
+                async with self.db.pipeline(transaction=True) as pipeline:
+                    pipeline.delete(
+                        *(f"{collection_name}:{item_id}" for item_id in item_ids)
+                    )
+                    pipeline.srem(collection_name, *item_ids)
+                    await pipeline.execute()
+        else:
+            members = await self.db.smembers(collection_name)  # type: ignore[misc]
+            if members:
+                async with self.db.pipeline(transaction=True) as pipeline:
+                    pipeline.delete(
+                        *(f"{collection_name}:{item_id}" for item_id in members)
+                    )
+                    pipeline.srem("collections", collection_name)
+                    pipeline.delete(collection_name)
+                    await pipeline.execute()
+            await self.id_allocator.reset(collection_name)
+
+    async def all(self) -> dict:
+        return {
+            collection_name: sorted(
+                [item async for item in items], key=lambda item: item["id"]
+            )
+            async for collection_name, items in self.iter_all()
+        }
+
+    async def iter_all(self) -> AsyncIterator[tuple[str, AsyncIterator[dict]]]:
+        for collection_name in await self.db.smembers("collections"):  # type: ignore[misc]
+            yield collection_name, self.iter_items(collection_name)
+
+    async def reset(self) -> None:
+        await self.db.flushdb()
+        await self.id_allocator.reset()
+
+    async def close(self) -> None:
+        await self.db.aclose()
+
+    async def get_ids(self, collection_name: str) -> list[int | str]:
+        return [
+            int(item_id) if item_id.isdigit() else item_id
+            for item_id in await self.db.smembers(collection_name)  # type: ignore[misc]
+        ]
+
+    async def count(self, collection_name: str) -> int:
+        return await self.db.scard(collection_name)  # type: ignore[misc]
+
+    async def iter_items(
+        self, collection_name: str, fields: list[str] | None = None
+    ) -> AsyncIterator[dict]:
+        # SSCAN may return a member more than once
+        seen: set[str] = set()
+        batch: list[str] = []
+        async for item_id in self.db.sscan_iter(collection_name, count=self.batch_size):
+            if item_id not in seen:
+                seen.add(item_id)
+                batch.append(item_id)
+            if len(batch) == self.batch_size:
+                for item in await self.get_batch(collection_name, batch, fields):
+                    yield item
+                batch = []
+        for item in await self.get_batch(collection_name, batch, fields):
+            yield item
+
+    async def get_batch(
+        self, collection_name: str, item_ids: list[str], fields: list[str] | None = None
+    ) -> list[dict]:
+        async with self.db.pipeline(transaction=False) as pipeline:
+            for item_id in item_ids:
+                if fields:
+                    pipeline.hmget(f"{collection_name}:{item_id}", fields)
+                else:
+                    pipeline.hgetall(f"{collection_name}:{item_id}")
+            items = await pipeline.execute()
+        if fields:
+            items = [
+                {k: v for k, v in zip(fields, values) if v is not None}
+                for values in items
+            ]
+        return [{k: self.decode(v) for k, v in item.items()} for item in items if item]
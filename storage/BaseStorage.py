@@ -1,77 +1,80 @@
-import operator
-import re
 import uuid
 from abc import ABC, abstractmethod
+from collections.abc import Iterable, Iterator
+from contextlib import contextmanager
+
+from .IdAllocator import BaseIdAllocator, CounterIdAllocator
+from .Journal import Data, Journal
+from .query import (
+    Aggregation,
+    compile_where,
+    empty_aggregates,
+    only_counts,
+    paginate,
+    project,
+)
 
 
 class BaseStorage(ABC):
     def __init__(self, _: str | None = None, uuid_id: bool = False):
         self.primary_type = str if uuid_id else int
-
-        op_names = ["eq", "ge", "gt", "le", "lt", "ne"]
-        self.ops = {op_name: getattr(operator, op_name) for op_name in op_names}
-        self.ops.update(
-            {
-                "between": lambda item, collection: collection[0]
-                <= item
-                <= collection[-1],
-                "ilike": lambda string, pattern: re.search(
-                    pattern, str(string).lower()
-                ),
-                "like": lambda string, pattern: re.search(pattern, str(string)),
-                "startswith": lambda string, pattern: str(string).startswith(pattern),
-                "endswith": lambda string, pattern: str(string).endswith(pattern),
-                "notin": lambda item, collection: item not in collection,
-                "in": lambda item, collection: item in collection,
-                "gte": operator.ge,
-                "lte": operator.le,
-                "neq": operator.ne,
-                "not": operator.ne,
-                "=": operator.eq,
-            }
-        )
+        self.id_allocator: BaseIdAllocator = CounterIdAllocator(self.get_ids)
+        self.journal: Journal | None = None
+
+    @contextmanager
+    def logged(self, *record):
+        # A mutation and its journal record are atomic with respect to compaction
+        if self.journal is None:
+            yield
+            return
+        with self.journal.lock:
+            yield
+            self.journal.append(*record)
+            if self.journal.needs_compaction():
+                self.journal.compact(self.get_data())
+
+    # Raw {collection: {id: item}} data snapshotted by the journal
+    def get_data(self) -> Data:
+        raise NotImplementedError
 
     @abstractmethod
     def get_with_id(self, table_name: str, item_id: int | str) -> dict: ...
 
-    def fulfill_cond(self, item, parsed_param):
-        op_name, param_name, param_value = parsed_param
-        if param_value:
-            op = self.ops[op_name]
-        else:
+    def get_many(self, table_name: str, item_ids: list) -> list[dict]:
+        items = (self.get_with_id(table_name, item_id) for item_id in item_ids)
+        return [item for item in items if item]
 
-            def op(field, _):
-                return field is not None
-
-        return op(item.get(param_name), param_value)
+    def get_candidates(self, table_name: str, where_params: list) -> Iterable[dict]:
+        return self.get_items(table_name)
 
     def get_without_id(
         self, table_name: str, where_params: list, meta_params: dict
     ) -> list:
-        items = [
-            item
-            for item in self.get_items(table_name)
-            if all(self.fulfill_cond(item, param) for param in where_params)
-        ]
+        return list(self.iter_without_id(table_name, where_params, meta_params))
 
-        # Sorting, keep None-s and put them on the beginning of results
-        order_by = meta_params["order_by"]
-
-        def order_key(item):
-            return tuple(
-                [
-                    ((value := item.get(order_by_arg.lstrip("-"))) is not None, value)
-                    for order_by_arg in order_by
-                ]
-                + [item["id"]]
-            )
+    def iter_without_id(
+        self, table_name: str, where_params: list, meta_params: dict
+    ) -> Iterator[dict]:
+        predicate = compile_where(where_params)
+        items = (
+            item
+            for item in self.get_candidates(table_name, where_params)
+            if predicate(item)
+        )
+        return iter(project(paginate(items, meta_params), meta_params.get("_fields")))
 
-        desc = meta_params["desc"]
-        items = sorted(items, key=order_key, reverse=desc)
+    def count(self, table_name: str) -> int:
+        return len(self.get_ids(table_name))
 
-        offset = meta_params["_offset"]
-        limit = meta_params["_limit"] or len(items) - offset
-        return items[offset : offset + limit]
+    def aggregate(
+        self, table_name: str, where_params: list, aggregates: list, group_by: list
+    ) -> list[dict]:
+        if only_counts(where_params, aggregates, group_by):
+            return [{**empty_aggregates(aggregates), "count": self.count(table_name)}]
+        aggregation = Aggregation(aggregates, group_by)
+        meta_params = {"order_by": [], "desc": False, "_limit": 0, "_offset": 0}
+        aggregation.update(self.iter_without_id(table_name, where_params, meta_params))
+        return aggregation.rows()
 
     @abstractmethod
     def upsert(
@@ -89,8 +92,12 @@ class BaseStorage(ABC):
     @abstractmethod
     def delete_without_id(self, table_name: str, where_params: list) -> None: ...
 
+    def all(self) -> dict:
+        return {table_name: list(items) for table_name, items in self.iter_all()}
+
+    # Yields (table name, items) pairs, one table at a time
     @abstractmethod
-    def all(self): ...
+    def iter_all(self) -> Iterator[tuple[str, Iterable[dict]]]: ...
 
     @abstractmethod
     def reset(self) -> None: ...
@@ -105,27 +112,29 @@ class BaseStorage(ABC):
         item_id: int | str = data.get("id", "")
         if "id" not in data:
             if self.primary_type is int:
-                item_ids = self.get_ids(collection_name)
-                item_id = max(item_ids or [0]) + 1  # type: ignore[operator]
+                item_id = self.id_allocator.allocate(collection_name)
             elif self.primary_type is str:
                 item_id = str(uuid.uuid4())
             data["id"] = item_id
+        elif self.primary_type is int and isinstance(item_id, int):
+            self.id_allocator.observe(collection_name, item_id)
         return item_id
 
     def bulk_get_ids(self, collection_name: str, items: list[dict]) -> list[int | str]:
+        missing = [item for item in items if not item.get("id", "")]
         if self.primary_type is int:
-            item_ids = self.get_ids(collection_name)
-            cur_max = max(item_ids or {0}) + 1  # type: ignore[operator]
-        else:
-            cur_max = None
-        for item in items:
-            item_id = item.get("id", "")
-            if not item_id:
-                if self.primary_type is int:
-                    item_id = cur_max
-                    cur_max += 1  # type: ignore[operator]
-                elif self.primary_type is str:
-                    item_id = str(uuid.uuid4())
-                item["id"] = item_id
+            # Explicit IDs first, so the reserved range never overlaps them
+            explicit_ids = [
+                item["id"] for item in items if isinstance(item.get("id"), int)
+            ]
+            if explicit_ids:
+                self.id_allocator.observe(collection_name, max(explicit_ids))
+            if missing:
+                first_id = self.id_allocator.allocate(collection_name, len(missing))
+                for item_id, item in enumerate(missing, first_id):
+                    item["id"] = item_id
+        elif self.primary_type is str:
+            for item in missing:
+                item["id"] = str(uuid.uuid4())
         item_ids = [item["id"] for item in items]
         return item_ids
@@ -0,0 +1,92 @@
+import json
+import os
+from collections import OrderedDict
+
+import tinydb
+from tinydb.storages import Storage
+
+
+class CollectionFile(Storage):
+    # TinyDB storage for a single collection, parsed on first read and then
+    # kept in memory until unloaded, writes only rewrite this collection
+    def __init__(self, path: str):
+        self.path = path
+        self.data: dict | None = None
+
+    def read(self) -> dict | None:
+        if self.data is None and os.path.exists(self.path):
+            with open(self.path) as file:
+                self.data = json.load(file)
+        return self.data
+
+    def write(self, data: dict) -> None:
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as file:
+            json.dump(data, file)
+        os.replace(tmp_path, self.path)
+        self.data = data
+
+    def size(self) -> int:
+        return sum(map(len, (self.data or {}).values()))
+
+
+class CollectionFiles:
+    # Directory with one TinyDB file per collection, same interface as the parts
+    # of TinyDB used by FileStorage. Collections are loaded on first access and
+    # the least recently used ones are unloaded once more than `max_loaded`
+    # documents are held in memory, checked on every access
+    def __init__(self, path: str, max_loaded: int = 1_000_000):
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.max_loaded = max_loaded
+        self.loaded: OrderedDict[str, tinydb.TinyDB] = OrderedDict()
+
+    def get_path(self, name: str) -> str:
+        if not name or name.startswith(".") or os.sep in name or "/" in name:
+            raise ValueError(f"Invalid collection name {name}")
+        return os.path.join(self.path, f"{name}.json")
+
+    def table(self, name: str) -> tinydb.table.Table:
+        if name in self.loaded:
+            self.loaded.move_to_end(name)
+        else:
+            self.loaded[name] = tinydb.TinyDB(
+                self.get_path(name), storage=CollectionFile
+            )
+            self.loaded[name].storage.read()
+        self.unload(keep=name)
+        return self.loaded[name].table(name)
+
+    def unload(self, keep: str) -> None:
+        sizes = {name: db.storage.size() for name, db in self.loaded.items()}
+        loaded = sum(sizes.values())
+        for name in list(self.loaded):
+            if loaded <= self.max_loaded:
+                break
+            if name != keep:
+                # Already on disk, dropping it just frees the memory
+                self.loaded.pop(name).close()
+                loaded -= sizes[name]
+
+    def tables(self) -> list[str]:
+        return sorted(
+            file_name.removesuffix(".json")
+            for file_name in os.listdir(self.path)
+            if file_name.endswith(".json")
+        )
+
+    def drop_table(self, name: str) -> None:
+        if name in self.loaded:
+            self.loaded.pop(name).close()
+        path = self.get_path(name)
+        if os.path.exists(path):
+            os.remove(path)
+
+    def drop_tables(self) -> None:
+        for name in self.tables():
+            self.drop_table(name)
+
+    def close(self) -> None:
+        for db in self.loaded.values():
+            db.close()
+        self.loaded.clear()
@@ -0,0 +1,578 @@
+import operator
+from collections.abc import Callable, Iterable, Iterator
+from itertools import compress, repeat
+from typing import Any, ClassVar
+
+import numpy as np
+
+from .BaseStorage import BaseStorage
+from .query import (
+    Aggregation,
+    Predicate,
+    get_aggregate_name,
+    get_predicate,
+    paginate,
+    project,
+)
+
+int64_min, int64_max = -(2**63), 2**63 - 1
+
+
+def get_kind(value) -> str:
+    if isinstance(value, bool):
+        return "bool"
+    if isinstance(value, int):
+        return "int" if int64_min <= value <= int64_max else "object"
+    if isinstance(value, float):
+        return "float"
+    if isinstance(value, str):
+        return "str"
+    return "object"
+
+
+def is_number(value) -> bool:
+    return get_kind(value) in {"bool", "int", "float"}
+
+
+def evaluate(predicate: Predicate, item: dict) -> bool:
+    # Values that can't be compared don't match, instead of failing the query
+    try:
+        return bool(predicate(item))
+    except TypeError:
+        return False
+
+
+def compare(op: Callable) -> Callable[[np.ndarray, Any], np.ndarray | None]:
+    return lambda values, value: op(values, value) if is_number(value) else None
+
+
+def between(values: np.ndarray, bounds) -> np.ndarray | None:
+    if not isinstance(bounds, list) or not all(map(is_number, bounds)):
+        return None
+    return (values >= bounds[0]) & (values <= bounds[-1])
+
+
+def is_in(values: np.ndarray, collection) -> np.ndarray | None:
+    if not isinstance(collection, list):
+        return None
+    # Other types are never equal to numbers
+    return np.isin(values, [value for value in collection if is_number(value)])
+
+
+def not_in(values: np.ndarray, collection) -> np.ndarray | None:
+    result = is_in(values, collection)
+    return None if result is None else ~result
+
+
+# Filters run as array operations on typed columns, the rest per value
+vector_ops: dict[str, Callable[[np.ndarray, Any], np.ndarray | None]] = {
+    "=": compare(operator.eq),
+    "eq": compare(operator.eq),
+    "ne": compare(operator.ne),
+    "neq": compare(operator.ne),
+    "not": compare(operator.ne),
+    "ge": compare(operator.ge),
+    "gte": compare(operator.ge),
+    "gt": compare(operator.gt),
+    "le": compare(operator.le),
+    "lte": compare(operator.le),
+    "lt": compare(operator.lt),
+    "between": between,
+    "in": is_in,
+    "notin": not_in,
+}
+
+
+class Column:
+    # Values of a single field with a mask of rows holding a value. The array is
+    # typed while all values share a type, strings are dictionary encoded and
+    # mixed types fall back to an object array
+    dtypes: ClassVar[dict[str, Any]] = {
+        "bool": bool,
+        "int": np.int64,
+        "float": np.float64,
+        "str": np.int32,
+    }
+    kinds: ClassVar[dict[type, str]] = {
+        bool: "bool",
+        int: "int",
+        float: "float",
+        str: "str",
+    }
+
+    def __init__(self, capacity: int):
+        self.kind: str | None = None
+        self.values = np.zeros(0)
+        self.valid = np.zeros(capacity, bool)
+        # Rows where the field is set to None, allocated on first use
+        self.nulls: np.ndarray | None = None
+        self.categories: list[str] = []
+        self.codes: dict[str, int] = {}
+
+    def grow(self, capacity: int) -> None:
+        for name in ["values", "valid", "nulls"]:
+            array = getattr(self, name)
+            if array is not None and len(array):
+                grown = np.zeros(capacity, array.dtype)
+                grown[: len(array)] = array
+                setattr(self, name, grown)
+
+    def set(self, row: int, value) -> None:
+        if value is None:
+            if self.nulls is None:
+                self.nulls = np.zeros(len(self.valid), bool)
+            self.nulls[row] = True
+            self.valid[row] = False
+            return
+        if self.nulls is not None:
+            self.nulls[row] = False
+        kind = get_kind(value)
+        if self.kind is None:
+            self.kind = kind
+            self.values = np.zeros(len(self.valid), self.dtypes.get(kind, object))
+        elif kind != self.kind and self.kind != "object":
+            self.to_object()
+        if self.kind == "str":
+            self.values[row] = self.encode(value)
+        else:
+            self.values[row] = value
+        self.valid[row] = True
+
+    def encode(self, value: str) -> int:
+        code = self.codes.get(value)
+        if code is None:
+            code = self.codes[value] = len(self.categories)
+            self.categories.append(value)
+        return code
+
+    def set_many(self, rows: np.ndarray, values: list) -> None:
+        kinds = {
+            self.kinds.get(value_type, "object")
+            for value_type in set(map(type, values))
+        }
+        if self.kind is not None:
+            kinds.add(self.kind)
+        try:
+            if len(kinds) != 1 or kinds == {"object"}:
+                raise TypeError
+            (kind,) = kinds
+            if kind == "str":
+                values = list(map(self.encode, values))
+            array = np.array(values, self.dtypes[kind])
+        except (TypeError, OverflowError):
+            # Mixed types, None-s or integers over 64 bits
+            for row, value in zip(rows.tolist(), values):
+                self.set(row, value)
+            return
+        if self.kind is None:
+            self.kind = kind
+            self.values = np.zeros(len(self.valid), self.dtypes[kind])
+        self.values[rows] = array
+        self.valid[rows] = True
+        if self.nulls is not None:
+            self.nulls[rows] = False
+
+    def clear(self, row: int) -> None:
+        self.valid[row] = False
+        if self.nulls is not None:
+            self.nulls[row] = False
+
+    def to_object(self) -> None:
+        values = np.empty(len(self.valid), object)
+        rows = np.flatnonzero(self.valid)
+        for row, value in zip(rows.tolist(), self.get_list(rows)):
+            values[row] = value
+        self.kind, self.values = "object", values
+        self.categories, self.codes = [], {}
+
+    def get_list(self, rows: np.ndarray) -> list:
+        values = self.values[rows].tolist()
+        if self.kind == "str":
+            return list(map(self.categories.__getitem__, values))
+        return values
+
+    def match(
+        self,
+        op_name: str,
+        field: str,
+        value,
+        predicate: Predicate,
+        candidates: np.ndarray,
+    ) -> np.ndarray:
+        # Only meaningful for the rows holding a value, values are checked one by
+        # one only for the candidate rows
+        size = len(candidates)
+        values = self.values[:size]
+        if self.kind == "str":
+            # Each distinct string is checked once
+            lookup = [evaluate(predicate, {field: value}) for value in self.categories]
+            return np.array(lookup, bool)[values]
+        vector_op = vector_ops.get(op_name)
+        if vector_op is not None and self.kind != "object":
+            result = vector_op(values, value)
+            if result is not None:
+                return result
+        result = np.zeros(size, bool)
+        positions = np.flatnonzero(candidates)
+        if vector_op is not None and self.kind == "object":
+            try:
+                matched = vector_op(self.values[positions], value)
+                if matched is not None:
+                    result[positions] = matched
+                    return result
+            except TypeError:
+                ...
+        result[positions] = [
+            evaluate(predicate, {field: value}) for value in self.get_list(positions)
+        ]
+        return result
+
+    def sort_key(self, rows: np.ndarray) -> np.ndarray:
+        values = self.values[rows]
+        if self.kind == "str":
+            ranks = np.empty(len(self.categories), np.int64)
+            ranks[
+                sorted(range(len(self.categories)), key=self.categories.__getitem__)
+            ] = np.arange(len(self.categories))
+            values = ranks[values]
+        return np.where(self.valid[rows], values, 0)
+
+
+class ColumnarCollection:
+    def __init__(self, capacity: int = 1024):
+        self.capacity = capacity
+        # Rows in insertion order, deleted ones stay until compacted
+        self.size = 0
+        self.deleted = 0
+        self.alive = np.zeros(capacity, bool)
+        self.rows: dict[int | str, int] = {}
+        self.columns: dict[str, Column] = {}
+
+    def get_column(self, field: str) -> Column:
+        column = self.columns.get(field)
+        if column is None:
+            column = self.columns[field] = Column(self.capacity)
+        return column
+
+    def upsert(self, item_id: int | str, data: dict, method: str = "POST") -> None:
+        row = self.rows.get(item_id)
+        if row is None:
+            if self.size == self.capacity:
+                self.grow(self.capacity * 2)
+            row = self.rows[item_id] = self.size
+            self.alive[row] = True
+            self.size += 1
+        elif method == "PUT":
+            for column in self.columns.values():
+                column.clear(row)
+        for field, value in data.items():
+            self.get_column(field).set(row, value)
+
+    def append(self, item_ids: list[int | str], items: list[dict]) -> None:
+        start, end = self.size, self.size + len(items)
+        if end > self.capacity:
+            self.grow(max(end, self.capacity * 2))
+        self.rows.update(zip(item_ids, range(start, end)))
+        self.alive[start:end] = True
+        self.size = end
+        absent = object()
+        for field in dict.fromkeys(field for item in items for field in item):
+            values = [item.get(field, absent) for item in items]
+            rows = np.arange(start, end)
+            if absent in values:
+                present = [value is not absent for value in values]
+                rows = rows[present]
+                values = list(compress(values, present))
+            self.get_column(field).set_many(rows, values)
+
+    def grow(self, capacity: int) -> None:
+        alive = np.zeros(capacity, bool)
+        alive[: self.size] = self.alive[: self.size]
+        self.alive, self.capacity = alive, capacity
+        for column in self.columns.values():
+            column.grow(capacity)
+
+    def remove(self, item_ids: Iterable[int | str]) -> int:
+        removed = 0
+        for item_id in item_ids:
+            row = self.rows.pop(item_id, None)
+            if row is not None:
+                self.alive[row] = False
+                for column in self.columns.values():
+                    column.clear(row)
+                removed += 1
+        self.deleted += removed
+        if self.deleted > max(1024, self.size // 2):
+            self.compact()
+        return removed
+
+    def compact(self) -> None:
+        keep = np.flatnonzero(self.alive[: self.size])
+        positions = np.zeros(self.size, np.int64)
+        positions[keep] = np.arange(len(keep))
+        self.rows = {item_id: int(positions[row]) for item_id, row in self.rows.items()}
+        capacity = max(1024, len(keep))
+        for column in self.columns.values():
+            for name in ["values", "valid", "nulls"]:
+                array = getattr(column, name)
+                if array is not None and len(array):
+                    compacted = np.zeros(capacity, array.dtype)
+                    compacted[: len(keep)] = array[keep]
+                    setattr(column, name, compacted)
+        self.alive = np.zeros(capacity, bool)
+        self.alive[: len(keep)] = True
+        self.size, self.deleted, self.capacity = len(keep), 0, capacity
+
+    def mask(self, where_params: list) -> np.ndarray:
+        mask = self.alive[: self.size].copy()
+        for op_name, field, value in where_params:
+            predicate = get_predicate(op_name, field, value)
+            # Result for rows where the field is missing or None
+            missing = evaluate(predicate, {})
+            column = self.columns.get(field)
+            if column is None or column.kind is None:
+                if not missing:
+                    mask[:] = False
+                continue
+            valid = column.valid[: self.size]
+            if not value:
+                # Blank params only check that the field is set
+                mask &= valid
+                continue
+            matched = column.match(op_name, field, value, predicate, valid & mask)
+            mask &= np.where(valid, matched, missing)
+        return mask
+
+    def sortable(self, fields: list[str]) -> bool:
+        return all(
+            field not in self.columns or self.columns[field].kind != "object"
+            for field in fields
+        )
+
+    def order(self, rows: np.ndarray, fields: list[str], desc: bool) -> np.ndarray:
+        # Same order as query.get_order_key, None-s first and then by id
+        keys = []
+        for field in fields:
+            column = self.columns.get(field)
+            if column is not None and column.kind is not None:
+                keys += [column.valid[rows], column.sort_key(rows)]
+        keys.append(self.columns["id"].sort_key(rows))
+        order = np.lexsort(keys[::-1])
+        return rows[order[::-1] if desc else order]
+
+    def items(self, rows: np.ndarray, fields: list[str] | None = None) -> list[dict]:
+        selected = self.columns
+        if fields is not None:
+            # Only the columns of the requested fields are read
+            selected = {
+                field: self.columns[field] for field in fields if field in self.columns
+            }
+        columns = {
+            field: column
+            for field, column in selected.items()
+            if column.valid[rows].any()
+            or (column.nulls is not None and column.nulls[rows].any())
+        }
+        if all(column.valid[rows].all() for column in columns.values()):
+            # Every field is set in every row, rows are zipped from the columns
+            values = [column.get_list(rows) for column in columns.values()]
+            return list(map(dict, map(zip, repeat(list(columns)), zip(*values))))
+        items: list[dict] = [{} for _ in range(len(rows))]
+        for field, column in columns.items():
+            if column.kind is not None:
+                positions = np.flatnonzero(column.valid[rows])
+                values = column.get_list(rows[positions])
+                for position, value in zip(positions.tolist(), values):
+                    items[position][field] = value
+            if column.nulls is not None:
+                for position in np.flatnonzero(column.nulls[rows]).tolist():
+                    items[position][field] = None
+        return items
+
+    def all_rows(self) -> np.ndarray:
+        return np.flatnonzero(self.alive[: self.size])
+
+    def get_values(self, rows: np.ndarray, field: str) -> list:
+        # Values of one field, None where it's missing
+        column = self.columns.get(field)
+        if column is None or column.kind is None:
+            return [None] * len(rows)
+        valid = column.valid[rows]
+        if valid.all():
+            return column.get_list(rows)
+        values: list = [None] * len(rows)
+        positions = np.flatnonzero(valid)
+        for position, value in zip(
+            positions.tolist(), column.get_list(rows[positions])
+        ):
+            values[position] = value
+        return values
+
+    def aggregate(self, rows: np.ndarray, function: str, field: str | None):
+        if function == "count":
+            return len(rows)
+        assert field is not None
+        column = self.columns.get(field)
+        if column is not None and column.kind in {"int", "float"}:
+            values = column.values[rows[column.valid[rows]]]
+            if function in {"sum", "avg"}:
+                if column.kind == "int" and len(values):
+                    # Python ints don't overflow, int64 sums might
+                    bound = max(abs(int(values.min())), abs(int(values.max())))
+                    total = (
+                        int(values.sum())
+                        if bound * len(values) <= int64_max
+                        else sum(values.tolist())
+                    )
+                else:
+                    total = values.sum().item()
+                if function == "sum":
+                    return total
+                return total / len(values) if len(values) else None
+            if not len(values):
+                return None
+            return (values.min() if function == "min" else values.max()).item()
+        # Other kinds are aggregated value by value, like in the other storages
+        aggregation = Aggregation([(function, field)], [])
+        aggregation.update({field: value} for value in self.get_values(rows, field))
+        return aggregation.rows()[0][get_aggregate_name(function, field)]
+
+
+class ColumnarStorage(BaseStorage):
+    def __init__(self, uuid_id: bool = False):
+        super().__init__(None, uuid_id)
+        self.db: dict[str, ColumnarCollection] = {}
+
+    def get_with_id(self, collection_name: str, item_id: int | str) -> dict:
+        collection = self.db.get(collection_name)
+        if collection is None or item_id not in collection.rows:
+            return {}
+        return collection.items(np.array([collection.rows[item_id]]))[0]
+
+    def get_many(self, collection_name: str, item_ids: list) -> list[dict]:
+        collection = self.db.get(collection_name)
+        if collection is None:
+            return []
+        rows = [
+            collection.rows[item_id]
+            for item_id in item_ids
+            if item_id in collection.rows
+        ]
+        return collection.items(np.array(rows, np.int64))
+
+    def get_without_id(
+        self, collection_name: str, where_params: list, meta_params: dict
+    ) -> list:
+        collection = self.db.get(collection_name)
+        if collection is None:
+            return []
+        rows = np.flatnonzero(collection.mask(where_params))
+        order_by = [
+            order_by_arg.lstrip("-") for order_by_arg in meta_params["order_by"]
+        ]
+        if meta_params.get("_after") is not None or not collection.sortable(
+            order_by + ["id"]
+        ):
+            items = paginate(collection.items(rows), meta_params)
+            return list(project(items, meta_params.get("_fields")))
+        if order_by:
+            rows = collection.order(rows, order_by, meta_params["desc"])
+        offset = meta_params["_offset"]
+        limit = meta_params["_limit"]
+        return collection.items(
+            rows[offset : offset + limit if limit else None], meta_params.get("_fields")
+        )
+
+    def iter_without_id(
+        self, collection_name: str, where_params: list, meta_params: dict
+    ) -> Iterator[dict]:
+        return iter(self.get_without_id(collection_name, where_params, meta_params))
+
+    def count(self, collection_name: str) -> int:
+        collection = self.db.get(collection_name)
+        return 0 if collection is None else len(collection.rows)
+
+    def aggregate(
+        self,
+        collection_name: str,
+        where_params: list,
+        aggregates: list,
+        group_by: list,
+    ) -> list[dict]:
+        collection = self.db.get(collection_name)
+        if collection is None:
+            return super().aggregate(
+                collection_name, where_params, aggregates, group_by
+            )
+        rows = np.flatnonzero(collection.mask(where_params))
+        if not group_by:
+            # Each aggregate is computed over its column alone
+            return [
+                {
+                    get_aggregate_name(function, field): collection.aggregate(
+                        rows, function, field
+                    )
+                    for function, field in aggregates
+                }
+            ]
+        # Groups only need the grouped and aggregated fields, not whole items
+        fields = list(
+            dict.fromkeys(group_by + [field for _, field in aggregates if field])
+        )
+        aggregation = Aggregation(aggregates, group_by)
+        columns = [collection.get_values(rows, field) for field in fields]
+        aggregation.update(dict(zip(fields, values)) for values in zip(*columns))
+        return aggregation.rows()
+
+    def upsert(
+        self, collection_name: str, data: dict, method: str = "POST"
+    ) -> int | str:
+        item_id = self.get_id(collection_name, data)
+        collection = self.db.setdefault(collection_name, ColumnarCollection())
+        collection.upsert(item_id, data, method)
+        return item_id
+
+    def bulk_upsert(
+        self, collection_name: str, items: list[dict], method: str = "POST"
+    ) -> list[int | str]:
+        item_ids = self.bulk_get_ids(collection_name, items)
+        collection = self.db.setdefault(collection_name, ColumnarCollection())
+        if len(set(item_ids)) == len(item_ids) and collection.rows.keys().isdisjoint(
+            item_ids
+        ):
+            # Only new items, appended a column at a time
+            collection.append(item_ids, items)
+            return item_ids
+        for item_id, item in zip(item_ids, items):
+            collection.upsert(item_id, item, method)
+        return item_ids
+
+    def delete_with_id(self, collection_name: str, item_id: int | str) -> bool:
+        collection = self.db.get(collection_name)
+        return collection is not None and bool(collection.remove([item_id]))
+
+    def delete_without_id(self, collection_name: str, where_params: list) -> None:
+        if where_params:
+            collection = self.db.get(collection_name)
+            if collection is not None:
+                rows = np.flatnonzero(collection.mask(where_params))
+                collection.remove(collection.columns["id"].get_list(rows))
+        else:
+            self.db.pop(collection_name, None)
+            self.id_allocator.reset(collection_name)
+
+    def iter_all(self) -> Iterator[tuple[str, Iterable[dict]]]:
+        for collection_name, collection in list(self.db.items()):
+            yield collection_name, collection.items(collection.all_rows())
+
+    def reset(self) -> None:
+        self.db = {}
+        self.id_allocator.reset()
+
+    def get_ids(self, collection_name: str) -> list[int | str]:
+        collection = self.db.get(collection_name)
+        return [] if collection is None else list(collection.rows)
+
+    def get_items(self, collection_name: str) -> list[dict]:
+        collection = self.db.get(collection_name)
+        return [] if collection is None else collection.items(collection.all_rows())
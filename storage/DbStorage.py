@@ -1,9 +1,16 @@
 import uuid
+from collections.abc import Iterable, Iterator
 
 import dataset  # type: ignore[import-untyped]
+from dataset.util import ResultIter  # type: ignore[import-untyped]
+from sqlalchemy import and_, false, func, null, or_, select  # type: ignore[import-untyped]
+
+from .query import empty_aggregates, get_aggregate_name, only_counts, order_by_ids
 
 
 class DbStorage:
+    max_params = 500
+
     def __init__(
         self, storage_path: str | None = "sqlite:///:memory:", uuid_id: bool = False
     ):
@@ -14,24 +21,138 @@ class DbStorage:
         table = self.db.get_table(table_name, primary_type=self.primary_type)
         return table.find_one(id=item_id)
 
+    def get_many(self, table_name: str, item_ids: list) -> list[dict]:
+        table = self.db.get_table(table_name, primary_type=self.primary_type)
+        items = []
+        # Batches stay below the bound parameter limits of the databases
+        for i in range(0, len(item_ids), self.max_params):
+            items += table.find(id={"in": item_ids[i : i + self.max_params]})
+        return order_by_ids(items, item_ids)
+
     def get_without_id(
         self, table_name: str, where_params_list: list, meta_params: dict
     ) -> list:
+        return list(self.iter_without_id(table_name, where_params_list, meta_params))
+
+    def iter_without_id(
+        self, table_name: str, where_params_list: list, meta_params: dict
+    ) -> Iterator[dict]:
         table = self.db.get_table(table_name, primary_type=self.primary_type)
         where_params_dict = {
             param_name: ({op_name: param_value} if param_value else {"not": None})
             for op_name, param_name, param_value in where_params_list
         }
-        if meta_params.pop("desc", False):
-            meta_params["order_by"] = [
-                "-" + order_by_arg.lstrip("-")
-                for order_by_arg in meta_params["order_by"]
-            ]
+        desc = meta_params.pop("desc", False)
+        after = meta_params.pop("_after", None)
+        fields = meta_params.pop("_fields", None)
+        order_by = [
+            order_by_arg.lstrip("-") for order_by_arg in meta_params["order_by"]
+        ]
+        clauses = []
+        if after is not None:
+            clauses.append(self.get_after_clause(table, order_by, desc, after))
+        # Ties are broken by id, same as in the other storages
+        if order_by or after is not None:
+            order_by += ["id"]
+        meta_params["order_by"] = [
+            ("-" if desc else "") + order_by_arg for order_by_arg in order_by
+        ]
         if not meta_params["_limit"]:
             meta_params.pop("_limit", None)
         params = {**where_params_dict, **meta_params}
-        items = list(table.find(**params))
-        return items
+        if fields:
+            return self.find_columns(table, fields, clauses, params)
+        # Server-side cursor, rows are fetched in batches while being consumed
+        return table.find(*clauses, _streamed=True, **params)
+
+    def find_columns(
+        self, table, fields: list[str], clauses: list, params: dict
+    ) -> Iterator[dict]:
+        # table.find(_streamed=True) selecting only the columns of the fields
+        if not table.exists:
+            return iter([])
+        limit = params.pop("_limit", None)
+        offset = params.pop("_offset", 0)
+        orderings = table._args_to_order_by(params.pop("order_by", None))
+        columns = [table.table.c[field] for field in fields if table.has_column(field)]
+        statement = (
+            select(*columns)
+            .where(table._args_to_clause(params, clauses=clauses))
+            .limit(limit)
+            .offset(offset)
+            .order_by(*orderings)
+        )
+        connection = self.db.engine.connect().execution_options(stream_results=True)
+        return ResultIter(
+            connection.execute(statement),
+            row_type=self.db.row_type,
+            connection=connection,
+        )
+
+    def get_after_clause(self, table, order_by: list[str], desc: bool, after: list):
+        # (order_by..., id) > cursor as a range predicate, NULLs sort first
+        branches, equal = [], []
+        for field, value in zip([*order_by, "id"], after):
+            column = table.table.c[field] if table.has_column(field) else null()
+            if value is None:
+                branches.append(and_(*equal, false() if desc else column.is_not(None)))
+                equal.append(column.is_(None))
+            else:
+                beyond = (
+                    or_(column < value, column.is_(None)) if desc else column > value
+                )
+                branches.append(and_(*equal, beyond))
+                equal.append(column == value)
+        return or_(*branches)
+
+    def count(self, table_name: str) -> int:
+        table = self.db.get_table(table_name, primary_type=self.primary_type)
+        return table.count()
+
+    def aggregate(
+        self,
+        table_name: str,
+        where_params_list: list,
+        aggregates: list,
+        group_by: list,
+    ) -> list[dict]:
+        if only_counts(where_params_list, aggregates, group_by):
+            return [{**empty_aggregates(aggregates), "count": self.count(table_name)}]
+        table = self.db.get_table(table_name, primary_type=self.primary_type)
+        # table.table would create a missing table
+        if not table.exists:
+            return [] if group_by else [empty_aggregates(aggregates)]
+        where_params_dict = {
+            param_name: ({op_name: param_value} if param_value else {"not": None})
+            for op_name, param_name, param_value in where_params_list
+        }
+
+        def get_column(field: str):
+            return table.table.c[field] if table.has_column(field) else null()
+
+        # Missing columns are a single NULL group, so only real ones are grouped
+        group_columns = [
+            table.table.c[field] for field in group_by if table.has_column(field)
+        ]
+        columns = [get_column(field).label(field) for field in group_by]
+        for function, field in aggregates:
+            if function == "count":
+                column = func.count()
+            elif function == "sum":
+                column = func.coalesce(func.sum(get_column(field)), 0)
+            else:
+                column = getattr(func, function)(get_column(field))
+            columns.append(column.label(get_aggregate_name(function, field)))
+        statement = (
+            select(*columns)
+            .select_from(table.table)
+            .where(table._args_to_clause(where_params_dict))
+            .group_by(*group_columns)
+        )
+        if group_by:
+            # Without real group columns SQL returns a row even when none match
+            statement = statement.having(func.count() > 0)
+        return list(self.db.query(statement))
 
     def upsert(self, table_name: str, data: dict, method: str = "POST") -> int | str:
         table = self.db.get_table(table_name, primary_type=self.primary_type)
@@ -48,18 +169,92 @@ class DbStorage:
         self, table_name: str, items: list[dict], method: str = "POST"
     ) -> list[int | str]:
         table = self.db.get_table(table_name, primary_type=self.primary_type)
+        for item in items:
+            # A blank id (e.g. an empty CSV cell) is a new row, like a missing one
+            if "id" in item and not item["id"]:
+                del item["id"]
         if self.primary_type is self.db.types.string:
             for item in items:
                 item.setdefault("id", str(uuid.uuid4()))
-        if method == "PUT":
-            item_ids = [item["id"] for item in items if "id" in items]
-            table.delete(id={"in": item_ids})
-        upserted_ids = [table.upsert(item, ["id"], ensure=True) for item in items]
-        item_ids = [item.get("id") for item in items]
-        return [
-            item_id if upserted_id is True else upserted_id
-            for upserted_id, item_id in zip(upserted_ids, item_ids)
-        ]
+        if not items:
+            return []
+        # Schema evolves once per batch, from the union of all columns
+        sample: dict = {}
+        for item in items:
+            for key, value in item.items():
+                if sample.get(key) is None:
+                    sample[key] = value
+        table._sync_columns(sample, ensure=True)
+
+        # A batch can't touch the same row twice, repeated ids are merged like
+        # consecutive upserts would be
+        rows_by_id: dict = {}
+        new_rows = []
+        for item in items:
+            if "id" in item:
+                rows_by_id[item["id"]] = {**rows_by_id.get(item["id"], {}), **item}
+            else:
+                new_rows.append(item)
+        # Rows are grouped by their columns, so each group is one executemany
+        groups: dict[tuple[bool, tuple], list[dict]] = {}
+        for row in [*rows_by_id.values(), *new_rows]:
+            groups.setdefault(("id" in row, tuple(row)), []).append(row)
+        with self.db:
+            if method == "PUT":
+                item_ids = [item["id"] for item in items if "id" in item]
+                table.delete(id={"in": item_ids})
+            for (has_id, columns), rows in groups.items():
+                if has_id:
+                    self.upsert_rows(table, columns, rows)
+                else:
+                    self.insert_rows(table, rows)
+        return [item["id"] for item in items]
+
+    def upsert_rows(self, table, columns: tuple, rows: list[dict]) -> None:
+        dialect = self.db.engine.dialect.name
+        if dialect in {"sqlite", "postgresql"}:
+            if dialect == "sqlite":
+                from sqlalchemy.dialects.sqlite import insert
+            else:
+                from sqlalchemy.dialects.postgresql import insert
+            statement = insert(table.table)
+            updates = {
+                column: statement.excluded[column]
+                for column in columns
+                if column != "id"
+            }
+            if updates:
+                statement = statement.on_conflict_do_update(
+                    index_elements=["id"], set_=updates
+                )
+            else:
+                statement = statement.on_conflict_do_nothing(index_elements=["id"])
+        elif dialect in {"mysql", "mariadb"}:
+            from sqlalchemy.dialects.mysql import insert
+
+            statement = insert(table.table)
+            statement = statement.on_duplicate_key_update(
+                {column: statement.inserted[column] for column in columns}
+            )
+        else:
+            for row in rows:
+                table.upsert(row, ["id"])
+            return
+        self.db.executable.execute(statement, rows)
+
+    def insert_rows(self, table, rows: list[dict]) -> None:
+        # Generated ids are read back in the order of the rows
+        dialect = self.db.engine.dialect
+        if dialect.insert_executemany_returning_sort_by_parameter_order:
+            statement = table.table.insert().returning(
+                table.table.c.id, sort_by_parameter_order=True
+            )
+            result = self.db.executable.execute(statement, rows)
+            for row, item_id in zip(rows, result.scalars()):
+                row["id"] = item_id
+        else:
+            for row in rows:
+                row["id"] = table.insert(row)
 
     def delete_with_id(self, table_name: str, item_id: int | str) -> bool:
         table = self.db.get_table(table_name, primary_type=self.primary_type)
@@ -77,10 +272,15 @@ class DbStorage:
             table.drop()
 
     def all(self) -> dict:
-        return {
-            table_name: list(self.db[table_name].all()) for table_name in self.db.tables
-        }
+        return {table_name: list(items) for table_name, items in self.iter_all()}
+
+    def iter_all(self) -> Iterator[tuple[str, Iterable[dict]]]:
+        for table_name in self.db.tables:
+            yield table_name, self.db[table_name].find(_streamed=True)
 
     def reset(self) -> None:
         for table in self.db.tables:
             self.db[table].drop()
+
+    def close(self) -> None:
+        self.db.close()
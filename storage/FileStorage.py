@@ -1,29 +1,78 @@
+from collections.abc import Iterable, Iterator
+
 import tinydb
 
 from .BaseStorage import BaseStorage
+from .CollectionFiles import CollectionFiles
+from .Journal import Data, Journal
+from .query import compile_where, paginate, project
 
 
 class FileStorage(BaseStorage):
-    def __init__(self, storage_path: str | None = None, uuid_id: bool = False):
+    def __init__(
+        self,
+        storage_path: str | None = None,
+        uuid_id: bool = False,
+        journal: bool = False,
+        flush: str = "write",
+        flush_interval_ms: int = 100,
+        compact_size: int = 64 * 2**20,
+        per_collection: bool = False,
+        max_loaded: int = 1_000_000,
+    ):
         super().__init__(storage_path, uuid_id)
-        if storage_path:
+        self.db: tinydb.TinyDB | CollectionFiles
+        if storage_path and per_collection:
+            if journal:
+                raise ValueError("Journal isn't supported with per collection files")
+            # storage_path is a directory with a file per collection
+            self.db = CollectionFiles(storage_path, max_loaded)
+        elif storage_path and journal:
+            # Served from memory, writes are appended to a journal instead of
+            # rewriting the whole file
+            self.journal = Journal(storage_path, flush, flush_interval_ms, compact_size)
+            self.db = tinydb.TinyDB(storage=tinydb.storages.MemoryStorage)
+            self.db.storage.write(self.journal.recover())  # type: ignore[union-attr]
+        elif storage_path:
             self.db = tinydb.TinyDB(storage_path)
         else:
             self.db = tinydb.TinyDB(storage=tinydb.storages.MemoryStorage)
 
+    def get_data(self) -> Data:
+        return self.db.storage.read() or {}  # type: ignore[union-attr]
+
     def get_with_id(self, table_name: str, item_id: int | str) -> dict:
         table = self.get_table(table_name)
         return table.get(doc_id=item_id)
 
+    def get_many(self, table_name: str, item_ids: list) -> list[dict]:
+        # One read of the table for the whole batch
+        documents = self.get_table(table_name)._read_table()
+        return [dict(documents[key]) for key in map(str, item_ids) if key in documents]
+
+    def iter_without_id(
+        self, table_name: str, where_params: list, meta_params: dict
+    ) -> Iterator[dict]:
+        fields = meta_params.get("_fields")
+        if not fields:
+            return super().iter_without_id(table_name, where_params, meta_params)
+        # Documents are read in place instead of copied, only the projected
+        # fields are copied out
+        predicate = compile_where(where_params)
+        documents = self.get_table(table_name)._read_table().values()
+        items = filter(predicate, documents)
+        return iter(project(paginate(items, meta_params), fields))
+
     def upsert(self, table_name: str, data: dict, method: str = "POST") -> int | str:
         item_id = self.get_id(table_name, data)
         table = self.get_table(table_name)
-        if method == "PUT":
-            try:
-                table.remove(doc_ids=[item_id])
-            except KeyError:
-                ...
-        table.upsert(tinydb.table.Document(data, doc_id=item_id))  # type: ignore[arg-type]
+        with self.logged("upsert", table_name, method, [data]):
+            if method == "PUT":
+                try:
+                    table.remove(doc_ids=[item_id])
+                except KeyError:
+                    ...
+            table.upsert(tinydb.table.Document(data, doc_id=item_id))  # type: ignore[arg-type]
         return item_id
 
     def bulk_upsert(
@@ -31,52 +80,64 @@ class FileStorage(BaseStorage):
     ) -> list[int | str]:
         table = self.get_table(table_name)
         self.bulk_get_ids(table_name, items)
-        item_ids = set(self.get_ids(table_name))
-        table.update_multiple(
-            [
-                (item, tinydb.where("id") == item["id"])
-                for item in items
-                if item["id"] in item_ids
-            ]
-        )
-        table.insert_multiple(
-            [
-                tinydb.table.Document(item, doc_id=item["id"])
-                for item in items
-                if item["id"] not in item_ids
-            ]
-        )
+
+        def update(docs: dict) -> None:
+            # Keyed by doc_id, so each affected document is touched once
+            for item in items:
+                if method == "PUT":
+                    docs.pop(item["id"], None)
+                docs[item["id"]] = {**docs.get(item["id"], {}), **item}
+
+        with self.logged("upsert", table_name, method, items):
+            # A single read and write of the table for the whole batch
+            table._update_table(update)
         return [item["id"] for item in items]
 
     def delete_with_id(self, table_name: str, doc_id: int | str) -> bool:
         table = self.get_table(table_name)
-        try:
-            return bool(table.remove(doc_ids=[doc_id]))
-        except KeyError:
-            return False
+        with self.logged("remove", table_name, [doc_id]):
+            try:
+                return bool(table.remove(doc_ids=[doc_id]))
+            except KeyError:
+                return False
 
     def delete_without_id(self, table_name: str, where_params: list) -> None:
         if where_params:
+            predicate = compile_where(where_params)
             doc_ids = [
                 item["id"]
                 for item in self.get_table(table_name).all()
-                if all(self.fulfill_cond(item, param) for param in where_params)
+                if predicate(item)
             ]
-            self.get_table(table_name).remove(doc_ids=doc_ids)
+            with self.logged("remove", table_name, doc_ids):
+                self.get_table(table_name).remove(doc_ids=doc_ids)
         else:
-            self.db.drop_table(table_name)
+            with self.logged("drop", table_name):
+                self.db.drop_table(table_name)
+            self.id_allocator.reset(table_name)
 
-    def all(self) -> dict:
-        return {
-            table_name: self.get_table(table_name).all()
-            for table_name in self.db.tables()
-        }
+    def iter_all(self) -> Iterator[tuple[str, Iterable[dict]]]:
+        for table_name in self.db.tables():
+            yield table_name, self.get_table(table_name).all()
 
     def reset(self) -> None:
-        self.db.drop_tables()
+        with self.logged("reset"):
+            self.db.drop_tables()
+        self.id_allocator.reset()
+
+    def close(self) -> None:
+        if self.journal is not None:
+            with self.journal.lock:
+                self.journal.close(self.get_data())
+        self.db.close()
+
+    def count(self, table_name: str) -> int:
+        return len(self.get_table(table_name))
 
     def get_ids(self, table_name: str) -> list[int | str]:
-        return [item["id"] for item in self.get_table(table_name).all()]
+        # The doc_id map, without building the documents
+        table = self.get_table(table_name)
+        return list(map(table.document_id_class, table._read_table()))
 
     def get_table(self, table_name):
         table = self.db.table(table_name)
@@ -0,0 +1,246 @@
+import threading
+from abc import ABC, abstractmethod
+from collections.abc import Awaitable, Callable
+
+GetIds = Callable[[str], list[int | str]]
+
+
+def max_int_id(item_ids) -> int:
+    return max((item_id for item_id in item_ids if isinstance(item_id, int)), default=0)
+
+
+class BaseIdAllocator(ABC):
+    # Counters are seeded lazily from existing IDs the first time a collection
+    # is used, afterwards allocating an ID never scans the collection
+
+    def __init__(self, get_ids: GetIds):
+        self.get_ids = get_ids
+
+    # Reserves `count` consecutive IDs and returns the first one
+    @abstractmethod
+    def allocate(self, collection_name: str, count: int = 1) -> int: ...
+
+    # Makes sure IDs supplied by clients are never handed out again
+    @abstractmethod
+    def observe(self, collection_name: str, item_id: int) -> None: ...
+
+    @abstractmethod
+    def reset(self, collection_name: str | None = None) -> None: ...
+
+
+class CounterIdAllocator(BaseIdAllocator):
+    def __init__(self, get_ids: GetIds):
+        super().__init__(get_ids)
+        self.counters: dict[str, int] = {}
+        self.lock = threading.Lock()
+
+    def current(self, collection_name: str) -> int:
+        if collection_name not in self.counters:
+            self.counters[collection_name] = max_int_id(self.get_ids(collection_name))
+        return self.counters[collection_name]
+
+    def allocate(self, collection_name: str, count: int = 1) -> int:
+        with self.lock:
+            first_id = self.current(collection_name) + 1
+            self.counters[collection_name] = first_id + count - 1
+            return first_id
+
+    def observe(self, collection_name: str, item_id: int) -> None:
+        with self.lock:
+            if item_id > self.current(collection_name):
+                self.counters[collection_name] = item_id
+
+    def reset(self, collection_name: str | None = None) -> None:
+        with self.lock:
+            if collection_name is None:
+                self.counters.clear()
+            else:
+                self.counters.pop(collection_name, None)
+
+
+class RedisIdAllocator(BaseIdAllocator):
+    # Atomic "SET key max(current, value)", used both for seeding and observing
+    max_script = """
+    local current = tonumber(redis.call('GET', KEYS[1]) or '0')
+    if tonumber(ARGV[1]) > current then
+        redis.call('SET', KEYS[1], ARGV[1])
+    end
+    """
+
+    def __init__(self, db, get_ids: GetIds):
+        super().__init__(get_ids)
+        self.db = db
+        self.set_max = db.register_script(self.max_script)
+        # Counters known to exist, so allocating is a single INCRBY
+        self.seeded: set[str] = set()
+
+    def key(self, collection_name: str) -> str:
+        return f"{collection_name}:next_id"
+
+    def seed(self, collection_name: str) -> None:
+        if collection_name in self.seeded:
+            return
+        key = self.key(collection_name)
+        if not self.db.exists(key):
+            self.set_max(keys=[key], args=[max_int_id(self.get_ids(collection_name))])
+        self.seeded.add(collection_name)
+
+    def allocate(self, collection_name: str, count: int = 1) -> int:
+        self.seed(collection_name)
+        last_id = self.db.incrby(self.key(collection_name), count)
+        return last_id - count + 1
+
+    def observe(self, collection_name: str, item_id: int) -> None:
+        self.seed(collection_name)
+        self.set_max(keys=[self.key(collection_name)], args=[item_id])
+
+    def reset(self, collection_name: str | None = None) -> None:
+        if collection_name is None:
+            self.seeded.clear()
+        else:
+            self.db.delete(self.key(collection_name))
+            self.seeded.discard(collection_name)
+
+
+class MongoIdAllocator(BaseIdAllocator):
+    collection_name = "__counters__"
+
+    def __init__(self, db, get_ids: GetIds):
+        super().__init__(get_ids)
+        self.counters = db[self.collection_name]
+        self.seeded: set[str] = set()
+
+    def seed(self, collection_name: str) -> None:
+        if collection_name not in self.seeded:
+            self.counters.update_one(
+                {"_id": collection_name},
+                {"$max": {"seq": max_int_id(self.get_ids(collection_name))}},
+                upsert=True,
+            )
+            self.seeded.add(collection_name)
+
+    def allocate(self, collection_name: str, count: int = 1) -> int:
+        from pymongo import ReturnDocument
+
+        self.seed(collection_name)
+        counter = self.counters.find_one_and_update(
+            {"_id": collection_name},
+            {"$inc": {"seq": count}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+        return counter["seq"] - count + 1
+
+    def observe(self, collection_name: str, item_id: int) -> None:
+        self.seed(collection_name)
+        self.counters.update_one(
+            {"_id": collection_name}, {"$max": {"seq": item_id}}, upsert=True
+        )
+
+    def reset(self, collection_name: str | None = None) -> None:
+        if collection_name is None:
+            self.counters.drop()
+            self.seeded.clear()
+        else:
+            self.counters.delete_one({"_id": collection_name})
+            self.seeded.discard(collection_name)
+
+
+AsyncGetIds = Callable[[str], Awaitable[list[int | str]]]
+
+
+class AsyncBaseIdAllocator(ABC):
+    # Same contract as BaseIdAllocator for storages with async drivers
+
+    def __init__(self, get_ids: AsyncGetIds):
+        self.get_ids = get_ids
+
+    @abstractmethod
+    async def allocate(self, collection_name: str, count: int = 1) -> int: ...
+
+    @abstractmethod
+    async def observe(self, collection_name: str, item_id: int) -> None: ...
+
+    @abstractmethod
+    async def reset(self, collection_name: str | None = None) -> None: ...
+
+
+class AsyncRedisIdAllocator(AsyncBaseIdAllocator):
+    def __init__(self, db, get_ids: AsyncGetIds):
+        super().__init__(get_ids)
+        self.db = db
+        self.set_max = db.register_script(RedisIdAllocator.max_script)
+        self.seeded: set[str] = set()
+
+    def key(self, collection_name: str) -> str:
+        return f"{collection_name}:next_id"
+
+    async def seed(self, collection_name: str) -> None:
+        if collection_name in self.seeded:
+            return
+        key = self.key(collection_name)
+        if not await self.db.exists(key):
+            item_ids = await self.get_ids(collection_name)
+            await self.set_max(keys=[key], args=[max_int_id(item_ids)])
+        self.seeded.add(collection_name)
+
+    async def allocate(self, collection_name: str, count: int = 1) -> int:
+        await self.seed(collection_name)
+        last_id = await self.db.incrby(self.key(collection_name), count)
+        return last_id - count + 1
+
+    async def observe(self, collection_name: str, item_id: int) -> None:
+        await self.seed(collection_name)
+        await self.set_max(keys=[self.key(collection_name)], args=[item_id])
+
+    async def reset(self, collection_name: str | None = None) -> None:
+        if collection_name is None:
+            self.seeded.clear()
+        else:
+            await self.db.delete(self.key(collection_name))
+            self.seeded.discard(collection_name)
+
+
+class AsyncMongoIdAllocator(AsyncBaseIdAllocator):
+    collection_name = MongoIdAllocator.collection_name
+
+    def __init__(self, db, get_ids: AsyncGetIds):
+        super().__init__(get_ids)
+        self.counters = db[self.collection_name]
+        self.seeded: set[str] = set()
+
+    async def seed(self, collection_name: str) -> None:
+        if collection_name not in self.seeded:
+            item_ids = await self.get_ids(collection_name)
+            await self.counters.update_one(
+                {"_id": collection_name},
+                {"$max": {"seq": max_int_id(item_ids)}},
+                upsert=True,
+            )
+            self.seeded.add(collection_name)
+
+    async def allocate(self, collection_name: str, count: int = 1) -> int:
+        from pymongo import ReturnDocument
+
+        await self.seed(collection_name)
+        counter = await self.counters.find_one_and_update(
+            {"_id": collection_name},
+            {"$inc": {"seq": count}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+        return counter["seq"] - count + 1
+
+    async def observe(self, collection_name: str, item_id: int) -> None:
+        await self.seed(collection_name)
+        await self.counters.update_one(
+            {"_id": collection_name}, {"$max": {"seq": item_id}}, upsert=True
+        )
+
+    async def reset(self, collection_name: str | None = None) -> None:
+        if collection_name is None:
+            await self.counters.drop()
+            self.seeded.clear()
+        else:
+            await self.counters.delete_one({"_id": collection_name})
+            self.seeded.discard(collection_name)
@@ -0,0 +1,220 @@
+import atexit
+import json
+import os
+import shutil
+import threading
+from collections.abc import Callable
+from time import monotonic
+from typing import IO, Any
+
+Data = dict[str, dict[Any, dict]]
+
+
+class Journal:
+    # Append-only log of mutations next to a snapshot in TinyDB's JSON format.
+    # The snapshot is only rewritten when the log is compacted, in a background
+    # thread, instead of on every write
+    flush_policies = frozenset({"write", "interval", "shutdown"})
+    # Document keys of the snapshot data, TinyDB keeps them as strings
+    key: Callable[[Any], Any] = str
+    # TinyDB removes and reinserts a replaced document
+    reinsert = True
+
+    def __init__(
+        self,
+        path: str,
+        flush: str = "write",
+        flush_interval_ms: int = 100,
+        compact_size: int = 64 * 2**20,
+        compact_interval: float = 0,
+    ):
+        if flush not in self.flush_policies:
+            raise ValueError("Unknown flush policy")
+        self.path = path
+        self.journal_path = path + ".journal"
+        # Journal being folded into the snapshot, still replayed after a crash
+        self.compacting_path = path + ".journal.compacting"
+        self.flush_policy = flush
+        self.compact_size = compact_size
+        self.compact_interval = compact_interval
+        self.compacted = monotonic()
+        self.lock = threading.RLock()
+        self.file: IO[str] | None = None
+        self.size = 0
+        self.compaction: threading.Thread | None = None
+        self.stopped = threading.Event()
+        self.flusher: threading.Thread | None = None
+        self.compactor: threading.Thread | None = None
+        if flush == "interval":
+            self.flusher = threading.Thread(
+                target=self.flush_every,
+                args=(flush_interval_ms / 1000,),
+                name="journal-flush",
+                daemon=True,
+            )
+
+    def apply(self, data: Data, record: list) -> None:
+        # Replays one journal record on raw {table: {doc_id: doc}} data
+        op_name, *args = record
+        if op_name == "upsert":
+            table_name, method, items = args
+            table = data.setdefault(table_name, {})
+            for item in items:
+                doc_id = self.key(item["id"])
+                if method == "PUT":
+                    if self.reinsert:
+                        table.pop(doc_id, None)
+                    table[doc_id] = dict(item)
+                else:
+                    table[doc_id] = {**table.get(doc_id, {}), **item}
+        elif op_name == "remove":
+            table_name, doc_ids = args
+            table = data.get(table_name, {})
+            for doc_id in doc_ids:
+                table.pop(self.key(doc_id), None)
+        elif op_name == "drop":
+            data.pop(args[0], None)
+        elif op_name == "reset":
+            data.clear()
+        else:
+            raise ValueError(f"Unknown journal record {op_name}")
+
+    def recover(self) -> Data:
+        data = self.load_snapshot() if os.path.exists(self.path) else {}
+        for path in [self.compacting_path, self.journal_path]:
+            if os.path.exists(path):
+                with open(path) as file:
+                    for line in file:
+                        try:
+                            record = json.loads(line)
+                        except ValueError:
+                            # Torn last record of a crashed write
+                            break
+                        self.apply(data, record)
+        if os.path.exists(self.compacting_path):
+            # Finish the interrupted compaction, the journal is folded in as well
+            self.write_snapshot(data)
+            self.open_journal("w")
+        else:
+            self.open_journal("a")
+        if self.flusher is not None:
+            self.flusher.start()
+        atexit.register(self.flush)
+        return data
+
+    def open_journal(self, mode: str) -> None:
+        # Kept open for appends until the next compaction or close()
+        self.file = open(self.journal_path, mode)  # noqa: SIM115
+        self.size = self.file.tell()
+
+    def append(self, *record) -> None:
+        line = json.dumps(record, default=str) + "\n"
+        with self.lock:
+            assert self.file is not None
+            self.file.write(line)
+            self.size += len(line)
+            if self.flush_policy == "write":
+                self.flush()
+
+    def flush(self) -> None:
+        with self.lock:
+            if self.file is not None and not self.file.closed:
+                self.file.flush()
+                os.fsync(self.file.fileno())
+
+    def flush_every(self, interval: float) -> None:
+        while not self.stopped.wait(interval):
+            self.flush()
+
+    def start_compactor(self, get_data: Callable[[], Data]) -> None:
+        # Checked on a timer too, otherwise writes followed by silence would
+        # wait for the next write or close() to be compacted
+        if self.compact_interval:
+            self.compactor = threading.Thread(
+                target=self.compact_every,
+                args=(get_data,),
+                name="journal-compact-timer",
+                daemon=True,
+            )
+            self.compactor.start()
+
+    def compact_every(self, get_data: Callable[[], Data]) -> None:
+        while not self.stopped.wait(self.compact_interval):
+            with self.lock:
+                # close() may have compacted and closed the journal meanwhile
+                if not self.stopped.is_set() and self.needs_compaction():
+                    self.compact(get_data())
+
+    def needs_compaction(self) -> bool:
+        if not self.size or self.compacting():
+            return False
+        return self.size >= self.compact_size or bool(
+            self.compact_interval
+            and monotonic() - self.compacted >= self.compact_interval
+        )
+
+    def compact(self, data: Data, background: bool = True) -> None:
+        # Called with the storage lock held, so `data` doesn't change while the
+        # journal is rotated and the snapshot started
+        with self.lock:
+            self.wait()
+            assert self.file is not None
+            self.flush()
+            self.file.close()
+            if os.path.exists(self.compacting_path):
+                # The previous snapshot failed, its records are still needed
+                with (
+                    open(self.journal_path) as journal,
+                    open(self.compacting_path, "a") as compacting,
+                ):
+                    shutil.copyfileobj(journal, compacting)
+                os.remove(self.journal_path)
+            else:
+                os.replace(self.journal_path, self.compacting_path)
+            self.open_journal("a")
+            self.compacted = monotonic()
+            self.start_snapshot(data, background)
+
+    def start_snapshot(self, data: Data, background: bool) -> None:
+        snapshot = {
+            table_name: {doc_id: dict(doc) for doc_id, doc in table.items()}
+            for table_name, table in data.items()
+        }
+        if background:
+            self.compaction = threading.Thread(
+                target=self.write_snapshot, args=(snapshot,), name="journal-compact"
+            )
+            self.compaction.start()
+        else:
+            self.write_snapshot(snapshot)
+
+    def compacting(self) -> bool:
+        return self.compaction is not None and self.compaction.is_alive()
+
+    def wait(self) -> None:
+        if self.compaction is not None:
+            self.compaction.join()
+
+    def load_snapshot(self) -> Data:
+        with open(self.path) as file:
+            return json.load(file)
+
+    def write_snapshot(self, snapshot: Data) -> None:
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as file:
+            json.dump(snapshot, file, default=str)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(tmp_path, self.path)
+        os.remove(self.compacting_path)
+
+    def close(self, data: Data) -> None:
+        atexit.unregister(self.flush)
+        self.stopped.set()
+        if self.flusher is not None and self.flusher.is_alive():
+            self.flusher.join()
+        # Folding the journal in on shutdown makes the next start a plain load
+        self.compact(data, background=False)
+        with self.lock:
+            assert self.file is not None
+            self.file.close()
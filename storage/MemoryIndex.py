@@ -0,0 +1,398 @@
+import bisect
+from collections.abc import Callable, Iterable, Iterator
+from itertools import chain
+from operator import itemgetter
+from typing import Any, ClassVar
+
+first = itemgetter(0)
+
+# (estimated number of candidates, function materializing their ids)
+Plan = tuple[int, Callable[[], Iterable]]
+
+
+def sort_family(value) -> int | None:
+    # Values are only ordered against values of the same family,
+    # comparing e.g. numbers with strings raises TypeError
+    if isinstance(value, (int, float)):
+        return 0
+    if isinstance(value, str):
+        return 1
+    return None
+
+
+def hashable_set(values) -> set | None:
+    try:
+        return set(values)
+    except TypeError:
+        return None
+
+
+class HashIndex:
+    def __init__(self):
+        self.buckets: dict[Any, set] = {}
+
+    def add(self, item_id, value) -> None:
+        try:
+            self.buckets.setdefault(value, set()).add(item_id)
+        except TypeError:
+            # Unhashable values (lists, dicts) never equal scalar query values
+            pass
+
+    def remove(self, item_id, value) -> None:
+        try:
+            bucket = self.buckets.get(value)
+        except TypeError:
+            return
+        if bucket is not None:
+            bucket.discard(item_id)
+            if not bucket:
+                del self.buckets[value]
+
+    def clear(self) -> None:
+        self.buckets = {}
+
+    def plan(self, op_name: str, value, all_ids) -> Plan | None:
+        if op_name in {"=", "eq", "ne", "neq", "not"}:
+            values = hashable_set([value])
+        elif op_name in {"in", "notin"}:
+            values = hashable_set(value)
+        else:
+            return None
+        if values is None:
+            return None
+        buckets = [self.buckets.get(value, ()) for value in values]
+        count = sum(len(bucket) for bucket in buckets)
+        if op_name in {"ne", "neq", "not", "notin"}:
+            return len(all_ids) - count, lambda: all_ids - set().union(*buckets)
+        return count, lambda: set().union(*buckets)
+
+
+class SortedIndex:
+    lower_ops: ClassVar[dict[str, bool]] = {"gt": False, "ge": True, "gte": True}
+    upper_ops: ClassVar[dict[str, bool]] = {"lt": False, "le": True, "lte": True}
+
+    def __init__(self):
+        self.clear()
+
+    def add(self, item_id, value) -> None:
+        family = sort_family(value)
+        try:
+            if value is None:
+                bisect.insort(self.nulls, item_id)
+            elif family is not None:
+                bisect.insort(self.entries[family], (value, item_id))
+            else:
+                self.others.add(item_id)
+        except TypeError:
+            # Mixed id types, such ties cannot be ordered
+            self.others.add(item_id)
+
+    def remove(self, item_id, value) -> None:
+        if item_id in self.others:
+            self.others.discard(item_id)
+            return
+        family = sort_family(value)
+        if value is None:
+            entries, entry = self.nulls, item_id
+        elif family is not None:
+            entries, entry = self.entries[family], (value, item_id)
+        else:
+            return
+        i = bisect.bisect_left(entries, entry)
+        if i < len(entries) and entries[i] == entry:
+            del entries[i]
+
+    def clear(self) -> None:
+        self.entries: dict[int, list[tuple]] = {0: [], 1: []}
+        self.nulls: list = []
+        self.others: set = set()
+
+    def plan(self, op_name: str, value, _) -> Plan | None:
+        lower, upper = (None, True), (None, True)
+        if op_name == "between":
+            lower, upper = (value[0], True), (value[-1], True)
+        elif op_name in self.lower_ops:
+            lower = (value, self.lower_ops[op_name])
+        elif op_name in self.upper_ops:
+            upper = (value, self.upper_ops[op_name])
+        else:
+            return None
+
+        families = {
+            sort_family(bound) for bound, _ in (lower, upper) if bound is not None
+        }
+        if len(families) != 1 or None in families:
+            return None
+        entries = self.entries[families.pop()]
+
+        start, end = 0, len(entries)
+        lower_bound, inclusive = lower
+        if lower_bound is not None:
+            search = bisect.bisect_left if inclusive else bisect.bisect_right
+            start = search(entries, lower_bound, key=first)
+        upper_bound, inclusive = upper
+        if upper_bound is not None:
+            search = bisect.bisect_right if inclusive else bisect.bisect_left
+            end = search(entries, upper_bound, key=first)
+        return max(end - start, 0), lambda: [entry[1] for entry in entries[start:end]]
+
+    def ordered_ids(
+        self, desc: bool = False, after: tuple | None = None
+    ) -> Iterator | None:
+        # Same order as sorting by (value is not None, value, id)
+        nonempty = [entries for entries in self.entries.values() if entries]
+        if self.others or len(nonempty) > 1:
+            return None
+        entries = nonempty[0] if nonempty else []
+        nulls = self.nulls
+
+        # Seek past the (value, id) cursor, whatever the page number is
+        null_start, null_end = 0, len(nulls)
+        entry_start, entry_end = 0, len(entries)
+        if after is not None:
+            value, item_id = after
+            if value is None:
+                null_start = bisect.bisect_right(nulls, item_id)
+                null_end = bisect.bisect_left(nulls, item_id)
+                entry_end = 0
+            else:
+                null_start = len(nulls)
+                entry_start = bisect.bisect_right(entries, after)
+                entry_end = bisect.bisect_left(entries, after)
+
+        if desc:
+            return chain(
+                (entries[i][1] for i in range(entry_end - 1, -1, -1)),
+                (nulls[i] for i in range(null_end - 1, -1, -1)),
+            )
+        return chain(
+            (nulls[i] for i in range(null_start, len(nulls))),
+            (entries[i][1] for i in range(entry_start, len(entries))),
+        )
+
+
+# Case folding that keeps case insensitive regex matches of ASCII characters,
+# which also match the dotted and dotless I
+folding = str.maketrans({"İ": "i", "ı": "i"})
+
+
+def fold(text: str) -> str:
+    return text.translate(folding).casefold()
+
+
+def get_trigrams(text: str) -> set[str]:
+    return {text[i : i + 3] for i in range(len(text) - 2)}
+
+
+def required_literals(pattern: str) -> list[str] | None:
+    # Runs of characters every match of the regex contains, None if the pattern
+    # is too complex to tell
+    if any(token in pattern for token in ["\\", "|", "(", ")", "{"]):
+        return None
+    literals, current = [], ""
+    i = 0
+    while i < len(pattern):
+        char = pattern[i]
+        if char == "[":
+            end = pattern.find("]", i + 2)
+            if end == -1:
+                return None
+            literals.append(current)
+            current, i = "", end + 1
+            continue
+        if char in "?*":
+            # The preceding character is optional
+            literals.append(current[:-1])
+            current = ""
+        elif char in ".^$+":
+            literals.append(current)
+            current = ""
+        else:
+            current += char
+        i += 1
+    literals.append(current)
+    return [literal for literal in literals if literal]
+
+
+class TextIndex:
+    # Trigrams for like and ilike, sorted values and reversed values for
+    # startswith and endswith. Values are indexed as the ops see them, str()-ed
+    def __init__(self):
+        self.clear()
+
+    def entries(self, item_id, value) -> Iterator[tuple[list, tuple]]:
+        # Ties are broken by id, with its type name first, as mixed id types
+        # can't be compared
+        text, id_type = str(value), type(item_id).__name__
+        yield self.prefixes, (text, id_type, item_id)
+        yield self.suffixes, (text[::-1], id_type, item_id)
+
+    def add(self, item_id, value) -> None:
+        for trigram in get_trigrams(fold(str(value))):
+            self.trigrams.setdefault(trigram, set()).add(item_id)
+        # Sorted in on the next read, a bulk load sorts once
+        for entries, entry in self.entries(item_id, value):
+            self.pending.append((entries, entry))
+
+    def sort(self) -> None:
+        if self.pending:
+            for entries, entry in self.pending:
+                entries.append(entry)
+            self.prefixes.sort()
+            self.suffixes.sort()
+            self.pending = []
+
+    def remove(self, item_id, value) -> None:
+        self.sort()
+        for trigram in get_trigrams(fold(str(value))):
+            bucket = self.trigrams.get(trigram)
+            if bucket is not None:
+                bucket.discard(item_id)
+                if not bucket:
+                    del self.trigrams[trigram]
+        for entries, entry in self.entries(item_id, value):
+            i = bisect.bisect_left(entries, entry)
+            if i < len(entries) and entries[i] == entry:
+                del entries[i]
+
+    def clear(self) -> None:
+        self.trigrams: dict[str, set] = {}
+        self.prefixes: list[tuple] = []
+        self.suffixes: list[tuple] = []
+        self.pending: list[tuple[list, tuple]] = []
+
+    def plan(self, op_name: str, value, _) -> Plan | None:
+        self.sort()
+        if op_name == "startswith":
+            return self.plan_prefix(self.prefixes, str(value))
+        if op_name == "endswith":
+            return self.plan_prefix(self.suffixes, str(value)[::-1])
+        if op_name not in {"like", "ilike"}:
+            return None
+        literals = required_literals(str(value))
+        if literals is None:
+            return None
+        if op_name == "ilike" and not all(map(str.isascii, literals)):
+            return None
+        trigrams = set().union(*(get_trigrams(fold(literal)) for literal in literals))
+        if not trigrams:
+            return None
+        buckets = sorted(
+            (self.trigrams.get(trigram, set()) for trigram in trigrams), key=len
+        )
+        return len(buckets[0]), lambda: buckets[0].intersection(*buckets[1:])
+
+    def plan_prefix(self, entries: list[tuple], prefix: str) -> Plan | None:
+        if not prefix:
+            return None
+        start = bisect.bisect_left(entries, prefix, key=first)
+        end = len(entries)
+        if ord(prefix[-1]) < 0x10FFFF:
+            # The first text past every text starting with the prefix
+            bound = prefix[:-1] + chr(ord(prefix[-1]) + 1)
+            end = bisect.bisect_left(entries, bound, key=first)
+        return end - start, lambda: {entry[2] for entry in entries[start:end]}
+
+
+class CollectionIndexes:
+    def __init__(self):
+        self.hash: dict[str, HashIndex] = {}
+        self.sorted: dict[str, SortedIndex] = {"id": SortedIndex()}
+        self.text: dict[str, TextIndex] = {}
+
+    def indexes(self) -> Iterator[tuple[str, HashIndex | SortedIndex | TextIndex]]:
+        yield from self.hash.items()
+        yield from self.sorted.items()
+        yield from self.text.items()
+
+    def create(self, field: str, kind: str, collection: dict) -> None:
+        index: HashIndex | SortedIndex | TextIndex
+        if kind == "hash":
+            index = self.hash.setdefault(field, HashIndex())
+        elif kind == "sorted":
+            index = self.sorted.setdefault(field, SortedIndex())
+        elif kind == "text":
+            index = self.text.setdefault(field, TextIndex())
+        else:
+            raise ValueError("Unknown index type")
+        index.clear()
+        for item_id, item in collection.items():
+            index.add(item_id, item.get(field))
+
+    def rebuild(self, collection: dict) -> None:
+        # Refills every index from the items, parent fields are indexed the
+        # way writes index them
+        for item in collection.values():
+            for field in item:
+                if field.endswith("_id"):
+                    self.hash.setdefault(field, HashIndex())
+        for field, index in self.indexes():
+            index.clear()
+            for item_id, item in collection.items():
+                index.add(item_id, item.get(field))
+
+    def snapshot(self, item: dict | None) -> dict | None:
+        if item is None:
+            return None
+        return {field: item.get(field) for field, _ in self.indexes()}
+
+    def update(self, item_id, old_values: dict | None, item: dict, collection: dict):
+        # Parent fields are the most common filters, index them automatically,
+        # creating an index also covers the (already stored) item
+        created = [f for f in item if f.endswith("_id") and f not in self.hash]
+        for field in created:
+            self.create(field, "hash", collection)
+        for field, index in self.indexes():
+            if field in created:
+                continue
+            value = item.get(field)
+            if old_values is not None and field in old_values:
+                old_value = old_values[field]
+                if old_value is value or old_value == value:
+                    continue
+                index.remove(item_id, old_value)
+            index.add(item_id, value)
+
+    def remove(self, item_id, item: dict) -> None:
+        for field, index in self.indexes():
+            index.remove(item_id, item.get(field))
+
+    def clear(self) -> None:
+        for _, index in self.indexes():
+            index.clear()
+
+    def plan(self, op_name: str, field: str, value, collection: dict) -> Plan | None:
+        if field == "id" and op_name in {"=", "eq", "in"}:
+            ids = hashable_set([value] if op_name in {"=", "eq"} else value)
+            if ids is not None:
+                return len(ids), lambda: [i for i in ids if i in collection]
+        plans = [
+            index.plan(op_name, value, collection.keys())
+            for index in (
+                self.hash.get(field),
+                self.sorted.get(field),
+                self.text.get(field),
+            )
+            if index is not None
+        ]
+        plans = [plan for plan in plans if plan is not None]
+        return min(plans, key=first, default=None)
+
+    def candidates(self, where_params: list, collection: dict) -> Iterable | None:
+        best: Plan | None = None
+        for op_name, field, value in where_params:
+            # Blank values mean "field is not None", which is not indexed
+            if not value:
+                continue
+            plan = self.plan(op_name, field, value, collection)
+            if plan is not None and (best is None or plan[0] < best[0]):
+                best = plan
+        return best[1]() if best else None
+
+    def ordered_ids(
+        self, order_by: list[str], desc: bool, after: list | None = None
+    ) -> Iterator | None:
+        if len(order_by) != 1 or order_by[0] not in self.sorted:
+            return None
+        cursor = (after[0], after[-1]) if after is not None else None
+        return self.sorted[order_by[0]].ordered_ids(desc, cursor)
@@ -0,0 +1,72 @@
+import mmap
+import os
+import pickle
+
+from .Journal import Data, Journal
+
+
+class MemoryJournal(Journal):
+    # Binary snapshot of MemoryStorage.db, written from a background thread. The
+    # operation log is optional, without it only the snapshots, taken every
+    # `compact_interval` seconds when there were writes, persist. With `fork`
+    # a forked child gets a copy-on-write view of the data instead, so the
+    # parent doesn't copy it, but forking a process running threads is only
+    # safe as long as no other thread holds a lock the child needs
+    key = staticmethod(lambda item_id: item_id)
+    reinsert = False
+
+    def __init__(self, path: str, oplog: bool = True, fork: bool = False, **options):
+        super().__init__(path, **options)
+        self.oplog = oplog
+        self.fork = fork
+        self.child: int | None = None
+
+    def append(self, *record) -> None:
+        if self.oplog:
+            super().append(*record)
+        else:
+            # Only counts the changes since the last snapshot
+            self.size += 1
+
+    def start_snapshot(self, data: Data, background: bool) -> None:
+        if not background or not self.fork or not hasattr(os, "fork"):
+            return super().start_snapshot(data, background)
+        pid = os.fork()
+        if pid:
+            self.child = pid
+            return
+        # The child must never return into the parent's code
+        status = 1
+        try:
+            self.write_snapshot(data)
+            status = 0
+        finally:
+            os._exit(status)
+
+    def compacting(self) -> bool:
+        if self.child is not None and os.waitpid(self.child, os.WNOHANG)[0]:
+            self.child = None
+        return self.child is not None or super().compacting()
+
+    def wait(self) -> None:
+        if self.child is not None:
+            os.waitpid(self.child, 0)
+            self.child = None
+        super().wait()
+
+    def load_snapshot(self) -> Data:
+        # Unpickled straight from the mapped file, without reading it into a buffer
+        with (
+            open(self.path, "rb") as file,
+            mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped,
+        ):
+            return pickle.loads(mapped)
+
+    def write_snapshot(self, snapshot: Data) -> None:
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "wb") as file:
+            pickle.dump(snapshot, file, protocol=pickle.HIGHEST_PROTOCOL)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(tmp_path, self.path)
+        os.remove(self.compacting_path)
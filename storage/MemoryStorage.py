@@ -1,54 +1,198 @@
+from collections.abc import Iterable, Iterator
+from itertools import islice
 from typing import Any
 
 from .BaseStorage import BaseStorage
+from .Journal import Data
+from .MemoryIndex import CollectionIndexes
+from .MemoryJournal import MemoryJournal
+from .query import compile_where, paginate, project
 
 
 class MemoryStorage(BaseStorage):
-    def __init__(self, uuid_id: bool = False):
+    def __init__(
+        self,
+        uuid_id: bool = False,
+        storage_path: str | None = None,
+        oplog: bool = False,
+        flush: str = "write",
+        flush_interval_ms: int = 100,
+        snapshot_interval: float = 60,
+        compact_size: int = 64 * 2**20,
+        fork_snapshots: bool = False,
+    ):
         super().__init__(None, uuid_id)
         self.db: dict[str, dict[int | str, dict[str, Any]]] = {}
+        self.indexes: dict[str, CollectionIndexes] = {}
+        if storage_path:
+            # Snapshot at storage_path, optionally with an operation log replayed
+            # on top of it
+            self.journal = MemoryJournal(
+                storage_path,
+                oplog,
+                fork_snapshots,
+                flush=flush,
+                flush_interval_ms=flush_interval_ms,
+                compact_size=compact_size,
+                compact_interval=snapshot_interval,
+            )
+            self.db = self.journal.recover()
+            for collection_name, collection in self.db.items():
+                self.get_indexes(collection_name).rebuild(collection)
+            self.journal.start_compactor(self.get_data)
+
+    def get_data(self) -> Data:
+        return self.db
+
+    def get_indexes(self, collection_name: str) -> CollectionIndexes:
+        return self.indexes.setdefault(collection_name, CollectionIndexes())
+
+    def create_index(
+        self, collection_name: str, field: str, kind: str = "hash"
+    ) -> None:
+        collection = self.db.setdefault(collection_name, {})
+        self.get_indexes(collection_name).create(field, kind, collection)
 
     def get_with_id(self, collection_name: str, item_id: int | str) -> dict:
         collection = self.db.get(collection_name, {})
         return collection.get(item_id, {})
 
+    def get_many(self, collection_name: str, item_ids: list) -> list[dict]:
+        collection = self.db.get(collection_name, {})
+        return [collection[item_id] for item_id in item_ids if item_id in collection]
+
+    def get_candidates(
+        self, collection_name: str, where_params: list
+    ) -> Iterable[dict]:
+        collection = self.db.setdefault(collection_name, {})
+        item_ids = self.get_indexes(collection_name).candidates(
+            where_params, collection
+        )
+        if item_ids is None:
+            return list(collection.values())
+        return [collection[item_id] for item_id in item_ids]
+
+    def get_without_id(
+        self, collection_name: str, where_params: list, meta_params: dict
+    ) -> list:
+        collection = self.db.setdefault(collection_name, {})
+        indexes = self.get_indexes(collection_name)
+        order_by = [
+            order_by_arg.lstrip("-") for order_by_arg in meta_params["order_by"]
+        ]
+        ordered_ids = indexes.ordered_ids(
+            order_by, meta_params["desc"], meta_params.get("_after")
+        )
+        item_ids = indexes.candidates(where_params, collection)
+        predicate = compile_where(where_params)
+        fields = meta_params.get("_fields")
+
+        # Sorting few candidates is cheaper than walking the whole sorted index
+        if ordered_ids is None or (
+            item_ids is not None and len(item_ids) < len(collection) // 4  # type: ignore[arg-type]
+        ):
+            items = (
+                collection.values()
+                if item_ids is None
+                else [collection[item_id] for item_id in item_ids]
+            )
+            return list(
+                project(paginate(filter(predicate, items), meta_params), fields)
+            )
+
+        if item_ids is not None:
+            ordered_ids = filter(set(item_ids).__contains__, ordered_ids)
+        items = (
+            item for item in map(collection.__getitem__, ordered_ids) if predicate(item)
+        )
+        offset = meta_params["_offset"]
+        limit = meta_params["_limit"]
+        page = islice(items, offset, offset + limit if limit else None)
+        return list(project(page, fields))
+
+    def iter_without_id(
+        self, collection_name: str, where_params: list, meta_params: dict
+    ) -> Iterator[dict]:
+        # Collections may change while a response is streamed, so collect the
+        # results first, which only copies references
+        return iter(self.get_without_id(collection_name, where_params, meta_params))
+
+    def count(self, collection_name: str) -> int:
+        return len(self.db.get(collection_name, {}))
+
     def upsert(
         self, collection_name: str, data: dict, method: str = "POST"
     ) -> int | str:
-        collection = self.db.setdefault(collection_name, {})
         item_id = self.get_id(collection_name, data)
-        if method == "POST":
-            collection.setdefault(item_id, {}).update(data)
-        elif method == "PUT":
-            collection[item_id] = data
+        with self.logged("upsert", collection_name, method, [data]):
+            self.set_item(collection_name, item_id, data, method)
         return item_id
 
     def bulk_upsert(
         self, collection_name: str, items: list[dict], method: str = "POST"
     ) -> list[int | str]:
-        return [self.upsert(collection_name, item, method) for item in items]
+        item_ids = self.bulk_get_ids(collection_name, items)
+        with self.logged("upsert", collection_name, method, items):
+            for item_id, item in zip(item_ids, items):
+                self.set_item(collection_name, item_id, item, method)
+        return item_ids
+
+    def set_item(
+        self, collection_name: str, item_id: int | str, data: dict, method: str
+    ) -> None:
+        collection = self.db.setdefault(collection_name, {})
+        indexes = self.get_indexes(collection_name)
+        old_values = indexes.snapshot(collection.get(item_id))
+        if method == "POST":
+            collection.setdefault(item_id, {}).update(data)
+        elif method == "PUT":
+            collection[item_id] = data
+        if item_id in collection:
+            indexes.update(item_id, old_values, collection[item_id], collection)
 
     def delete_with_id(self, collection_name: str, doc_id: int | str) -> bool:
         collection = self.db.setdefault(collection_name, {})
-        return bool(collection.pop(doc_id, None))
+        with self.logged("remove", collection_name, [doc_id]):
+            item = collection.pop(doc_id, None)
+        if item is not None:
+            self.get_indexes(collection_name).remove(doc_id, item)
+        return bool(item)
 
     def delete_without_id(self, collection_name: str, where_params: list) -> None:
         if where_params:
             collection = self.db.setdefault(collection_name, {})
-            for item in list(collection.values()):
-                if all(self.fulfill_cond(item, param) for param in where_params):
+            indexes = self.get_indexes(collection_name)
+            predicate = compile_where(where_params)
+            items = [
+                item
+                for item in self.get_candidates(collection_name, where_params)
+                if predicate(item)
+            ]
+            with self.logged("remove", collection_name, [item["id"] for item in items]):
+                for item in items:
                     collection.pop(item["id"], None)
+                    indexes.remove(item["id"], item)
         else:
-            self.db.pop(collection_name, None)
+            with self.logged("drop", collection_name):
+                self.db.pop(collection_name, None)
+            self.get_indexes(collection_name).clear()
+            self.id_allocator.reset(collection_name)
 
-    def all(self) -> dict:
-        return {
-            collection_name: list(items.values())
-            for collection_name, items in self.db.items()
-        }
+    def iter_all(self) -> Iterator[tuple[str, Iterable[dict]]]:
+        for collection_name, items in list(self.db.items()):
+            yield collection_name, list(items.values())
 
     def reset(self) -> None:
-        self.db = {}
+        with self.logged("reset"):
+            self.db = {}
+        for indexes in self.indexes.values():
+            indexes.clear()
+        self.id_allocator.reset()
+
+    def close(self) -> None:
+        if self.journal is not None:
+            with self.journal.lock:
+                self.journal.close(self.db)
 
     def get_ids(self, collection_name: str) -> list[int | str]:
         collection = self.db.setdefault(collection_name, {})
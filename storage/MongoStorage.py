@@ -1,9 +1,15 @@
+from collections.abc import Iterable, Iterator
+
 import pymongo
 
 from .BaseStorage import BaseStorage
+from .IdAllocator import MongoIdAllocator
+from .query import empty_aggregates, get_aggregate_name, only_counts, order_by_ids
 
 
 class MongoStorage(BaseStorage):
+    batch_size = 1000
+
     def __init__(
         self,
         storage_path: str | None = "mongodb://localhost:27017",
@@ -11,6 +17,7 @@ class MongoStorage(BaseStorage):
     ):
         self.db: pymongo.database.Database = pymongo.MongoClient(storage_path).db
         self.primary_type = str if uuid_id else int
+        self.id_allocator = MongoIdAllocator(self.db, self.get_ids)
 
     def get_where_params(self, where_params_raw):
         where_params = {}
@@ -43,33 +50,136 @@ class MongoStorage(BaseStorage):
 
     def get_with_id(self, collection_name: str, item_id: int | str) -> dict:
         collection = self.db[collection_name]
-        return {
-            (k if k != "_id" else "id"): v
-            for k, v in (collection.find_one({"_id": item_id}) or {}).items()
-        }
+        return self.to_item(collection.find_one({"_id": item_id}) or {})
+
+    def get_many(self, collection_name: str, item_ids: list) -> list[dict]:
+        documents = self.db[collection_name].find({"_id": {"$in": item_ids}})
+        return order_by_ids(map(self.to_item, documents), item_ids)
 
     def get_without_id(
         self, collection_name: str, where_params_list: list, meta_params: dict
     ) -> list:
+        return list(
+            self.iter_without_id(collection_name, where_params_list, meta_params)
+        )
+
+    def iter_without_id(
+        self, collection_name: str, where_params_list: list, meta_params: dict
+    ) -> Iterator[dict]:
         collection = self.db[collection_name]
+        find_params = self.get_find_params(where_params_list, meta_params)
+        return map(self.to_item, collection.find(**find_params))
+
+    def get_find_params(self, where_params_list: list, meta_params: dict) -> dict:
         where_params_dict = self.get_where_params(where_params_list)
-        order_key = [
-            (
-                order_by_arg if order_by_arg != "id" else "_id",
-                pymongo.DESCENDING if meta_params["desc"] else pymongo.ASCENDING,
-            )
+        desc = meta_params["desc"]
+        order_by = [
+            order_by_arg.lstrip("-") if order_by_arg.lstrip("-") != "id" else "_id"
             for order_by_arg in meta_params["order_by"]
         ]
-        results = collection.find(
-            filter=where_params_dict,
-            sort=order_key,
-            skip=meta_params["_offset"],
-            limit=meta_params["_limit"],
-        )
-        return [
-            {(k if k != "_id" else "id"): v for k, v in item.items()}
-            for item in results
+        after = meta_params.get("_after")
+        if after is not None:
+            where_params_dict = {
+                "$and": [
+                    where_params_dict,
+                    self.get_after_filter(order_by, desc, after),
+                ]
+            }
+        # Ties are broken by id, same as in the other storages
+        if (order_by or after is not None) and "_id" not in order_by:
+            order_by += ["_id"]
+        order_key = [
+            (order_by_arg, pymongo.DESCENDING if desc else pymongo.ASCENDING)
+            for order_by_arg in order_by
         ]
+        fields = meta_params.get("_fields")
+        projection = (
+            [field if field != "id" else "_id" for field in fields] if fields else None
+        )
+        return {
+            "filter": where_params_dict,
+            "projection": projection,
+            "sort": order_key,
+            "skip": meta_params["_offset"],
+            "limit": meta_params["_limit"],
+            "batch_size": self.batch_size,
+        }
+
+    def get_after_filter(self, order_by: list[str], desc: bool, after: list) -> dict:
+        # (order_by..., _id) > cursor as a range filter, null/missing sort first
+        branches, equal = [], []
+        for field, value in zip([*order_by, "_id"], after):
+            if value is None:
+                if not desc:
+                    branches.append({"$and": [*equal, {field: {"$ne": None}}]})
+                equal.append({field: None})
+            else:
+                beyond = (
+                    {"$or": [{field: {"$lt": value}}, {field: None}]}
+                    if desc
+                    else {field: {"$gt": value}}
+                )
+                branches.append({"$and": [*equal, beyond]})
+                equal.append({field: value})
+        return {"$or": branches}
+
+    def count(self, collection_name: str) -> int:
+        # From the collection metadata, without scanning
+        return self.db[collection_name].estimated_document_count()
+
+    def aggregate(
+        self,
+        collection_name: str,
+        where_params_list: list,
+        aggregates: list,
+        group_by: list,
+    ) -> list[dict]:
+        if only_counts(where_params_list, aggregates, group_by):
+            return [
+                {
+                    **empty_aggregates(aggregates),
+                    "count": self.count(collection_name),
+                }
+            ]
+        pipeline = self.get_aggregate_pipeline(where_params_list, aggregates, group_by)
+        documents = self.db[collection_name].aggregate(pipeline)
+        return self.to_aggregate_rows(list(documents), aggregates, group_by)
+
+    def get_aggregate_pipeline(
+        self, where_params_list: list, aggregates: list, group_by: list
+    ) -> list[dict]:
+        # Fields are referenced by position, names may contain dots or $
+        group: dict = {
+            "_id": {
+                f"g{i}": "$" + (field if field != "id" else "_id")
+                for i, field in enumerate(group_by)
+            }
+            if group_by
+            else None
+        }
+        for i, (function, field) in enumerate(aggregates):
+            if function == "count":
+                group[f"a{i}"] = {"$sum": 1}
+            else:
+                field = field if field != "id" else "_id"
+                group[f"a{i}"] = {f"${function}": "$" + field}
+        return [{"$match": self.get_where_params(where_params_list)}, {"$group": group}]
+
+    def to_aggregate_rows(
+        self, documents: list[dict], aggregates: list, group_by: list
+    ) -> list[dict]:
+        rows = []
+        for document in documents:
+            row = {
+                field: (document["_id"] or {}).get(f"g{i}")
+                for i, field in enumerate(group_by)
+            }
+            for i, (function, field) in enumerate(aggregates):
+                row[get_aggregate_name(function, field)] = document[f"a{i}"]
+            rows.append(row)
+        if not rows and not group_by:
+            rows.append(empty_aggregates(aggregates))
+        return rows
 
     def upsert(
         self, collection_name: str, data: dict, method: str = "POST"
@@ -114,24 +224,25 @@ class MongoStorage(BaseStorage):
             collection.delete_many(where_params_dict)
         else:
             collection.drop()
+            self.id_allocator.reset(collection_name)
 
-    def all(self) -> dict:
-        return {
-            collection_name: [
-                {(k if k != "_id" else "id"): v for k, v in item.items()}
-                for item in self.db[collection_name].find()
-            ]
-            for collection_name in self.db.list_collection_names()
-        }
+    def iter_all(self) -> Iterator[tuple[str, Iterable[dict]]]:
+        for collection_name in self.db.list_collection_names():
+            if collection_name != self.id_allocator.collection_name:
+                cursor = self.db[collection_name].find(batch_size=self.batch_size)
+                yield collection_name, map(self.to_item, cursor)
 
     def reset(self) -> None:
         self.db.client.drop_database(self.db)
+        self.id_allocator.reset()
 
     def get_ids(self, collection_name: str) -> list[int | str]:
-        return [item["_id"] for item in self.db[collection_name].find()]
-
-    def get_items(self, collection_name: str) -> list[dict]:
         return [
-            {(k if k != "_id" else "id"): v for k, v in item.items()}
-            for item in self.db[collection_name].find()
+            item["_id"] for item in self.db[collection_name].find(projection=["_id"])
         ]
+
+    def get_items(self, collection_name: str) -> list[dict]:
+        return [self.to_item(item) for item in self.db[collection_name].find()]
+
+    def to_item(self, document: dict) -> dict:
+        return {(k if k != "_id" else "id"): v for k, v in document.items()}
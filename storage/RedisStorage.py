@@ -1,14 +1,46 @@
 import json
+from collections.abc import Iterable, Iterator
+
 import redis
 
 from .BaseStorage import BaseStorage
+from .IdAllocator import RedisIdAllocator
+from .query import compile_where, get_read_fields, paginate, project
+
+
+class CountingPipeline(redis.client.Pipeline):
+    def __init__(self, client: "CountingRedis", *args):
+        super().__init__(client.connection_pool, client.response_callbacks, *args)
+        self.client = client
+
+    def execute(self, raise_on_error: bool = True) -> list:
+        if self.command_stack:
+            self.client.round_trips += 1
+        return super().execute(raise_on_error)
+
+
+class CountingRedis(redis.Redis):
+    # Counts network round trips, a whole pipeline is a single one
+    round_trips = 0
+
+    def execute_command(self, *args, **options):
+        self.round_trips += 1
+        return super().execute_command(*args, **options)
+
+    def pipeline(self, transaction=True, shard_hint=None) -> CountingPipeline:
+        return CountingPipeline(self, transaction, shard_hint)
 
 
 class RedisStorage(BaseStorage):
-    def __init__(self, _: str | None = None, uuid_id: bool = False):
+    def __init__(
+        self, _: str | None = None, uuid_id: bool = False, batch_size: int = 1000
+    ):
         super().__init__()
-        self.db = redis.Redis(decode_responses=True)
+        # Items read per pipelined round trip
+        self.batch_size = batch_size
+        self.db = CountingRedis(decode_responses=True)
         self.primary_type = str if uuid_id else int
+        self.id_allocator = RedisIdAllocator(self.db, self.get_ids)
 
     def get_with_id(self, collection_name: str, item_id: int | str) -> dict:
         item = {
@@ -17,79 +49,91 @@ class RedisStorage(BaseStorage):
         }
         return item
 
+    def get_many(self, collection_name: str, item_ids: list) -> list[dict]:
+        # A single round trip, HGETALL of every id pipelined
+        return self.get_batch(collection_name, item_ids)
+
     def upsert(
         self, collection_name: str, data: dict, method: str = "POST"
     ) -> int | str:
         item_id = self.get_id(collection_name, data)
-        if method == "PUT":
-            self.db.delete(f"{collection_name}:{item_id}")
         data = {k: self.encode(v) for k, v in data.items()}
-        self.db.hset(f"{collection_name}:{item_id}", mapping=data)
-        self.db.sadd("collections", collection_name)
-        self.db.sadd(collection_name, item_id)
+        with self.db.pipeline(transaction=True) as pipeline:
+            if method == "PUT":
+                pipeline.delete(f"{collection_name}:{item_id}")
+            pipeline.hset(f"{collection_name}:{item_id}", mapping=data)
+            pipeline.sadd("collections", collection_name)
+            pipeline.sadd(collection_name, item_id)
+            pipeline.execute()
         return item_id
 
     def bulk_upsert(
         self, collection_name: str, items: list[dict], method: str = "POST"
     ) -> list[int | str]:
-        self.bulk_get_ids(collection_name, items)
-        if method == "PUT":
+        item_ids = self.bulk_get_ids(collection_name, items)
+        # One round trip for the whole batch, applied atomically
+        with self.db.pipeline(transaction=True) as pipeline:
+            if method == "PUT" and items:
+                pipeline.delete(
+                    *(f"{collection_name}:{item_id}" for item_id in item_ids)
+                )
             for item in items:
-                self.db.delete(f"{collection_name}:{item['id']}")
-        for item in items:
-            item = {k: self.encode(v) for k, v in item.items()}
-            self.db.hset(f"{collection_name}:{item['id']}", mapping=item)
-            self.db.sadd(collection_name, item["id"])
-        self.db.sadd("collections", collection_name)
-        return [item["id"] for item in items]
+                mapping = {k: self.encode(v) for k, v in item.items()}
+                pipeline.hset(f"{collection_name}:{item['id']}", mapping=mapping)
+            if items:
+                pipeline.sadd(collection_name, *item_ids)
+            pipeline.sadd("collections", collection_name)
+            pipeline.execute()
+        return item_ids
 
     def delete_with_id(self, collection_name: str, doc_id: int | str) -> bool:
-        return bool(
-            self.db.delete(f"{collection_name}:{doc_id}")
-            and self.db.srem(collection_name, doc_id)
-        )
+        with self.db.pipeline(transaction=True) as pipeline:
+            pipeline.delete(f"{collection_name}:{doc_id}")
+            pipeline.srem(collection_name, doc_id)
+            deleted, removed = pipeline.execute()
+        return bool(deleted and removed)
 
     def delete_without_id(self, collection_name: str, where_params: list) -> None:
         if where_params:
+            predicate = compile_where(where_params)
             item_ids = [
                 item["id"]
                 for item in self.get_items(collection_name)
-                if all(self.fulfill_cond(item, param) for param in where_params)
+                if predicate(item)
             ]
             if item_ids:
-                self.db.delete(
-                    *(f"{collection_name}:{item_id}" for item_id in item_ids)
-                )
-                self.db.srem(collection_name, *item_ids)
+                with self.db.pipeline(transaction=True) as pipeline:
+                    pipeline.delete(
+                        *(f"{collection_name}:{item_id}" for item_id in item_ids)
+                    )
+                    pipeline.srem(collection_name, *item_ids)
+                    pipeline.execute()
         else:
             members = self.db.smembers(collection_name)
             if members:
-                self.db.delete(
-                    *(f"{collection_name}:{item_id}" for item_id in members)  # type: ignore[union-attr]
-                )
-                self.db.srem("collections", collection_name)
-                self.db.delete(collection_name)
+                with self.db.pipeline(transaction=True) as pipeline:
+                    pipeline.delete(
+                        *(f"{collection_name}:{item_id}" for item_id in members)  # type: ignore[union-attr]
+                    )
+                    pipeline.srem("collections", collection_name)
+                    pipeline.delete(collection_name)
+                    pipeline.execute()
+            self.id_allocator.reset(collection_name)
 
     def all(self):
         items = {
-            collection_name: sorted(
-                [
-                    {
-                        k: self.decode(v)
-                        for k, v in self.db.hgetall(
-                            f"{collection_name}:{item_id}"
-                        ).items()
-                    }
-                    for item_id in self.db.smembers(collection_name)
-                ],
-                key=lambda item: item["id"],
-            )
-            for collection_name in self.db.smembers("collections")
+            collection_name: sorted(items, key=lambda item: item["id"])
+            for collection_name, items in self.iter_all()
         }
         return items
 
+    def iter_all(self) -> Iterator[tuple[str, Iterable[dict]]]:
+        for collection_name in self.db.smembers("collections"):  # type: ignore[union-attr]
+            yield collection_name, self.iter_items(collection_name)
+
     def reset(self) -> None:
         self.db.flushdb()
+        self.id_allocator.reset()
 
     def get_ids(self, collection_name: str) -> list[int | str]:
         item_ids = [
@@ -98,12 +142,62 @@ class RedisStorage(BaseStorage):
         ]
         return item_ids
 
+    def count(self, collection_name: str) -> int:
+        # The set of ids is the per-collection counter
+        return self.db.scard(collection_name)  # type: ignore[return-value]
+
+    def iter_without_id(
+        self, collection_name: str, where_params: list, meta_params: dict
+    ) -> Iterator[dict]:
+        fields = get_read_fields(where_params, meta_params)
+        if fields is None:
+            return super().iter_without_id(collection_name, where_params, meta_params)
+        # Only the fields needed are read, with HMGET instead of HGETALL
+        predicate = compile_where(where_params)
+        items = (
+            item for item in self.iter_items(collection_name, fields) if predicate(item)
+        )
+        return iter(project(paginate(items, meta_params), meta_params["_fields"]))
+
     def get_items(self, collection_name) -> list[dict]:
-        items = [
-            self.get_with_id(collection_name, item_id)
-            for item_id in self.db.smembers(collection_name)  # type: ignore[union-attr]
-        ]
-        return items
+        return list(self.iter_items(collection_name))
+
+    def get_candidates(
+        self, collection_name: str, where_params: list
+    ) -> Iterable[dict]:
+        return self.iter_items(collection_name)
+
+    def iter_items(
+        self, collection_name: str, fields: list[str] | None = None
+    ) -> Iterator[dict]:
+        # SSCAN may return a member more than once
+        seen: set[str] = set()
+        batch: list[str] = []
+        for item_id in self.db.sscan_iter(collection_name, count=self.batch_size):
+            if item_id not in seen:
+                seen.add(item_id)
+                batch.append(item_id)
+            if len(batch) == self.batch_size:
+                yield from self.get_batch(collection_name, batch, fields)
+                batch = []
+        yield from self.get_batch(collection_name, batch, fields)
+
+    def get_batch(
+        self, collection_name: str, item_ids: list[str], fields: list[str] | None = None
+    ) -> list[dict]:
+        pipeline = self.db.pipeline(transaction=False)
+        for item_id in item_ids:
+            if fields:
+                pipeline.hmget(f"{collection_name}:{item_id}", fields)
+            else:
+                pipeline.hgetall(f"{collection_name}:{item_id}")
+        items = pipeline.execute()
+        if fields:
+            items = [
+                {k: v for k, v in zip(fields, values) if v is not None}
+                for values in items
+            ]
+        return [{k: self.decode(v) for k, v in item.items()} for item in items if item]
 
     def decode(self, obj):
         try:
@@ -0,0 +1,102 @@
+import asyncio
+from collections.abc import AsyncIterator, Callable, Iterable
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from itertools import islice
+from typing import TypeVar
+
+from .AsyncBaseStorage import AsyncBaseStorage
+
+T = TypeVar("T")
+
+
+class ThreadedStorage(AsyncBaseStorage):
+    # Runs a blocking storage in a bounded thread pool, so a slow query or file
+    # write only occupies one of the workers instead of the event loop
+    batch_size = 1000
+
+    def __init__(self, storage, max_workers: int = 4):
+        self.storage = storage
+        self.primary_type = storage.primary_type
+        self.executor = ThreadPoolExecutor(
+            max_workers, thread_name_prefix=type(storage).__name__
+        )
+
+    async def run(self, func: Callable[..., T], *args, **kwargs) -> T:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, partial(func, *args, **kwargs))
+
+    async def iterate(self, items: Iterable[T]) -> AsyncIterator[T]:
+        # Lazy iterators (e.g. server-side cursors) are advanced in the pool too,
+        # a batch at a time
+        iterator = iter(items)
+        while batch := await self.run(list, islice(iterator, self.batch_size)):
+            for item in batch:
+                yield item
+
+    async def get_with_id(self, table_name: str, item_id: int | str) -> dict:
+        return await self.run(self.storage.get_with_id, table_name, item_id)
+
+    async def get_many(self, table_name: str, item_ids: list) -> list[dict]:
+        return await self.run(self.storage.get_many, table_name, item_ids)
+
+    async def get_without_id(
+        self, table_name: str, where_params: list, meta_params: dict
+    ) -> list:
+        return await self.run(
+            self.storage.get_without_id, table_name, where_params, meta_params
+        )
+
+    async def iter_without_id(
+        self, table_name: str, where_params: list, meta_params: dict
+    ) -> AsyncIterator[dict]:
+        items = await self.run(
+            self.storage.iter_without_id, table_name, where_params, meta_params
+        )
+        async for item in self.iterate(items):
+            yield item
+
+    async def count(self, table_name: str) -> int:
+        return await self.run(self.storage.count, table_name)
+
+    async def aggregate(
+        self, table_name: str, where_params: list, aggregates: list, group_by: list
+    ) -> list[dict]:
+        return await self.run(
+            self.storage.aggregate, table_name, where_params, aggregates, group_by
+        )
+
+    async def upsert(
+        self, table_name: str, data: dict, method: str = "POST"
+    ) -> int | str:
+        return await self.run(self.storage.upsert, table_name, data, method)
+
+    async def bulk_upsert(
+        self, table_name: str, items: list[dict], method: str = "POST"
+    ) -> list[int | str]:
+        return await self.run(self.storage.bulk_upsert, table_name, items, method)
+
+    async def delete_with_id(self, table_name: str, item_id: int | str) -> bool:
+        return await self.run(self.storage.delete_with_id, table_name, item_id)
+
+    async def delete_without_id(self, table_name: str, where_params: list) -> None:
+        await self.run(self.storage.delete_without_id, table_name, where_params)
+
+    async def all(self) -> dict:
+        return await self.run(self.storage.all)
+
+    async def iter_all(self) -> AsyncIterator[tuple[str, AsyncIterator[dict]]]:
+        # One table at a time, each table's items are only read once consumed
+        tables = await self.run(self.storage.iter_all)
+        while table := await self.run(next, tables, None):
+            table_name, items = table
+            yield table_name, self.iterate(items)
+
+    async def reset(self) -> None:
+        await self.run(self.storage.reset)
+
+    async def close(self) -> None:
+        # Connections are closed from the worker threads that opened them
+        if hasattr(self.storage, "close"):
+            await self.run(self.storage.close)
+        self.executor.shutdown()
@@ -0,0 +1,361 @@
+import heapq
+import operator
+import re
+from collections.abc import Callable, Iterable
+from functools import lru_cache
+from itertools import islice
+from operator import itemgetter
+from typing import Any
+
+Predicate = Callable[[dict], bool]
+
+
+def contains(collection) -> Callable[[Any], bool]:
+    try:
+        lookup = frozenset(collection)
+    except TypeError:
+        return collection.__contains__
+
+    def check(value) -> bool:
+        try:
+            return value in lookup
+        except TypeError:
+            return value in collection
+
+    return check
+
+
+def like(field: str, pattern, flags: int = 0) -> Predicate:
+    search = re.compile(str(pattern), flags).search
+    return lambda item: search(str(item.get(field))) is not None
+
+
+def compare(op: Callable[[Any, Any], bool]) -> Callable[[str, Any], Predicate]:
+    # Missing values never match an ordering, like NULL in SQL, so the result
+    # doesn't depend on the order of the filters
+    def predicate(field: str, value) -> Predicate:
+        return lambda item: (
+            (field_value := item.get(field)) is not None and op(field_value, value)
+        )
+
+    return predicate
+
+
+def between(field: str, bounds: list) -> Predicate:
+    lower, upper = bounds[0], bounds[-1]
+    return lambda item: (
+        (value := item.get(field)) is not None and lower <= value <= upper
+    )
+
+
+def is_in(field: str, collection: list) -> Predicate:
+    check = contains(collection)
+    return lambda item: check(item.get(field))
+
+
+def not_in(field: str, collection: list) -> Predicate:
+    check = contains(collection)
+    return lambda item: not check(item.get(field))
+
+
+def starts_with(field: str, prefix) -> Predicate:
+    prefix = str(prefix)
+    return lambda item: str(item.get(field)).startswith(prefix)
+
+
+def ends_with(field: str, suffix) -> Predicate:
+    suffix = str(suffix)
+    return lambda item: str(item.get(field)).endswith(suffix)
+
+
+ops: dict[str, Callable[[str, Any], Predicate]] = {
+    "=": lambda field, value: lambda item: item.get(field) == value,
+    "eq": lambda field, value: lambda item: item.get(field) == value,
+    "ne": lambda field, value: lambda item: item.get(field) != value,
+    "neq": lambda field, value: lambda item: item.get(field) != value,
+    "not": lambda field, value: lambda item: item.get(field) != value,
+    "ge": compare(operator.ge),
+    "gte": compare(operator.ge),
+    "gt": compare(operator.gt),
+    "le": compare(operator.le),
+    "lte": compare(operator.le),
+    "lt": compare(operator.lt),
+    "between": between,
+    "in": is_in,
+    "notin": not_in,
+    "like": like,
+    "ilike": lambda field, pattern: like(field, pattern, re.IGNORECASE),
+    "startswith": starts_with,
+    "endswith": ends_with,
+}
+
+
+def get_predicate(op_name: str, field: str, value) -> Predicate:
+    # Blank params only check that the field is set
+    if not value:
+        return lambda item: item.get(field) is not None
+    return ops[op_name](field, value)
+
+
+def conjunction(predicates: list[Predicate]) -> Predicate:
+    if not predicates:
+        return lambda item: True
+    if len(predicates) == 1:
+        return predicates[0]
+    head, tail = predicates[0], conjunction(predicates[1:])
+    return lambda item: head(item) and tail(item)
+
+
+# Query values come from JSON, so they are frozen into hashable cache keys
+# together with their type, as 1, 1.0 and True are equal but behave differently
+def freeze(value):
+    if isinstance(value, list):
+        return list, tuple(freeze(element) for element in value)
+    if isinstance(value, dict):
+        return dict, tuple((key, freeze(element)) for key, element in value.items())
+    return type(value), value
+
+
+def thaw(frozen):
+    kind, value = frozen
+    if kind is list:
+        return [thaw(element) for element in value]
+    if kind is dict:
+        return {key: thaw(element) for key, element in value}
+    return value
+
+
+@lru_cache(maxsize=1024)
+def compile_frozen(frozen_params: tuple) -> Predicate:
+    return conjunction(
+        [
+            get_predicate(op_name, field, thaw(value))
+            for op_name, field, value in frozen_params
+        ]
+    )
+
+
+def compile_where(where_params: list) -> Predicate:
+    return compile_frozen(
+        tuple((op_name, field, freeze(value)) for op_name, field, value in where_params)
+    )
+
+
+def get_order_key(order_by: list[str]) -> Callable[[dict], Any]:
+    # Sort by (value is not None, value) to put None-s first, then by id
+    if order_by == ["id"]:
+        return itemgetter("id")
+    if len(order_by) == 1:
+        field = order_by[0]
+        return lambda item: (
+            (value := item.get(field)) is not None,
+            value,
+            item["id"],
+        )
+    return lambda item: tuple(
+        [((value := item.get(field)) is not None, value) for field in order_by]
+        + [item["id"]]
+    )
+
+
+def paginate(items: Iterable[dict], meta_params: dict) -> Iterable[dict]:
+    offset = meta_params["_offset"]
+    limit = meta_params["_limit"]
+    order_by = [order_by_arg.lstrip("-") for order_by_arg in meta_params["order_by"]]
+
+    after = meta_params.get("_after")
+
+    # Without ordering items are streamed and only the requested page is kept
+    if not order_by and after is None:
+        return islice(items, offset, offset + limit if limit else None)
+
+    order_key = get_order_key(order_by)
+    desc = meta_params["desc"]
+    if after is not None:
+        # Keyset pagination, skip everything up to and including the cursor
+        after_key = order_key({**dict(zip(order_by, after)), "id": after[-1]})
+        if desc:
+            items = (item for item in items if order_key(item) < after_key)
+        else:
+            items = (item for item in items if order_key(item) > after_key)
+    if limit:
+        # Bounded heap of offset + limit items instead of sorting everything
+        select = heapq.nlargest if desc else heapq.nsmallest
+        return select(offset + limit, items, key=order_key)[offset:]
+    return sorted(items, key=order_key, reverse=desc)[offset:]
+
+
+def order_by_ids(items: Iterable[dict], item_ids: list) -> list[dict]:
+    # Items of a batch lookup in the requested order, missing ones left out
+    items_by_id = {item["id"]: item for item in items}
+    return [items_by_id[item_id] for item_id in item_ids if item_id in items_by_id]
+
+
+def get_projector(fields: list[str]) -> Callable[[dict], dict]:
+    # Only the requested fields are copied, stored items are never modified
+    return lambda item: {field: item[field] for field in fields if field in item}
+
+
+def get_read_fields(where_params: list, meta_params: dict) -> list[str] | None:
+    # Fields a projected query has to read, to filter, sort and return items
+    fields = meta_params.get("_fields")
+    if not fields:
+        return None
+    order_by = [order_by_arg.lstrip("-") for order_by_arg in meta_params["order_by"]]
+    where_fields = [field for _, field, _ in where_params]
+    return list(dict.fromkeys(["id", *fields, *order_by, *where_fields]))
+
+
+def project(items: Iterable[dict], fields: list[str] | None) -> Iterable[dict]:
+    return map(get_projector(fields), items) if fields else items
+
+
+def get_aggregate_name(function: str, field: str | None) -> str:
+    return f"{function}_{field}" if field else function
+
+
+def only_counts(where_params: list, aggregates: list, group_by: list) -> bool:
+    # Unfiltered counts are answered from the collection size
+    return (
+        not where_params
+        and not group_by
+        and all(function == "count" for function, _ in aggregates)
+    )
+
+
+def empty_aggregates(aggregates: list) -> dict:
+    # Row of a group without any items, sums are 0 and the rest undefined
+    return {
+        get_aggregate_name(function, field): 0 if function in {"count", "sum"} else None
+        for function, field in aggregates
+    }
+
+
+# bool is a subclass of int, but isn't summed
+number_types = frozenset({int, float})
+
+
+class Aggregation:
+    # Accumulates (function, field) aggregates per group_by values in a single
+    # pass. Items are bucketed by group a batch at a time and each bucket is
+    # folded with the builtin sum, min and max. sum and avg skip non-numeric
+    # values, min and max skip None and values that can't be compared
+    batch_size = 10_000
+
+    def __init__(self, aggregates: list, group_by: list[str]):
+        self.aggregates = aggregates
+        self.group_by = group_by
+        self.groups: dict[Any, tuple[list, list]] = {}
+
+    def update(self, items: Iterable[dict]) -> None:
+        iterator = iter(items)
+        while batch := list(islice(iterator, self.batch_size)):
+            self.add_batch(batch)
+
+    def add_batch(self, items: list[dict]) -> None:
+        if not self.group_by:
+            self.fold((), [], items)
+            return
+        # Keys are the values with their types, as 1, 1.0 and True are equal.
+        # Types are checked once per column when the whole batch shares them
+        columns = [[item.get(field) for item in items] for field in self.group_by]
+        kinds = [set(map(type, column)) for column in columns]
+        if all(len(kind) == 1 for kind in kinds):
+            types = tuple(kind.pop() for kind in kinds)
+            keys = ((types, values) for values in zip(*columns))
+        else:
+            keys = ((tuple(map(type, values)), values) for values in zip(*columns))
+        buckets: dict[Any, list[dict]] = {}
+        for item, key in zip(items, keys):
+            try:
+                bucket = buckets.get(key)
+            except TypeError:
+                # Lists and dicts are grouped by their frozen value
+                key = freeze(list(key[1]))
+                bucket = buckets.get(key)
+            if bucket is None:
+                buckets[key] = [item]
+            else:
+                bucket.append(item)
+        for key, bucket in buckets.items():
+            values = thaw(key) if key[0] is list else list(key[1])
+            self.fold(key, values, bucket)
+
+    def fold(self, key, values: list, items: list[dict]) -> None:
+        group = self.groups.get(key)
+        if group is None:
+            group = self.groups[key] = (
+                values,
+                [self.start(f) for f, _ in self.aggregates],
+            )
+        accumulators = group[1]
+        for i, (function, field) in enumerate(self.aggregates):
+            if function == "count":
+                accumulators[i] += len(items)
+            elif function in {"sum", "avg"}:
+                numbers = [
+                    value
+                    for item in items
+                    if type(value := item.get(field)) in number_types
+                ]
+                total, count = accumulators[i]
+                accumulators[i] = (total + sum(numbers), count + len(numbers))
+            else:
+                present = [
+                    value for item in items if (value := item.get(field)) is not None
+                ]
+                if accumulators[i] is not None:
+                    present.insert(0, accumulators[i])
+                accumulators[i] = self.extreme(function, present)
+
+    def extreme(self, function: str, values: list):
+        if not values:
+            return None
+        try:
+            return min(values) if function == "min" else max(values)
+        except TypeError:
+            # Mixed types, values not comparable with the current one are skipped
+            current = values[0]
+            for value in values[1:]:
+                try:
+                    if value < current if function == "min" else value > current:
+                        current = value
+                except TypeError:
+                    pass
+            return current
+
+    def start(self, function: str):
+        if function == "count":
+            return 0
+        if function in {"sum", "avg"}:
+            return 0, 0
+        return None
+
+    def rows(self) -> list[dict]:
+        rows = []
+        for values, accumulators in self.groups.values():
+            row = dict(zip(self.group_by, values))
+            for (function, field), value in zip(self.aggregates, accumulators):
+                if function == "sum":
+                    value = value[0]
+                elif function == "avg":
+                    value = value[0] / value[1] if value[1] else None
+                row[get_aggregate_name(function, field)] = value
+            rows.append(row)
+        # Without grouping there is always a single row, even for no items
+        if not rows and not self.group_by:
+            rows.append(empty_aggregates(self.aggregates))
+        return rows
+
+
+def sort_groups(rows: list[dict], group_by: list[str]) -> list[dict]:
+    # Groups are ordered by their values, None-s first like in get_order_key
+    def group_key(row: dict) -> tuple:
+        return tuple(
+            ((value := row.get(field)) is not None, value) for field in group_by
+        )
+
+    try:
+        return sorted(rows, key=group_key)
+    except TypeError:
+        return sorted(rows, key=lambda row: repr(group_key(row)))
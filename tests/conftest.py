@@ -1,16 +1,31 @@
+import os
+
 import pytest
 
 import RESTface
 
+# Storages that need a running server, e.g. RESTFACE_TEST_SERVERS=mongo,redis
+servers = os.environ.get("RESTFACE_TEST_SERVERS", "").split(",")
+
+
+def server_param(storage_type):
+    return pytest.param(
+        storage_type,
+        marks=pytest.mark.skipif(
+            storage_type not in servers,
+            reason=f"set RESTFACE_TEST_SERVERS={storage_type} to run",
+        ),
+    )
+
 
 @pytest.fixture(
-    autouse=True,
     params=[
         "memory",
+        "columnar",
         "file",
         "db",
-        # "mongo",
-        # "redis",
+        server_param("mongo"),
+        server_param("redis"),
     ],
 )
 def face(request):
@@ -0,0 +1,122 @@
+import asyncio
+import warnings
+from io import BytesIO
+
+import pytest
+from fastapi import HTTPException, UploadFile
+
+import RESTface
+from storage.DbStorage import DbStorage
+from utils import encode_cursor
+
+
+@pytest.fixture
+def async_face(face):
+    storage_type = face.storage.__class__.__name__.removesuffix("Storage").lower()
+    _face = RESTface.AsyncRESTface(storage_type)
+    yield _face
+    asyncio.run(_face.reset())
+    asyncio.run(_face.close())
+
+
+def test_async_crud(async_face):
+    async def scenario():
+        await async_face.post("https://example.com/users/1/posts", {"title": "a"})
+        await async_face.post("https://example.com/users/1/posts", [{}, {}])
+        await async_face.put("https://example.com/posts/2", {"title": "b"})
+        await async_face.delete("https://example.com/posts/3")
+        with pytest.raises(HTTPException):
+            await async_face.get("https://example.com/posts/3")
+        return (
+            await async_face.get("https://example.com/users/1"),
+            await async_face.get("https://example.com/posts?order_by=title"),
+        )
+
+    user, posts = asyncio.run(scenario())
+    assert user == {"id": 1}
+    assert [(post["id"], post["title"]) for post in posts] == [(1, "a"), (2, "b")]
+
+
+def test_async_concurrent_posts(async_face):
+    async def scenario():
+        await asyncio.gather(
+            *(async_face.post("https://example.com/users") for _ in range(20))
+        )
+        return await async_face.get("https://example.com/users?limit=5&offset=15")
+
+    assert asyncio.run(scenario()) == [{"id": i} for i in range(16, 21)]
+
+
+def test_async_stream(async_face):
+    async def scenario():
+        await async_face.post("https://example.com/users", [{} for _ in range(3)])
+        items = await async_face.stream("https://example.com/users?order_by=")
+        collections = {
+            collection_name: [item async for item in items]
+            async for collection_name, items in async_face.stream_all()
+        }
+        return [item async for item in items], collections
+
+    items, collections = asyncio.run(scenario())
+    assert sorted(item["id"] for item in items) == [1, 2, 3]
+    assert collections == {"users": [{"id": 1}, {"id": 2}, {"id": 3}]}
+
+
+def test_async_cursor_type_mismatch(async_face):
+    if isinstance(getattr(async_face.storage, "storage", None), DbStorage):
+        warnings.warn("SQLite compares values of any type")
+        return
+
+    async def scenario():
+        await async_face.post("https://example.com/users", [{}, {}, {}])
+        cursor = encode_cursor(["a", "a"])
+        await async_face.get(f"https://example.com/users?limit=2&after={cursor}")
+
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(scenario())
+    assert error.value.status_code == 400
+
+
+def test_async_aggregates(async_face):
+    async def scenario():
+        await async_face.post(
+            "https://example.com/orders",
+            [{"user_id": 1, "price": 2}, {"user_id": 1}, {"user_id": 2, "price": 3}],
+        )
+        return (
+            await async_face.get("https://example.com/orders?count&max=price"),
+            await async_face.get("https://example.com/orders?group_by=user_id"),
+        )
+
+    totals, groups = asyncio.run(scenario())
+    assert totals == {"count": 3, "max_price": 3}
+    assert groups == [{"user_id": 1, "count": 2}, {"user_id": 2, "count": 1}]
+
+
+def test_async_embed(async_face):
+    async def scenario():
+        await async_face.post("https://example.com/users/1/posts", [{}, {}])
+        await async_face.post("https://example.com/users/2")
+        return (
+            await async_face.get("https://example.com/users?embed=posts"),
+            await async_face.get("https://example.com/users/2?embed=posts"),
+        )
+
+    users, user = asyncio.run(scenario())
+    posts = [{"id": 1, "user_id": 1}, {"id": 2, "user_id": 1}]
+    assert users == [{"id": 1, "posts": posts}, {"id": 2, "posts": []}]
+    assert user == {"id": 2, "posts": []}
+
+
+def test_upload_in_background(async_face):
+    rows = b"".join(b"%d,item %d\n" % (i, i) for i in range(1, 2501))
+    file = UploadFile(filename="items.csv", file=BytesIO(b"id,name\n" + rows))
+
+    async def scenario():
+        job = await async_face.upload_in_background(file)
+        await async_face.jobs.join()
+        return job.to_dict(), await async_face.get("https://example.com/items?id=2500")
+
+    job, items = asyncio.run(scenario())
+    assert (job["status"], job["rows"], job["errors"]) == ("done", 2500, [])
+    assert items == [{"id": 2500, "name": "item 2500"}]
@@ -0,0 +1,57 @@
+import yaml
+from fastapi.testclient import TestClient
+
+import app
+from utils import to_csv_stream, to_xml_stream, to_yaml_stream, xml_tag
+
+
+def test_xml_escaping():
+    items = [{"id": 1, "name": "<a & b>", "tags": ["x", "y"]}]
+    assert "".join(to_xml_stream(items, "users")) == (
+        "<users><user><id>1</id><name>&lt;a &amp; b&gt;</name>"
+        "<tags>x</tags><tags>y</tags></user></users>"
+    )
+    assert "".join(to_xml_stream({"id": 1}, "users")) == "<user><id>1</id></user>"
+
+
+def test_xml_tag():
+    assert xml_tag("name") == "name"
+    assert xml_tag("first name") == "first_name"
+    assert xml_tag("a<b>") == "a_b_"
+    assert xml_tag("1st") == "_1st"
+    assert xml_tag("-x") == "_-x"
+    assert xml_tag(2) == "_2"
+
+
+def test_empty_collections():
+    assert "".join(to_xml_stream([], "users")) == "<users></users>"
+    assert yaml.safe_load("".join(to_yaml_stream([]))) == []
+    assert "".join(to_csv_stream([])) == "\r\n"
+
+
+def test_yaml():
+    items = [{"id": 1, "name": "a"}, {"id": 2, "address": {"zip": 1}}]
+    assert yaml.safe_load("".join(to_yaml_stream(iter(items)))) == items
+    assert yaml.safe_load("".join(to_yaml_stream(items[0]))) == items[0]
+
+
+def test_csv_header_sample():
+    items = [{"id": i, "address": {"zip": i}} for i in range(1, 4)]
+    items.append({"id": 4, "late": "x"})
+    lines = "".join(to_csv_stream(iter(items), sample_size=2)).splitlines()
+    # Keys first seen after the sample are left out unless asked for
+    assert lines == ["address.zip,id", "1,1", "2,2", "3,3", ",4"]
+    lines = "".join(to_csv_stream(iter(items), ["id", "late"], 2)).splitlines()
+    assert lines == ["id,late", "1,", "2,", "3,", "4,x"]
+
+
+def test_export_cursor():
+    with TestClient(app.app) as client:
+        client.post("/users", json=[{"name": name} for name in "abc"])
+        response = client.get("/users?format=csv&limit=2")
+        assert response.text.splitlines() == ["id,name", "1,a", "2,b"]
+        cursor = response.headers["X-Next-Cursor"]
+        response = client.get(f"/users?format=yaml&limit=2&after={cursor}")
+        assert yaml.safe_load(response.text) == [{"id": 3, "name": "c"}]
+        assert "X-Next-Cursor" not in response.headers
+        client.delete("/")
@@ -1,6 +1,10 @@
+import warnings
+
 import pytest
 from fastapi import HTTPException
 
+from utils import encode_cursor
+
 
 @pytest.fixture
 def items(face):
@@ -53,6 +57,11 @@ def test_children_custom(face, items_with_children):
     ]
 
 
+def test_children_singular_parent(face):
+    face.post("https://example.com/staff/1/posts")
+    assert face.get("https://example.com/staff/1/posts") == [{"id": 1, "staff_id": 1}]
+
+
 def test_sort(face, items_unsorted):
     assert face.get("https://example.com/users?order_by=id") == [
         {"id": i} for i in sorted([21, 3, 19, 37, 28])
@@ -150,3 +159,142 @@ def test_only_ids(face):
 def test_nonexisting(face):
     with pytest.raises(HTTPException):
         face.get("https://example.com/users/1")
+
+
+def test_cached_query(face, items):
+    assert face.get("https://example.com/users?limit=1&id__gt=1") == [{"id": 2}]
+    face.post("https://example.com/users")
+    assert face.get("https://example.com/users?id__gt=1&limit=1&desc") == [{"id": 5}]
+    assert face.get("https://example.com/users?id__gt=1&limit=1") == [{"id": 2}]
+    assert face.parse_query.cache_info().hits == 1
+
+
+def test_unordered_limit(face, items):
+    assert face.get("https://example.com/users?order_by=&limit=2") == [
+        {"id": 1},
+        {"id": 2},
+    ]
+
+
+def get_pages(face, url):
+    items = []
+    page_url = url
+    while page_url:
+        page = face.get(page_url)
+        items += page
+        cursor = face.get_next_cursor(page_url, page)
+        page_url = cursor and f"{url}&after={cursor}"
+    return items
+
+
+def test_after_cursor(face, items_unsorted):
+    assert get_pages(face, "https://example.com/users?limit=2") == [
+        {"id": i} for i in sorted([21, 3, 19, 37, 28])
+    ]
+    assert get_pages(face, "https://example.com/users?limit=2&desc") == [
+        {"id": i} for i in sorted([21, 3, 19, 37, 28], reverse=True)
+    ]
+
+
+def test_after_cursor_none(face):
+    if face.storage.__class__.__name__ == "MemoryStorage":
+        face.storage.create_index("users", "noneable", "sorted")
+    for i in range(1, 6):
+        face.post(f"https://example.com/users?noneable={i % 3 or 'null'}")
+    ids = [3, 1, 4, 2, 5]
+    for desc in ["", "&desc"]:
+        url = f"https://example.com/users?order_by=noneable&limit=2{desc}"
+        assert [item["id"] for item in get_pages(face, url)] == ids
+        ids.reverse()
+
+
+def test_invalid_cursor(face, items):
+    with pytest.raises(HTTPException):
+        face.get("https://example.com/users?limit=2&after=abc")
+
+
+def test_cursor_type_mismatch(face, items):
+    url = "https://example.com/users?limit=2&after="
+    with pytest.raises(HTTPException) as error:
+        face.get(url + encode_cursor([[1], 1]))
+    assert error.value.status_code == 400
+    if face.storage.__class__.__name__ == "DbStorage":
+        warnings.warn("SQLite compares values of any type")
+        return
+    with pytest.raises(HTTPException) as error:
+        face.get(url + encode_cursor(["a", "a"]))
+    assert error.value.status_code == 400
+
+
+def test_stream(face, items):
+    assert list(face.stream("https://example.com/users?id__gt=2")) == [
+        {"id": 3},
+        {"id": 4},
+    ]
+    assert face.stream("https://example.com/users/1") == {"id": 1}
+    assert {name: list(items) for name, items in face.stream_all()} == face.all()
+
+
+def test_get_many(face, items):
+    assert face.get("https://example.com/users/3,1,9,3") == {
+        "items": [{"id": 3}, {"id": 1}],
+        "missing": [9],
+    }
+    assert face.get("https://example.com/missing/1,2") == {
+        "items": [],
+        "missing": [1, 2],
+    }
+
+
+def test_get_many_body(face, items):
+    face.post("https://example.com/users/2", {"name": "b", "age": 2})
+    face.post("https://example.com/users/4", {"name": "d", "age": 4})
+    assert face.get_many(
+        "https://example.com/users/_mget?fields=name", {"ids": [2, "4", 5]}
+    ) == {"items": [{"id": 2, "name": "b"}, {"id": 4, "name": "d"}], "missing": [5]}
+    assert face.get_many("https://example.com/users/_mget", [4]) == {
+        "items": [{"id": 4, "name": "d", "age": 4}],
+        "missing": [],
+    }
+    with pytest.raises(HTTPException):
+        face.get_many("https://example.com/users/_mget", {"ids": 1})
+
+
+def test_embed(face, items_with_children):
+    face.post("https://example.com/users/3")
+    user_1 = {
+        "id": 1,
+        "posts": [{"id": 1, "user_id": 1}, {"id": 3, "user_id": 1}],
+    }
+    user_2 = {
+        "id": 2,
+        "posts": [{"id": 2, "user_id": 2}, {"id": 4, "user_id": 2}],
+    }
+    assert face.get("https://example.com/users?embed=posts") == [
+        user_1,
+        user_2,
+        {"id": 3, "posts": []},
+    ]
+    assert face.get("https://example.com/users/2?embed=posts") == user_2
+    assert face.get("https://example.com/users/1,2?embed=posts") == {
+        "items": [user_1, user_2],
+        "missing": [],
+    }
+    # Stored items are left as they were
+    assert face.get("https://example.com/users/1") == {"id": 1}
+
+
+def test_embed_batches(face, items_with_children):
+    face.embed_batch_size = 1
+    assert face.get("https://example.com/users?embed=posts,comments&desc") == [
+        {
+            "id": 2,
+            "posts": [{"id": 2, "user_id": 2}, {"id": 4, "user_id": 2}],
+            "comments": [],
+        },
+        {
+            "id": 1,
+            "posts": [{"id": 1, "user_id": 1}, {"id": 3, "user_id": 1}],
+            "comments": [],
+        },
+    ]
@@ -1,5 +1,9 @@
+import warnings
+
 import pytest
 
+from RESTface import RESTface
+
 
 @pytest.fixture
 def items(face):
@@ -82,3 +86,316 @@ def test_endswith(face, items_strings):
     assert face.get("https://example.com/users?char__endswith=b") == [
         {"id": 2, "char": "b"}
     ]
+
+
+def test_comparison_mixed_schema(face):
+    face.post("https://example.com/items", {"type": "book", "pages": 300})
+    face.post("https://example.com/items", {"type": "pen"})
+    # Items without the field don't match, whatever the order of the filters
+    for query in [
+        "type=book&pages__gt=100",
+        "pages__gt=100&type=book",
+        "pages__between=[100,400]&type=book",
+    ]:
+        assert face.get(f"https://example.com/items?{query}") == [
+            {"id": 1, "type": "book", "pages": 300}
+        ]
+    assert face.get("https://example.com/items?pages__lt=1000") == [
+        {"id": 1, "type": "book", "pages": 300}
+    ]
+
+
+@pytest.fixture
+def indexed_items(face):
+    if face.storage.__class__.__name__ == "MemoryStorage":
+        face.storage.create_index("users", "age", "sorted")
+        face.storage.create_index("users", "name", "hash")
+    for i, name in enumerate(["a", "b", "c", "d", "e", "f"]):
+        face.post(f"https://example.com/users?age={i % 3}&name={name}")
+
+
+def test_indexed_eq(face, indexed_items):
+    assert face.get("https://example.com/users?name=b") == [
+        {"id": 2, "age": 1, "name": "b"}
+    ]
+    assert face.get("https://example.com/users?name__in=b,c&age__gt=1") == [
+        {"id": 3, "age": 2, "name": "c"}
+    ]
+
+
+def test_indexed_range_order(face, indexed_items):
+    assert face.get("https://example.com/users?age__between=1,2&order_by=age") == [
+        {"id": 2, "age": 1, "name": "b"},
+        {"id": 5, "age": 1, "name": "e"},
+        {"id": 3, "age": 2, "name": "c"},
+        {"id": 6, "age": 2, "name": "f"},
+    ]
+    assert face.get("https://example.com/users?age__gt=0&desc&limit=2") == [
+        {"id": 6, "age": 2, "name": "f"},
+        {"id": 5, "age": 1, "name": "e"},
+    ]
+
+
+def test_indexed_after_writes(face, indexed_items):
+    face.post("https://example.com/users/2?name=x")
+    face.delete("https://example.com/users/5")
+    face.delete("https://example.com/users?name=c")
+    assert face.get("https://example.com/users?name=b") == []
+    assert face.get("https://example.com/users?age=1") == [
+        {"id": 2, "age": 1, "name": "x"}
+    ]
+    assert face.get("https://example.com/users?name__notin=a,d&order_by=age") == [
+        {"id": 2, "age": 1, "name": "x"},
+        {"id": 6, "age": 2, "name": "f"},
+    ]
+
+
+def test_ilike_pattern_case(face, items_strings):
+    assert face.get("https://example.com/users?char__ilike=A") == [
+        {"id": 1, "char": "a"}
+    ]
+
+
+@pytest.fixture
+def columnar():
+    _face = RESTface("columnar")
+    yield _face
+    _face.reset()
+
+
+def test_columnar_matches_memory(columnar):
+    memory = RESTface("memory")
+    items = [
+        {"age": i % 7, "score": i / 4, "name": f"user {i % 5}", "flag": i % 2 == 0}
+        | ({"note": "x" if i % 3 else None} if i % 4 else {})
+        | {"mixed": i if i % 2 else str(i)}
+        for i in range(50)
+    ]
+    for storage_face in [columnar, memory]:
+        storage_face.post("https://example.com/users", [dict(item) for item in items])
+        storage_face.delete("https://example.com/users?age=3")
+        storage_face.put("https://example.com/users/5", {**items[4], "age": 1})
+    for query in [
+        "age=2",
+        "age__ne=2&score__gt=3",
+        "age__between=1,4&order_by=name,-age&desc",
+        "age__in=1,5&name__notin=user 1",
+        "name__startswith=user 2&order_by=score&limit=3&offset=1",
+        "note=x&order_by=note,age",
+        "note__ne=x",
+        "note",
+        "mixed=4",
+        "mixed__in=3,4,5",
+        "flag=true&order_by=flag,-score",
+        "order_by=note&desc&limit=5",
+    ]:
+        url = f"https://example.com/users?{query}"
+        assert columnar.get(url) == memory.get(url), query
+
+
+@pytest.fixture
+def text_items(face):
+    if face.storage.__class__.__name__ == "MemoryStorage":
+        face.storage.create_index("users", "name", "text")
+    for name in ["Alice Smith", "bob smithers", "Carol", "alicia"]:
+        face.post("https://example.com/users", {"name": name})
+
+
+def test_text_search(face, text_items):
+    if face.storage.__class__.__name__ == "DbStorage":
+        warnings.warn("like and ilike are SQL patterns in DbStorage")
+        return
+    assert face.get("https://example.com/users?name__like=Smith") == [
+        {"id": 1, "name": "Alice Smith"}
+    ]
+    assert face.get("https://example.com/users?name__ilike=ALIC") == [
+        {"id": 1, "name": "Alice Smith"},
+        {"id": 4, "name": "alicia"},
+    ]
+    assert face.get("https://example.com/users?name__startswith=bob") == [
+        {"id": 2, "name": "bob smithers"}
+    ]
+    assert face.get("https://example.com/users?name__endswith=rol") == [
+        {"id": 3, "name": "Carol"}
+    ]
+
+
+def test_text_search_after_writes(face, text_items):
+    if face.storage.__class__.__name__ == "DbStorage":
+        warnings.warn("like and ilike are SQL patterns in DbStorage")
+        return
+    face.post("https://example.com/users/3", {"name": "Carl Smith"})
+    face.delete("https://example.com/users/1")
+    assert face.get("https://example.com/users?name__like=Smith") == [
+        {"id": 3, "name": "Carl Smith"}
+    ]
+    assert face.get("https://example.com/users?name__endswith=rol") == []
+
+
+@pytest.fixture
+def indexed():
+    _face = RESTface("memory")
+    yield _face
+    _face.reset()
+
+
+def test_text_index_matches_scan(indexed):
+    scan = RESTface("memory")
+    indexed.storage.create_index("users", "name", "text")
+    names = ["Straße", "İstanbul", "istanbul", "ıi", "KELVIN", "a.b*c", "abc", "x"]
+    for storage_face in [indexed, scan]:
+        storage_face.post(
+            "https://example.com/users", [{"name": name} for name in names] + [{}]
+        )
+    for op_name, value in [
+        ("like", "abc"),
+        ("like", "ab?c"),
+        ("like", "a.b"),
+        ("like", "[ab]bc"),
+        ("like", "^Str+a"),
+        ("like", "one"),
+        ("ilike", "ISTAN"),
+        ("ilike", "kelv"),
+        ("ilike", "strasse"),
+        ("startswith", "İst"),
+        ("startswith", "No"),
+        ("endswith", "bul"),
+    ]:
+        where_params = [[op_name, "name", value]]
+        meta_params = {"order_by": [], "desc": False, "_limit": 0, "_offset": 0}
+        assert indexed.storage.get_without_id(
+            "users", where_params, meta_params
+        ) == scan.storage.get_without_id("users", where_params, meta_params), value
+
+
+@pytest.fixture
+def orders(face):
+    face.post(
+        "https://example.com/orders",
+        [
+            {"user_id": 1, "price": 10, "status": "paid"},
+            {"user_id": 1, "price": 20, "status": "paid"},
+            {"user_id": 2, "price": 5, "status": "new"},
+            {"user_id": 3, "price": 7.5, "status": "paid"},
+        ],
+    )
+
+
+def test_count(face, orders):
+    assert face.get("https://example.com/orders?count") == {"count": 4}
+    assert face.get("https://example.com/orders?count&status=paid") == {"count": 3}
+    assert face.get("https://example.com/missing?count") == {"count": 0}
+
+
+def test_aggregates(face, orders):
+    assert face.get(
+        "https://example.com/orders?count&sum=price&min=price&max=price&price__gt=5"
+    ) == {"count": 3, "sum_price": 37.5, "min_price": 7.5, "max_price": 20}
+    assert face.get("https://example.com/orders?avg=price&user_id=1") == {
+        "avg_price": 15
+    }
+    assert face.get("https://example.com/orders?sum=price&avg=price&user_id=4") == {
+        "sum_price": 0,
+        "avg_price": None,
+    }
+
+
+def test_group_by(face, orders):
+    assert face.get("https://example.com/orders?group_by=user_id&sum=price") == [
+        {"user_id": 1, "sum_price": 30},
+        {"user_id": 2, "sum_price": 5},
+        {"user_id": 3, "sum_price": 7.5},
+    ]
+    assert face.get(
+        "https://example.com/orders?group_by=status&status__not=new&desc&limit=1"
+    ) == [{"status": "paid", "count": 3}]
+    assert face.get("https://example.com/orders?group_by=user_id,status&user_id=1") == [
+        {"user_id": 1, "status": "paid", "count": 2}
+    ]
+
+
+def test_group_by_missing_field(face, orders):
+    assert face.get("https://example.com/orders?user_id=5&group_by=zz") == []
+    assert face.get("https://example.com/orders?user_id=2&group_by=zz") == [
+        {"zz": None, "count": 1}
+    ]
+
+
+def test_aggregate_missing_collection(face, orders):
+    face.get("https://example.com/missing")
+    collections = face.all()
+    assert face.get("https://example.com/missing?count") == {"count": 0}
+    assert face.get("https://example.com/missing?sum=price") == {"sum_price": 0}
+    assert face.get("https://example.com/missing?group_by=status") == []
+    # Aggregates don't create the collection, no more than a plain read does
+    assert face.all() == collections
+
+
+def test_count_after_writes(face, orders):
+    face.delete("https://example.com/orders/1")
+    face.put("https://example.com/orders/2", {"price": 1})
+    assert face.get("https://example.com/orders?count&sum=price") == {
+        "count": 3,
+        "sum_price": 13.5,
+    }
+
+
+@pytest.fixture
+def wide_items(face):
+    face.post(
+        "https://example.com/users",
+        [
+            {"name": name, "age": age, "city": "Paris", "address": {"zip": age}}
+            for name, age in [("b", 30), ("a", 20), ("c", 40)]
+        ],
+    )
+
+
+def test_fields(face, wide_items):
+    assert face.get("https://example.com/users?fields=name") == [
+        {"id": 1, "name": "b"},
+        {"id": 2, "name": "a"},
+        {"id": 3, "name": "c"},
+    ]
+    # Filters and order_by may use fields that aren't returned
+    assert face.get("https://example.com/users?fields=name&age__gt=25&desc") == [
+        {"id": 3, "name": "c"},
+        {"id": 1, "name": "b"},
+    ]
+    assert face.get("https://example.com/users/2?fields=name,age") == {
+        "id": 2,
+        "name": "a",
+        "age": 20,
+    }
+
+
+def test_fields_order_by_and_cursor(face, wide_items):
+    url = "https://example.com/users?fields=city&order_by=age&desc&limit=2"
+    # The cursor is built from age, which isn't returned
+    page, cursor = face.get_page(url)
+    assert page == [{"id": 3, "city": "Paris"}, {"id": 1, "city": "Paris"}]
+    assert face.get(f"{url}&after={cursor}") == [{"id": 2, "city": "Paris"}]
+    assert list(face.stream(url)) == page
+    url = "https://example.com/users?fields=city,age&order_by=age&limit=2"
+    assert face.get(url) == [
+        {"id": 2, "age": 20, "city": "Paris"},
+        {"id": 1, "age": 30, "city": "Paris"},
+    ]
+    assert face.get(
+        "https://example.com/users?fields=city&order_by=age&embed=posts"
+    ) == [
+        {"id": 2, "city": "Paris", "posts": []},
+        {"id": 1, "city": "Paris", "posts": []},
+        {"id": 3, "city": "Paris", "posts": []},
+    ]
+
+
+def test_fields_nested(face, wide_items):
+    assert face.get("https://example.com/users?fields=address.zip&age=20") == [
+        {"id": 2, "address": {"zip": 20}}
+    ]
+
+
+def test_fields_missing_collection(face):
+    assert face.get("https://example.com/nope?fields=name") == []
+    assert face.get("https://example.com/nope?fields=name&age__gt=25") == []
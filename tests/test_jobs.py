@@ -0,0 +1,28 @@
+import asyncio
+
+from jobs import JobRunner
+
+
+def test_job_runner_limit():
+    async def scenario():
+        runner = JobRunner(max_running=1)
+        release = asyncio.Event()
+
+        async def blocked(job):
+            await release.wait()
+
+        async def failing(job):
+            raise ValueError("broken")
+
+        first = runner.submit("first", blocked)
+        second = runner.submit("second", failing)
+        await asyncio.sleep(0.01)
+        statuses = first.status, second.status
+        release.set()
+        await runner.join()
+        return statuses, second.to_dict()
+
+    statuses, second = asyncio.run(scenario())
+    assert statuses == ("running", "queued")
+    assert second["status"] == "failed"
+    assert second["errors"] == [{"row": 0, "error": "broken"}]
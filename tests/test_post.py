@@ -1,10 +1,13 @@
+import os
+import time
 import uuid
 import warnings
 from io import BytesIO
 
 import pytest
-from fastapi import UploadFile
+from fastapi import HTTPException, UploadFile
 
+from RESTface import RESTface
 from utils import parse_id
 
 
@@ -34,6 +37,24 @@ def test_simple_uuid_id(face):
     )
 
 
+def test_parse_id():
+    item_id = str(uuid.uuid4())
+    spellings = [item_id.upper(), item_id.replace("-", ""), f"urn:uuid:{item_id}"]
+    for spelling in [item_id, *spellings]:
+        assert parse_id(spelling) == spelling
+    assert parse_id("12") == 12
+    for part in ["users", "", item_id[:-1], item_id + "0", "1,2", "²"]:
+        assert parse_id(part) is None
+
+
+def test_invalid_path(face):
+    with pytest.raises(Exception, match="Invalid path"):
+        face.post("https://example.com/users/1/2")
+    with pytest.raises(HTTPException):
+        face.get("https://example.com/users/1/2")
+    assert face.all() == {}
+
+
 def test_simple_child_no_id(face):
     assert face.post("https://example.com/users/1/posts") == 1
     assert face.all() == {"users": [{"id": 1}], "posts": [{"id": 1, "user_id": 1}]}
@@ -96,6 +117,43 @@ def test_modify_put(face):
     assert face.all() == {"users": [{"id": 1, "c": "d"}]}
 
 
+def test_known_parents(face):
+    upsert = face.storage.upsert
+    written = []
+
+    def counted_upsert(collection_name, *args, **kwargs):
+        written.append(collection_name)
+        return upsert(collection_name, *args, **kwargs)
+
+    face.storage.upsert = counted_upsert
+    face.post("https://example.com/users/1/posts/2/comments")
+    face.post("https://example.com/users/1/posts/2/comments")
+    face.post("https://example.com/users/1/posts/3/comments")
+    assert written == ["users", "posts", "comments", "comments", "posts", "comments"]
+
+
+def test_known_parents_deleted(face):
+    face.post("https://example.com/users/1/posts")
+    face.delete("https://example.com/users/1")
+    face.post("https://example.com/users/1/posts")
+    assert face.get("https://example.com/users") == [{"id": 1}]
+    face.delete("https://example.com/users")
+    face.post("https://example.com/users/1/posts")
+    assert face.get("https://example.com/users") == [{"id": 1}]
+    face.reset()
+    face.post("https://example.com/users/1/posts")
+    assert face.get("https://example.com/users") == [{"id": 1}]
+
+
+def test_known_parents_relinked(face):
+    face.post("https://example.com/users/1/posts/2/comments")
+    face.post("https://example.com/users/3/posts/2/comments")
+    assert face.get("https://example.com/posts/2")["user_id"] == 3
+    face.post("https://example.com/posts/2", {"user_id": 1})
+    face.post("https://example.com/users/3/posts/2/comments")
+    assert face.get("https://example.com/posts/2")["user_id"] == 3
+
+
 def test_param_types(face):
     params = {
         "int": "1",
@@ -171,6 +229,44 @@ def test_bulk_partially_existing(face):
     }
 
 
+def test_bulk_blank_ids(face):
+    items = [{"id": None, "name": "a"}, {"id": None, "name": "b"}]
+    assert face.post("https://example.com/teams", items) == [1, 2]
+    assert len(face.get("https://example.com/teams")) == 2
+    # Empty id cells of an upload are read as None
+    file = UploadFile(filename="users.csv", file=BytesIO(b"id,name\n,a\n,b\n,c\n"))
+    assert face.upload(file) == 3
+    assert face.get("https://example.com/users") == [
+        {"id": 1, "name": "a"},
+        {"id": 2, "name": "b"},
+        {"id": 3, "name": "c"},
+    ]
+
+
+def test_bulk_mixed_columns(face):
+    face.post("https://example.com/users", [{"name": "a"}])
+    assert face.post(
+        "https://example.com/users",
+        [{"id": 1, "age": 3}, {"name": "b"}, {"id": 1, "name": "c"}, {"age": 4}],
+    ) == [1, 2, 1, 3]
+    users = face.get("https://example.com/users")
+    assert [(user["id"], user.get("name"), user.get("age")) for user in users] == [
+        (1, "c", 3),
+        (2, "b", None),
+        (3, None, 4),
+    ]
+
+
+def test_bulk_put(face):
+    face.post("https://example.com/users", [{"name": "a"}, {"name": "b"}])
+    face.put("https://example.com/users", [{"id": 1, "age": 3}])
+    users = face.get("https://example.com/users")
+    assert [(user["id"], user.get("name"), user.get("age")) for user in users] == [
+        (1, None, 3),
+        (2, "b", None),
+    ]
+
+
 def test_upload(face):
     file = UploadFile(filename="users.csv", file=BytesIO(b"id,name\n1,a\n2,b"))
     face.upload(file)
@@ -180,3 +276,200 @@ def test_upload(face):
             {"id": 2, "name": "b"},
         ]
     }
+
+
+def test_upload_quoted(face):
+    file = UploadFile(
+        filename="users.csv",
+        file=BytesIO(b'name,bio,age\n"b, c","line\nbreak",3\n,"",4.5\n'),
+    )
+    assert face.upload(file, infer_types=True) == 2
+    users = face.get("https://example.com/users")
+    assert [(user["name"], user["bio"], user["age"]) for user in users] == [
+        ("b, c", "line\nbreak", 3),
+        ("", "", 4.5),
+    ]
+
+
+def test_upload_batches(face):
+    face.upload_batch_size = 2
+    rows = b"".join(b"%d,item %d\n" % (i, i) for i in range(1, 6))
+    assert (
+        face.upload(UploadFile(filename="items.csv", file=BytesIO(b"id,name\n" + rows)))
+        == 5
+    )
+    assert face.get("https://example.com/items?id=5") == [{"id": 5, "name": "item 5"}]
+
+
+def test_explicit_id_moves_counter(face):
+    assert face.post("https://example.com/users/10") == 10
+    assert face.post("https://example.com/users") == 11
+
+
+def test_bulk_explicit_id_reserves_range(face):
+    assert face.post("https://example.com/users", [{"id": 5}, {}, {}]) == [5, 6, 7]
+    assert face.post("https://example.com/users") == 8
+
+
+def test_journal_recovery(tmp_path):
+    path = str(tmp_path / "db.json")
+    options = {"journal": True, "flush": "interval", "flush_interval_ms": 10}
+    journaled = RESTface("file", path, storage_options=options)
+    journaled.post("https://example.com/users", [{"name": "a"}, {"name": "b"}])
+    journaled.put("https://example.com/users/1", {"age": 3})
+    journaled.post("https://example.com/users/2", {"age": 4})
+    journaled.post("https://example.com/posts", {"title": "c"})
+    journaled.delete("https://example.com/posts")
+    # Crash without compacting, the state is replayed from the journal
+    journal = journaled.storage.journal
+    journal.stopped.set()
+    journal.flush()
+    journal.file.close()
+    assert not os.path.exists(path)
+    recovered = RESTface("file", path, storage_options=options)
+    assert recovered.all() == journaled.all()
+    assert recovered.post("https://example.com/users") == 3
+    recovered.close()
+
+
+def test_journal_compaction(tmp_path):
+    path = str(tmp_path / "db.json")
+    options = {"journal": True, "compact_size": 100}
+    journaled = RESTface("file", path, storage_options=options)
+    for i in range(10):
+        journaled.post("https://example.com/users", {"name": f"user {i}"})
+    journaled.delete("https://example.com/users/1")
+    journaled.close()
+    assert os.path.getsize(path + ".journal") == 0
+    assert not os.path.exists(path + ".journal.compacting")
+    # The snapshot is a regular TinyDB file
+    plain = RESTface("file", path)
+    assert plain.all() == {
+        "users": [{"id": i, "name": f"user {i - 1}"} for i in range(2, 11)]
+    }
+    plain.close()
+
+
+def test_per_collection_files(tmp_path):
+    path = str(tmp_path / "db")
+    options = {"per_collection": True, "max_loaded": 3}
+    files = RESTface("file", path, storage_options=options)
+    files.post("https://example.com/users", [{"name": "a"}, {"name": "b"}])
+    files.post("https://example.com/posts", [{"title": "c"}, {"title": "d"}])
+    assert sorted(os.listdir(path)) == ["posts.json", "users.json"]
+    files.put("https://example.com/users/1", {"name": "e"})
+    # Posts were unloaded to stay under 3 loaded documents
+    assert list(files.storage.db.loaded) == ["users"]
+    assert files.get("https://example.com/posts/2") == {"id": 2, "title": "d"}
+    assert list(files.storage.db.loaded) == ["posts"]
+    files.delete("https://example.com/posts")
+    assert os.listdir(path) == ["users.json"]
+    files.close()
+    reopened = RESTface("file", path, storage_options=options)
+    assert reopened.all() == {"users": [{"id": 2, "name": "b"}, {"id": 1, "name": "e"}]}
+    reopened.close()
+
+
+def test_memory_snapshot(tmp_path):
+    path = str(tmp_path / "db.pickle")
+    options = {"oplog": True, "snapshot_interval": 0}
+    persistent = RESTface("memory", path, storage_options=options)
+    persistent.post("https://example.com/users", [{"name": "a"}, {"name": "b"}])
+    persistent.put("https://example.com/users/1", {"age": 3})
+    persistent.post("https://example.com/posts", {"title": "c"})
+    journal = persistent.storage.journal
+    journal.compact(persistent.storage.db)
+    journal.wait()
+    assert os.path.exists(path)
+    # The rest is only in the operation log
+    persistent.post("https://example.com/users/2", {"age": 4})
+    persistent.delete("https://example.com/posts/1")
+    recovered = RESTface("memory", path, storage_options=options)
+    assert recovered.all() == persistent.all()
+    assert recovered.get("https://example.com/users") == persistent.get(
+        "https://example.com/users"
+    )
+    assert recovered.post("https://example.com/users") == 3
+    recovered.close()
+
+
+def test_memory_snapshot_timer(tmp_path):
+    path = str(tmp_path / "db.pickle")
+    options = {"snapshot_interval": 0.01}
+    persistent = RESTface("memory", path, storage_options=options)
+    persistent.post("https://example.com/users", [{"name": "a"}, {"name": "b"}])
+    # Snapshotted without another write or close()
+    journal = persistent.storage.journal
+    for _ in range(100):
+        if os.path.exists(path):
+            break
+        time.sleep(0.01)
+    journal.wait()
+    journal.stopped.set()
+    assert RESTface("memory", path).all() == persistent.all()
+
+
+def test_memory_snapshot_fork(tmp_path):
+    path = str(tmp_path / "db.pickle")
+    persistent = RESTface("memory", path, storage_options={"fork_snapshots": True})
+    persistent.post("https://example.com/users", [{"name": "a"}, {"name": "b"}])
+    persistent.storage.journal.compact(persistent.storage.db)
+    persistent.storage.journal.wait()
+    assert RESTface("memory", path).all() == persistent.all()
+    persistent.close()
+
+
+def test_memory_snapshot_indexes(tmp_path):
+    path = str(tmp_path / "db.pickle")
+    persistent = RESTface("memory", path)
+    persistent.post("https://example.com/users", [{"name": "a"}, {"name": "b"}])
+    persistent.post("https://example.com/users/1/posts", [{}, {}])
+    persistent.close()
+    recovered = RESTface("memory", path)
+    assert recovered.get("https://example.com/users?name=a") == [{"id": 1, "name": "a"}]
+    assert recovered.get("https://example.com/users/1/posts") == [
+        {"id": 1, "user_id": 1},
+        {"id": 2, "user_id": 1},
+    ]
+    recovered.post("https://example.com/users", {"name": "c"})
+    assert [user["name"] for user in recovered.get("https://example.com/users")] == [
+        "a",
+        "b",
+        "c",
+    ]
+    recovered.close()
+
+
+def test_memory_snapshot_without_oplog(tmp_path):
+    path = str(tmp_path / "db.pickle")
+    persistent = RESTface("memory", path)
+    persistent.post("https://example.com/users", [{"name": "a"}, {"name": "b"}])
+    assert os.path.getsize(path + ".journal") == 0
+    persistent.close()
+    assert RESTface("memory", path).all() == {
+        "users": [{"id": 1, "name": "a"}, {"id": 2, "name": "b"}]
+    }
+
+
+@pytest.fixture
+def redis():
+    if "redis" not in os.environ.get("RESTFACE_TEST_SERVERS", "").split(","):
+        pytest.skip("set RESTFACE_TEST_SERVERS=redis to run")
+    _face = RESTface("redis", storage_options={"batch_size": 10})
+    yield _face
+    _face.reset()
+
+
+def test_redis_round_trips(redis):
+    storage = redis.storage
+    storage.upsert("users", {})
+    storage.db.round_trips = 0
+    storage.bulk_upsert("users", [{"age": i} for i in range(100)])
+    # INCRBY for the ids, then a single pipeline for every item
+    assert storage.db.round_trips == 2
+    storage.db.round_trips = 0
+    meta_params = {"order_by": [], "desc": False, "_limit": 0, "_offset": 0}
+    items = list(storage.iter_without_id("users", [["=", "age", 5]], meta_params))
+    assert [item["age"] for item in items] == [5]
+    # SSCAN pages and a pipeline per batch of 10, not a HGETALL per item
+    assert storage.db.round_trips < 50
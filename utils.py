@@ -1,41 +1,81 @@
+import binascii
 import csv
 import re
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from collections.abc import AsyncIterator, Iterable, Iterator
+from functools import cache, lru_cache
 from io import StringIO
-from json import loads
-from uuid import UUID
+from itertools import chain, islice
+from json import dumps, loads
+from xml.sax.saxutils import escape
 
+import anyio.from_thread
 import yaml
-from fastapi import Response, Request
+from fastapi import Request
+from fastapi.responses import StreamingResponse
 from inflect import engine as get_engine
 
 
 def get_storage(
-    storage_type: str = "memory", storage_path: str | None = None, uuid_id: bool = False
+    storage_type: str = "memory",
+    storage_path: str | None = None,
+    uuid_id: bool = False,
+    **options,
 ):
     if storage_type == "memory":
         from storage.MemoryStorage import MemoryStorage
 
-        return MemoryStorage(uuid_id)
+        return MemoryStorage(uuid_id, storage_path, **options)
+    elif storage_type == "columnar":
+        from storage.ColumnarStorage import ColumnarStorage
+
+        return ColumnarStorage(uuid_id, **options)
     elif storage_type == "db":
         from storage.DbStorage import DbStorage
 
-        return DbStorage(storage_path, uuid_id)
+        return DbStorage(storage_path, uuid_id, **options)
     elif storage_type == "file":
         from storage.FileStorage import FileStorage
 
-        return FileStorage(storage_path, uuid_id)
+        return FileStorage(storage_path, uuid_id, **options)
     elif storage_type == "mongo":
         from storage.MongoStorage import MongoStorage
 
-        return MongoStorage(storage_path, uuid_id)
+        return MongoStorage(storage_path, uuid_id, **options)
     elif storage_type == "redis":
         from storage.RedisStorage import RedisStorage
 
-        return RedisStorage(storage_path, uuid_id)
+        return RedisStorage(storage_path, uuid_id, **options)
     else:
         raise Exception("Unknown storage type")
 
 
+def get_async_storage(
+    storage_type: str = "memory",
+    storage_path: str | None = None,
+    uuid_id: bool = False,
+    max_workers: int = 4,
+    **options,
+):
+    if storage_type == "mongo":
+        from storage.AsyncMongoStorage import AsyncMongoStorage
+
+        return AsyncMongoStorage(storage_path, uuid_id, **options)
+    elif storage_type == "redis":
+        from storage.AsyncRedisStorage import AsyncRedisStorage
+
+        return AsyncRedisStorage(storage_path, uuid_id, **options)
+
+    from storage.ThreadedStorage import ThreadedStorage
+
+    storage = get_storage(storage_type, storage_path, uuid_id, **options)
+    # Memory and TinyDB aren't thread-safe and SQLite allows a single writer
+    # (an in-memory database even lives in a single connection)
+    if storage_type != "db" or storage.db.is_sqlite:
+        max_workers = 1
+    return ThreadedStorage(storage, max_workers)
+
+
 def parse_param(obj):
     try:
         return loads(obj)
@@ -43,38 +83,157 @@ def parse_param(obj):
         return obj
 
 
+def normalize_query(query: str) -> str:
+    # Order of params doesn't matter, except that the first of repeated ones wins
+    return "&".join(sorted(query.split("&"), key=lambda param: param.split("=")[0]))
+
+
+def encode_cursor(values: list) -> str:
+    return urlsafe_b64encode(dumps(values, separators=(",", ":")).encode()).decode()
+
+
+def decode_cursor(cursor: str) -> list:
+    try:
+        return loads(urlsafe_b64decode(cursor.encode()))
+    except binascii.Error as e:
+        raise ValueError("Invalid cursor") from e
+
+
+hex_id = re.compile(r"[0-9a-fA-F]{32}")
+
+
 def parse_id(element: str):
-    if element.isdigit():
+    # Accepts the same UUID spellings as uuid.UUID, without raising on the
+    # path parts that aren't ids
+    if element.isascii() and element.isdigit():
         return int(element)
-    try:
-        UUID(element)
-        return element
-    except (ValueError, AttributeError):
+    hex_digits = element.replace("urn:", "").replace("uuid:", "")
+    hex_digits = hex_digits.strip("{}").replace("-", "")
+    return element if hex_id.fullmatch(hex_digits) else None
+
+
+def parse_ids(element: str) -> list | None:
+    # Comma separated ids of a batch read, e.g. /users/1,5,9
+    if "," not in element:
+        return None
+    item_ids = [parse_id(part) for part in element.split(",") if part]
+    if not item_ids or not all(item_ids):
         return None
+    return list(dict.fromkeys(item_ids))
+
+
+def to_json_stream(items: Iterable[dict]) -> Iterator[str]:
+    yield "["
+    for i, item in enumerate(items):
+        yield ("," if i else "") + dumps(item, default=str)
+    yield "]"
+
 
+def to_ndjson_stream(items: Iterable[dict]) -> Iterator[str]:
+    for item in items:
+        yield dumps(item, default=str) + "\n"
 
-def to_yaml(obj):
-    return yaml.dump(obj)
+
+def all_to_json_stream(collections) -> Iterator[str]:
+    yield "{"
+    for i, (collection_name, items) in enumerate(collections):
+        yield ("," if i else "") + dumps(collection_name) + ":"
+        yield from to_json_stream(items)
+    yield "}"
+
+
+def all_to_ndjson_stream(collections) -> Iterator[str]:
+    for collection_name, items in collections:
+        for item in items:
+            yield dumps({"collection": collection_name, "item": item}, default=str)
+            yield "\n"
+
+
+def chunked(parts: Iterable[str], chunk_size: int = 65536) -> Iterator[str]:
+    # Joins small parts, so the response isn't written item by item
+    chunk: list[str] = []
+    size = 0
+    for part in parts:
+        chunk.append(part)
+        size += len(part)
+        if size >= chunk_size:
+            yield "".join(chunk)
+            chunk, size = [], 0
+    if chunk:
+        yield "".join(chunk)
+
+
+async def take(items: AsyncIterator, count: int) -> list:
+    batch: list = []
+    async for item in items:
+        batch.append(item)
+        if len(batch) == count:
+            break
+    return batch
+
+
+def from_async(items: AsyncIterator, batch_size: int = 1000) -> Iterator:
+    # Blocking view of an async iterator for the encoders above, only usable
+    # from Starlette's threadpool (StreamingResponse iterates sync iterators
+    # there), each batch is awaited back on the event loop
+    while batch := anyio.from_thread.run(take, items, batch_size):
+        yield from batch
+
+
+def all_from_async(collections: AsyncIterator) -> Iterator[tuple[str, Iterator]]:
+    for collection_name, items in from_async(collections, 1):
+        yield collection_name, from_async(items)
+
+
+@cache
+def get_inflect_engine():
+    return get_engine()
+
+
+@lru_cache(maxsize=1024)
+def singular(name: str) -> str:
+    # Collection names repeat on every request and inflect is slow,
+    # names that are already singular are kept as they are
+    return get_inflect_engine().singular_noun(name) or name
+
+
+def to_yaml_stream(obj) -> Iterator[str]:
+    if isinstance(obj, dict):
+        yield yaml.dump(obj)
+        return
+    empty = True
+    for item in obj:
+        empty = False
+        yield yaml.dump([item])
+    if empty:
+        yield yaml.dump([])
+
+
+def xml_tag(name) -> str:
+    tag = re.sub(r"[^\w.-]", "_", str(name))
+    return tag if re.match(r"[^\W\d]", tag) else f"_{tag}"
 
 
 def _to_xml(obj, tag: str) -> str:
     if isinstance(obj, dict):
-        items = "".join(_to_xml(v, k) for k, v in obj.items())
+        items = "".join(_to_xml(v, xml_tag(k)) for k, v in obj.items())
         return f"<{tag}>{items}</{tag}>"
     elif isinstance(obj, list):
         return "".join(_to_xml(item, tag) for item in obj)
     else:
-        return f"<{tag}>{obj}</{tag}>"
+        return f"<{tag}>{escape(str(obj))}</{tag}>"
 
 
-def to_xml(obj, collection_name: str) -> str:
-    engine = get_engine()
-    item_name = engine.singular_noun(collection_name) or collection_name
-    if isinstance(obj, list):
-        items = "".join(_to_xml(item, item_name) for item in obj)
-        return f"<{collection_name}>{items}</{collection_name}>"
-    elif isinstance(obj, dict):
-        return _to_xml(obj, item_name)
+def to_xml_stream(obj, collection_name: str) -> Iterator[str]:
+    item_name = xml_tag(singular(collection_name))
+    if isinstance(obj, dict):
+        yield _to_xml(obj, item_name)
+    elif isinstance(obj, Iterable):
+        collection_tag = xml_tag(collection_name)
+        yield f"<{collection_tag}>"
+        for item in obj:
+            yield _to_xml(item, item_name)
+        yield f"</{collection_tag}>"
     else:
         raise Exception("Cannot format to XML")
 
@@ -88,15 +247,44 @@ def flatten_dict(d, parent_key=""):
             yield new_key, v
 
 
-def to_csv(obj) -> str:
+def to_csv_stream(
+    obj, fields: list[str] | None = None, sample_size: int = 100
+) -> Iterator[str]:
     objects = [obj] if isinstance(obj, dict) else obj
-    objects = [dict(flatten_dict(obj)) for obj in objects]
-    keys = sorted(set(key for obj in objects for key in obj.keys()))
+    rows = (dict(flatten_dict(obj)) for obj in objects)
+    if not fields:
+        # Header from a sample instead of a first pass over every object,
+        # keys appearing only later on need an explicit ?fields=
+        sample = list(islice(rows, sample_size))
+        fields = sorted({key for row in sample for key in row})
+        rows = chain(sample, rows)
     with StringIO() as tmp_file:
         writer = csv.writer(tmp_file)
-        writer.writerow(keys)
-        writer.writerows((obj.get(key) for key in keys) for obj in objects)
-        return tmp_file.getvalue()
+        writer.writerow(fields)
+        for row in rows:
+            writer.writerow(row.get(key) for key in fields)
+            yield tmp_file.getvalue()
+            tmp_file.seek(0)
+            tmp_file.truncate()
+        yield tmp_file.getvalue()
+
+
+def read_csv_batches(
+    lines: Iterable[str], batch_size: int = 1000, infer_types: bool = False
+) -> Iterator[list[dict]]:
+    # Quoted fields may contain commas and newlines, so lines aren't split by hand
+    rows = csv.DictReader(lines)
+    while batch := list(islice(rows, batch_size)):
+        for row in batch:
+            # Values of rows longer than the header
+            row.pop(None, None)  # type: ignore[call-overload]
+            if infer_types:
+                for key, value in row.items():
+                    if value:
+                        row[key] = parse_param(value)
+            if isinstance(row.get("id"), str):
+                row["id"] = parse_id(row["id"])
+        yield batch
 
 
 def get_collection_name(path):
@@ -114,14 +302,19 @@ def reformat(request: Request, result):
     collection_name = get_collection_name(request.url.path)
     response_format = request.query_params.get("format")
     if response_format == "csv":
-        return Response(
-            to_csv(result),
+        fields = request.query_params.get("fields")
+        return StreamingResponse(
+            chunked(to_csv_stream(result, fields.split(",") if fields else None)),
             media_type="text/csv",
             headers={"Content-Disposition": f"filename={collection_name}.csv"},
         )
     elif response_format == "xml":
-        return Response(to_xml(result, collection_name), media_type="text/xml")
+        return StreamingResponse(
+            chunked(to_xml_stream(result, collection_name)), media_type="text/xml"
+        )
     elif response_format == "yaml":
-        return Response(to_yaml(result), media_type="text/yaml")
+        return StreamingResponse(
+            chunked(to_yaml_stream(result)), media_type="text/yaml"
+        )
     else:
-        return result
+        return result if isinstance(result, dict) else list(result)